@@ -352,21 +352,21 @@ def fetch_last_n_blocks(client: JsonRpcClient, n: int, genesis_hash: str) -> Lis
     :param genesis_hash: Hash of the genesis block
     :return: List of block dictionaries with recalculated hashes
     """
-    blocks = []
-    
     # Get the latest block
     latest_block = client.call("eth_getBlockByNumber", ["latest", True])['result']
-    blocks.append(latest_block)
-    
-    current_hash = latest_block['parentHash']
-    
-    # Fetch the remaining N-1 blocks
-    for _ in range(n - 1):
-        block = client.call("eth_getBlockByHash", [current_hash, True])['result']
-        if block is None:
+    latest_number = int(latest_block['number'], 16)
+
+    # Fetch the remaining N-1 blocks by number in batches instead of walking parent hashes one call at a time
+    numbers = range(latest_number - 1, max(latest_number - n, -1), -1)
+    responses = client.call_batch([("eth_getBlockByNumber", [hex(number), True]) for number in numbers])
+
+    blocks = [latest_block]
+    for response in responses:
+        block = response.get('result')
+        # Stop at the first gap and make sure the blocks still form a chain
+        if block is None or block['hash'] != blocks[-1]['parentHash']:
             break
         blocks.append(block)
-        current_hash = block['parentHash']
     
     # Reverse the list so that the oldest block comes first
     blocks = list(reversed(blocks))
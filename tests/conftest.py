@@ -1,7 +1,15 @@
 from loguru import logger
 import os, sys
 from dotenv import load_dotenv
+from utils.account_pool import AccountPool
+from utils.cassette import DEFAULT_CASSETTE_PATH, CassetteTransport
+from utils.chain_artifacts import ChainArtifacts
 from utils.json_rpc_client import JsonRpcClient
+from utils.nonce_manager import TransactionSender
+from utils.receipt_waiter import ReceiptWaiter
+from utils.rpc_codec import get_codec
+from utils.rpc_metrics import RpcMetrics
+from utils.worker_coordination import SharedNonceManager, run_once, worker_id
 from eth_account import Account
 from web3 import Web3
 import time
@@ -12,70 +20,58 @@ import secrets
 from utils.slack_report import send_to_slack
 import json
 from pathlib import Path
+from typing import Iterator
 
 def create_transaction_if_not_exist(client, ensure_transaction):
-    latest_block_params = ["latest", True]
-    block_response = client.call("eth_getBlockByNumber", latest_block_params)
-    
-    block_data = None
-    if 'result' in block_response and block_response['result'] is not None:
-        block_data = block_response['result']
-    elif 'error' in block_response:
-        logger.error(f"Error calling eth_getBlockByNumber('{latest_block_params}'): {block_response['error']}")
-        # Depending on desired behavior, you might want to raise an exception here
-        # or attempt to create a transaction anyway if that's the fallback.
-        # For now, let's assume if we can't get the latest block, we should try to create a transaction.
-        pass # Will proceed to create a transaction
-    else:
-        logger.error(f"Unexpected response from eth_getBlockByNumber('{latest_block_params}'): {block_response}")
-        # Similar to above, decide on behavior. For now, proceeding.
-        pass # Will proceed to create a transaction
-
-    if block_data is None or len(block_data.get('transactions', [])) == 0:
-        logger.info("No transactions in the latest block or failed to fetch block, ensuring a transaction exists.")
-        tx_block_hash = ensure_transaction() # This returns a block hash
-        # We need to fetch the block that contains this transaction
-        # The transaction hash itself isn't directly returned by ensure_transaction in its current form
-        # ensure_transaction returns the blockHash where the transaction was included.
-        block_by_hash_params = [tx_block_hash, True]
-        block_response = client.call("eth_getBlockByHash", block_by_hash_params)
-        
-        retries = 5
-        for i in range(retries):
-            if 'result' in block_response and block_response['result'] is not None and len(block_response['result'].get('transactions', [])) > 0:
-                return block_response['result']
-            elif 'error' in block_response:
-                logger.warning(f"Error calling eth_getBlockByHash for {tx_block_hash} (attempt {i+1}/{retries}): {block_response['error']}. Retrying...")
-            else:
-                logger.warning(f"Unexpected response or no transactions in block {tx_block_hash} (attempt {i+1}/{retries}): {block_response}. Retrying...")
-            time.sleep(5) # Wait before retrying
-            block_response = client.call("eth_getBlockByHash", block_by_hash_params)
-        
-        logger.error(f"Failed to get block with transactions using hash {tx_block_hash} after {retries} retries. Last response: {block_response}")
-        # If it still fails, we might need to raise an error or return a specific failure indicator
-        raise RuntimeError(f"Failed to retrieve block with transactions for hash {tx_block_hash} after multiple attempts.")
-
-    # This part of the original logic seems to assume 'block' variable is the one with transactions.
-    # The logic has been updated above to directly return the block fetched by hash.
-    # The while loop below is likely redundant if the above retry logic for getBlockByHash works correctly.
-    # However, I will keep a similar loop structure for safety, operating on the last `block_response`
-    # from the successful `eth_getBlockByNumber` if it had transactions, or from `eth_getBlockByHash`.
-
-    # If we found transactions in the initial eth_getBlockByNumber call:
-    if block_data and len(block_data.get('transactions', [])) > 0:
-        return block_data
-    
-    # Fallback if initial block fetch failed but create_transaction succeeded
-    # and the subsequent getBlockByHash also failed to return a valid block (covered by raise above).
-    # This path should ideally not be reached if the above logic is sound.
-    logger.error("Fell through create_transaction_if_not_exist logic, this indicates an issue.")
-    raise RuntimeError("Could not obtain a block with transactions.")
+    """
+    Return the latest block if it has transactions, otherwise send one and return its block.
+
+    The block is a LazyBlock: only the header with transaction hashes is downloaded, so
+    block['transactions'][-1]['hash'] fetches a single transaction instead of the whole block.
+    """
+    block = None
+    try:
+        block = client.lazy_block("latest")
+    except ValueError as e:
+        # If we can't get the latest block, try to create a transaction anyway
+        logger.error(f"Failed to fetch the latest block: {e}")
+
+    if block is not None and len(block.transaction_hashes) > 0:
+        return block
+
+    logger.info("No transactions in the latest block or failed to fetch block, ensuring a transaction exists.")
+    # ensure_transaction returns the hash of the block the transaction was included in
+    tx_block_hash = ensure_transaction()
+
+    retries = 5
+    for i in range(retries):
+        try:
+            block = client.lazy_block(tx_block_hash)
+        except ValueError as e:
+            logger.warning(f"Error fetching block {tx_block_hash} (attempt {i+1}/{retries}): {e}. Retrying...")
+        else:
+            if block is not None and len(block.transaction_hashes) > 0:
+                return block
+            logger.warning(f"Block {tx_block_hash} not found or has no transactions (attempt {i+1}/{retries}). Retrying...")
+        time.sleep(5) # Wait before retrying
+
+    logger.error(f"Failed to get block with transactions using hash {tx_block_hash} after {retries} retries. Last block: {block}")
+    raise RuntimeError(f"Failed to retrieve block with transactions for hash {tx_block_hash} after multiple attempts.")
 
 def pytest_addoption(parser):
     parser.addoption("--env", action="store", default="general",
         help="Environment to run tests against")
+    parser.addoption("--rpc-record", action="store", nargs="?", const=DEFAULT_CASSETTE_PATH, default=None,
+        help=f"Record every JSON-RPC exchange of the client fixture to a cassette (default {DEFAULT_CASSETTE_PATH}), "
+             "one per xdist worker with -n")
+    parser.addoption("--rpc-replay", action="store", nargs="?", const=DEFAULT_CASSETTE_PATH, default=None,
+        help="Answer the client fixture from a recorded cassette (and the cassettes of xdist workers next to it) "
+             "instead of a node, without time.sleep waits")
 
 def pytest_unconfigure(config):
+    if worker_id() is not None:
+        # with pytest-xdist the controller reports the whole run once
+        return
     try:
         ini_config = config.configuration 
         if bool(int(ini_config.get("send_slack_webhook"))):
@@ -90,12 +86,31 @@ def pytest_unconfigure(config):
     except AttributeError:
         print("Make sure to use configuration fixture")
 
-@pytest.fixture(scope="session")
-def configuration(request):
-    env = request.config.getoption("--env")
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # xdist controller: the fixtures ran in the workers, collect what they left for the end of the run
+    output = getattr(node, "workeroutput", {})
+    if "env_name" in output and not hasattr(node.config, "configuration"):
+        # a worker used the configuration fixture, so pytest_unconfigure reports the run
+        node.config.configuration = read_configuration(output["env_name"])
+        node.config.env_name = output["env_name"]
+    state = output.get("rpc_metrics")
+    if state is not None:
+        if not hasattr(node.config, "rpc_metrics"):
+            node.config.rpc_metrics = RpcMetrics()
+        node.config.rpc_metrics.merge_state(state)
+
+def pytest_sessionfinish(session):
+    metrics = getattr(session.config, "rpc_metrics", None)
+    if metrics is not None:
+        # Latency profile of all xdist workers together
+        configuration = getattr(session.config, "configuration", {})
+        metrics.write(configuration.get("rpc_metrics_path", "reports/rpc_metrics"))
+
+def read_configuration(env):
+    """Section `env` of pytest.ini on top of [general], with overrides from the environment and .env"""
     cfg = configparser.ConfigParser()
     cfg.read("pytest.ini")
-    logger.info(f"Environment: {env}")
     if env not in cfg:
         # workaround for running tests inside docker
         cfg.read("../pytest.ini")
@@ -113,23 +128,52 @@ def configuration(request):
                 cfg[env][str(k).lower().replace(f"{env}_", "")] = v
             if str(k).lower() == str(key).lower():
                 cfg[env][str(k).lower()] = v
+    cfg[env]["env_name"] = env
+    return cfg[env]
+
+@pytest.fixture(scope="session")
+def configuration(request):
+    env = request.config.getoption("--env")
+    logger.info(f"Environment: {env}")
+    configuration = read_configuration(env)
     # manky patching to pass config to teardown step
-    request.config.configuration = cfg[env]
+    request.config.configuration = configuration
     request.config.env_name = env
-    cfg[env]["env_name"] = env
-    cfg[env].context = {}
+    if worker_id() is not None:
+        request.config.workeroutput["env_name"] = env
+    configuration.context = {}
     logger.remove()
     # Use enqueue=False to prevent buffering but remove flush parameter
-    logger.add(sys.stdout, level=cfg[env]['log_stdout_level'], enqueue=False)
-    logger.add(f"reports/{cfg[env]['log_file_name']}.log", level=cfg[env]['log_file_level'], enqueue=False)
+    logger.add(sys.stdout, level=configuration['log_stdout_level'], enqueue=False)
+    logger.add(f"reports/{configuration['log_file_name']}.log", level=configuration['log_file_level'], enqueue=False)
     logger.debug("Updated configuration ...")
-    logger.debug(f"Base URL: {cfg[env]['base_url']}")
-    return cfg[env]
+    logger.debug(f"Base URL: {configuration['base_url']}")
+    return configuration
 
 @pytest.fixture(scope="session")
-def client(configuration) -> JsonRpcClient:
-    cl = JsonRpcClient(configuration["base_url"])
-    return cl
+def client(configuration, request) -> Iterator[JsonRpcClient]:
+    record_path = request.config.getoption("--rpc-record")
+    replay_path = request.config.getoption("--rpc-replay")
+    with pytest.MonkeyPatch.context() as patch:
+        if replay_path:
+            cassette = CassetteTransport(replay_path, "replay", codec=get_codec(configuration.get("rpc_codec", "auto")))
+            cl = JsonRpcClient.from_config(configuration, transport=cassette)
+            # Recorded receipts and blocks are already there, waiting for them only slows the replay down
+            patch.setattr(time, "sleep", lambda seconds: None)
+        else:
+            cl = JsonRpcClient.from_config(configuration)
+            if record_path:
+                cl.transport = CassetteTransport(record_path, "record", cl.transport)
+        yield cl
+    cl.close()
+    if cl.metrics is None:
+        return
+    if worker_id() is not None:
+        # handed to the xdist controller, which writes one profile for all workers
+        request.config.workeroutput["rpc_metrics"] = cl.metrics.state()
+        return
+    # Latency profile of the run per method and namespace (JSON and Prometheus text format)
+    cl.metrics.write(configuration.get("rpc_metrics_path", "reports/rpc_metrics"))
 
 @pytest.fixture(scope="session")
 def generate_ethereum_account():
@@ -152,103 +196,83 @@ def generate_ethereum_account():
 
 
 @pytest.fixture(scope="session")
-def create_transaction(client: JsonRpcClient, configuration):
-    def _create_transaction():
-        web3_client: Web3 = client.web3 # type: ignore
-        # Use the first account from the node as the funding account
-        funding_account_address = configuration["public_key"]
-        funding_balance = web3_client.eth.get_balance(funding_account_address)
-
-        if funding_balance == 0:
-            raise ValueError(f"Funding account {funding_account_address} has no balance. Please ensure there's an account with funds.")
-
-        # Generate a random private key for the transaction account
-        private_key = "0x" + secrets.token_hex(32)
-        account = Account.from_key(private_key)
-
-        # Create a funding transaction
-        funding_tx = {
-            'to': account.address,
-            'value': web3_client.to_wei(0.001, 'ether'),
-            'gas': 21000,
-            'gasPrice': web3_client.eth.gas_price,
-            # Nonce will be set in the retry loop
-            # 'nonce': web3_client.eth.get_transaction_count(funding_account_address),
-            'chainId': web3_client.eth.chain_id,
-        }
+def worker_state_dir(tmp_path_factory):
+    """Directory shared by the pytest-xdist workers of this run, None when running in a single process"""
+    if worker_id() is None:
+        return None
+    # basetemp of a worker is <run temp dir>/popen-gwN, the run temp dir is the same for all workers
+    return tmp_path_factory.getbasetemp().parent
 
-        # Sign the funding transaction (you'll need the private key of the funding account)
-        funding_account_private_key = configuration["private_key"]  # Replace with actual private key
-        # signed_funding_tx = Account.sign_transaction(funding_tx, funding_account_private_key)
 
-        # Send the signed funding transaction
-        # funding_tx_hash = web3_client.eth.send_raw_transaction(signed_funding_tx.raw_transaction)
-        
-        # Attempt to send the funding transaction with retries on nonce issues
-        max_attempts = 7
-        attempt = 0
-        funding_tx_hash = None
-        last_exception = None
-        while attempt < max_attempts:
+@pytest.fixture(scope="session")
+def transaction_sender(client: JsonRpcClient, configuration, worker_state_dir) -> TransactionSender:
+    # Every transaction of the main account goes through this sender, so its nonces are tracked locally,
+    # shared with the other xdist workers through a locked file when running in parallel
+    nonce_manager = None
+    if worker_state_dir is not None:
+        nonce_manager = SharedNonceManager(client, configuration["public_key"], worker_state_dir)
+    return TransactionSender(client, configuration["private_key"], nonce_manager)
+
+
+@pytest.fixture(scope="session")
+def account_pool(client: JsonRpcClient, configuration, transaction_sender, receipt_waiter) -> Iterator[AccountPool]:
+    web3_client: Web3 = client.web3
+    funding_account_address = configuration["public_key"]
+    if web3_client.eth.get_balance(funding_account_address) == 0:
+        raise ValueError(f"Funding account {funding_account_address} has no balance. Please ensure there's an account with funds.")
+    # Funded once in one batch, the accounts are reused by every test that needs a sender
+    pool = AccountPool.from_config(client, transaction_sender, receipt_waiter, configuration).fill()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope="session")
+def create_transaction(client: JsonRpcClient, account_pool):
+    def _create_transaction():
+        web3_client: Web3 = client.web3 # type: ignore
+        with account_pool.account() as account:
             try:
-                current_nonce = web3_client.eth.get_transaction_count(funding_account_address)
-                funding_tx['nonce'] = current_nonce # Ensure nonce is fresh for this attempt
-                signed_funding_tx = Account.sign_transaction(funding_tx, funding_account_private_key)
-                logger.info(f"Attempt {attempt + 1} of {max_attempts} to send funding TX with nonce {current_nonce} from {funding_account_address} to {account.address}")
-                funding_tx_hash = web3_client.eth.send_raw_transaction(signed_funding_tx.raw_transaction)
-                logger.info(f"Funding TX sent, hash: {funding_tx_hash.hex()}")
-                break # Success
-            except Exception as e: # Broad exception to catch web3 errors
-                last_exception = e
-                logger.warning(f"Funding TX attempt {attempt + 1} failed: {e}")
-                if "ReplacementNotAllowed" in str(e) or "nonce too low" in str(e).lower() or "known transaction" in str(e).lower() or "alreadyknown" in str(e).lower() or "pruned history unavailable" in str(e).lower():
-                    time.sleep(3)
-                    attempt += 1
-                else:
-                    raise e # Re-raise if it's not a known nonce issue
-        
-        if funding_tx_hash is None:
-            logger.error(f"Failed to send funding transaction after {max_attempts} attempts. Last error: {last_exception}")
-            if last_exception is not None: # Ensure last_exception is not None before raising
-                raise last_exception # Re-raise the last exception if all attempts failed
-            else: # Fallback if last_exception was somehow not set (shouldn't happen)
-                raise RuntimeError("Failed to send funding transaction after multiple attempts, unknown error.")
-
-        web3_client.eth.wait_for_transaction_receipt(funding_tx_hash, timeout=int(configuration["transaction_timeout"]))
-
-        # Create the main transaction
-        transaction = {
-            'to': Web3.to_checksum_address('0x742d35Cc6634C0532925a3b844Bc454e4438f44e'),  # Example address
-            'value': web3_client.to_wei(0.00001, 'ether'),
-            'gas': 21000,
-            'gasPrice': web3_client.eth.gas_price,
-            'nonce': web3_client.eth.get_transaction_count(account.address),
-            'chainId': web3_client.eth.chain_id,
-        }
-        # Sign the main transaction
-        signed_txn = account.sign_transaction(transaction)
-        # Send the pre-signed transaction
-        tr = client.call("eth_sendRawTransaction", [signed_txn.raw_transaction.hex()])
-        if 'result' not in tr:
-            logger.error(f"Failed to send transaction from {account.address} to 0x742d35Cc6634C0532925a3b844Bc454e4438f44e. Balance: {web3_client.eth.get_balance(account.address)}")
-            raise ValueError(f"Transaction failed: {tr['error']}")
-        tx_hash = tr['result']
-        # tx_hash = web3_client.eth.send_raw_transaction(signed_txn.raw_transaction)
+                tx_hash = account.send({
+                    'to': Web3.to_checksum_address('0x742d35Cc6634C0532925a3b844Bc454e4438f44e'),  # Example address
+                    'value': web3_client.to_wei(0.00001, 'ether'),
+                })
+            except ValueError:
+                logger.error(f"Failed to send transaction from {account.address} to 0x742d35Cc6634C0532925a3b844Bc454e4438f44e. Balance: {web3_client.eth.get_balance(account.address)}")
+                raise
         logger.info(f"Transaction hash: {tx_hash}")
         return tx_hash
 
     return _create_transaction
 
 @pytest.fixture(scope="session")
-def ensure_transaction(client: JsonRpcClient, configuration, create_transaction):
+def receipt_waiter(client: JsonRpcClient, configuration, request) -> Iterator[ReceiptWaiter]:
+    # One waiter checks the receipts of all pending transactions in one batch per block
+    waiter = ReceiptWaiter(client, timeout=int(configuration["transaction_timeout"]))
+    if request.config.getoption("--rpc-replay"):
+        # the replayed blocks don't take a block time to arrive
+        waiter.min_interval = waiter.max_interval = 0
+    yield waiter
+    waiter.close()
+
+@pytest.fixture(scope="session")
+def chain_artifacts(request, client: JsonRpcClient, receipt_waiter, worker_state_dir) -> ChainArtifacts:
+    # Sent once per session: namespace tests read these transactions instead of sending their own
+    def _prepare():
+        return ChainArtifacts.prepare(client, request.getfixturevalue("account_pool"), receipt_waiter)
+
+    if worker_state_dir is None:
+        return _prepare()
+    # prepared by the first xdist worker that needs them, the other workers read them back
+    data = run_once(worker_state_dir / "chain_artifacts.json", lambda: _prepare().to_dict())
+    return ChainArtifacts.from_dict(client, data)
+
+@pytest.fixture(scope="session")
+def ensure_transaction(client: JsonRpcClient, configuration, create_transaction, receipt_waiter):
     def _ensure_transaction():
         tx_hash = create_transaction()
-        receipt = client.call("eth_getTransactionReceipt", [tx_hash])
+        receipt = receipt_waiter.wait(tx_hash)
         logger.info(f"Transaction receipt: {receipt}")
-        while receipt['result'] is None:
-            time.sleep(5)
-            receipt = client.call("eth_getTransactionReceipt", [tx_hash])
-        return receipt['result']['blockHash']
+        return receipt['blockHash']
 
     return _ensure_transaction
 
@@ -261,7 +285,10 @@ def run_with_network(request, configuration):
         pytest.skip(f"Skipping test for {configuration['env_name']} network. The test is designed to run only for {marker.kwargs['network']} networks")
 
 @pytest.fixture(scope="session")
-def deploy_contract(client: JsonRpcClient, configuration):
+def deploy_contract(client: JsonRpcClient, configuration, receipt_waiter, transaction_sender):
+    # deployments used to be polled 30 times every 2 s
+    receipt_timeout = 60
+
     def _deploy_contract(binary_path: str):
         # Read contract binary
         contract_path = Path(binary_path)
@@ -274,62 +301,25 @@ def deploy_contract(client: JsonRpcClient, configuration):
         if not contract_bin.startswith('0x'):
             contract_bin = '0x' + contract_bin
 
-        # Prepare deployment transaction
-        web3_client = client.web3
-        deployer_address = configuration["public_key"]
-        
-        deploy_tx = {
-            'from': deployer_address,
-            'data': contract_bin,
-            'gas': 2000000,  # Adjust gas limit as needed
-            'gasPrice': web3_client.eth.gas_price,
-            'nonce': web3_client.eth.get_transaction_count(deployer_address),
-            'chainId': web3_client.eth.chain_id,
-        }
+        # Sign and send deployment transaction, nonce, gas price and chain id are filled in by the sender
+        try:
+            tx_hash = transaction_sender.send({
+                'data': contract_bin,
+                'gas': 2000000,  # Adjust gas limit as needed
+            })
+        except ValueError as e:
+            logger.error(f"Failed to send contract deployment transaction. Error: {e}")
+            raise ValueError(f"Failed to send contract deployment transaction: {e}")
+        logger.info(f"Contract deployment transaction sent: {tx_hash}")
 
-        # Sign and send deployment transaction
-        signed_tx = Account.sign_transaction(
-            deploy_tx,
-            configuration["private_key"]
-        )
-        
-        send_tx_response = client.call(
-            "eth_sendRawTransaction",
-            [signed_tx.raw_transaction.hex()]
-        )
-        
-        if 'result' in send_tx_response:
-            tx_hash = send_tx_response['result']
-            logger.info(f"Contract deployment transaction sent: {tx_hash}")
-        elif 'error' in send_tx_response:
-            logger.error(f"Failed to send contract deployment transaction. Error: {send_tx_response['error']}")
-            raise ValueError(f"Failed to send contract deployment transaction: {send_tx_response['error']}")
-        else:
-            logger.error(f"Unexpected response when sending contract deployment transaction: {send_tx_response}")
-            raise ValueError(f"Unexpected response when sending contract deployment transaction: {send_tx_response}")
-        
         # Wait for deployment to complete
-        receipt_polling_attempts = 30
-        last_receipt_response = None
-        actual_receipt_data = None
-
-        for attempt in range(receipt_polling_attempts):
-            logger.info(f"Polling for transaction receipt {tx_hash}, attempt {attempt + 1}/{receipt_polling_attempts}")
-            last_receipt_response = client.call("eth_getTransactionReceipt", [tx_hash])
-            if last_receipt_response.get('result') is not None:
-                actual_receipt_data = last_receipt_response['result']
-                logger.info(f"Transaction receipt found for {tx_hash}: {actual_receipt_data}")
-                break
-            elif last_receipt_response.get('error'):
-                logger.warning(f"Error polling for receipt for tx {tx_hash} (attempt {attempt + 1}/{receipt_polling_attempts}): {last_receipt_response['error']}. Retrying...")
-            else:
-                 logger.warning(f"Unexpected response while polling for receipt for tx {tx_hash} (attempt {attempt + 1}/{receipt_polling_attempts}): {last_receipt_response}. Retrying...")
-            time.sleep(2)
-            
-        if actual_receipt_data is None:
-            logger.error(f"Contract deployment transaction {tx_hash} was not mined or receipt retrieval failed after {receipt_polling_attempts} attempts. Last response: {last_receipt_response}")
-            raise TimeoutError(f"Contract deployment transaction {tx_hash} was not mined or receipt retrieval failed. Last response: {last_receipt_response}")
-            
+        try:
+            actual_receipt_data = receipt_waiter.wait(tx_hash, timeout=receipt_timeout)
+        except TimeoutError:
+            logger.error(f"Contract deployment transaction {tx_hash} was not mined within {receipt_timeout} s")
+            raise
+        logger.info(f"Transaction receipt found for {tx_hash}: {actual_receipt_data}")
+
         contract_address = actual_receipt_data.get('contractAddress')
         if not contract_address:
             logger.error(f"'contractAddress' not found in receipt for transaction {tx_hash}. Receipt: {actual_receipt_data}")
@@ -12,6 +12,8 @@ import gevent
 import requests
 import pytest
 
+from utils.endpoint_pool import split_urls
+
 class BlockChainUser(HttpUser):
     wait_time = None
     block = None
@@ -45,7 +47,7 @@ def run_locust(configuration, client, number_of_users=100, spawn_rate=10, test_d
     # Set wait_time dynamically based on config
     BlockChainUser.wait_time = between(wait_start, wait_end)
     BlockChainUser.jrpc_client = client
-    BlockChainUser.host = configuration['base_url']
+    BlockChainUser.host = split_urls(configuration['base_url'])[0]
 
     # Create a Locust environment
     env = Environment(user_classes=[BlockChainUser])
@@ -1,13 +1,11 @@
 import pytest
 import time
-from eth_account import Account
 from web3 import Web3
 from loguru import logger
 from tests.conftest import create_transaction_if_not_exist, run_with_network
 from eth_abi import encode
 
 from web3 import Web3
-from eth_account import Account
 from eth_utils import to_hex
 from web3 import Web3, HTTPProvider
 
@@ -105,7 +103,7 @@ def test_gnosis_fee_collector(client, ensure_transaction, run_with_network, conf
 
 @pytest.mark.api
 @pytest.mark.run_with_network(network=[ "pectra-devnet", "chiado"])
-def test_gnosis_blob_fee_collector(client, ensure_transaction, run_with_network, configuration):
+def test_gnosis_blob_fee_collector(client, ensure_transaction, run_with_network, configuration, transaction_sender):
 
     web3 = Web3(Web3.HTTPProvider(configuration["base_url"]))
     fee_collector_address = "0x1559000000000000000000000000000000000000"
@@ -143,14 +141,10 @@ def test_gnosis_blob_fee_collector(client, ensure_transaction, run_with_network,
         "maxFeePerGas": client.web3.to_wei(1, 'gwei'),
         "maxPriorityFeePerGas": client.web3.to_wei(1, 'gwei'),
         "maxFeePerBlobGas": to_hex(client.web3.to_wei(1, 'gwei')),
-        "nonce": client.web3.eth.get_transaction_count(configuration["public_key"]),
     }
 
-    # Sign the transaction, including the blob data
-    signed = Account.sign_transaction(tx, configuration["private_key"], blobs=[BLOB_DATA])
-
-    # Send the signed transaction
-    tx_hash = client.web3.eth.send_raw_transaction(signed.raw_transaction)
+    # Sign (including the blob data) and send the transaction, the nonce comes from the shared sender
+    tx_hash = transaction_sender.send(tx, blobs=[BLOB_DATA])
 
     logger.info(f"Created transaction: {tx_hash}")
     
@@ -1,8 +1,8 @@
 import pytest
 from eth_account import Account
 from web3 import Web3
+from utils.chain_artifacts import CALL_DATA, LOG_TOPIC
 
-from tests.conftest import create_transaction_if_not_exist
 
 
 @pytest.mark.api
@@ -44,6 +44,18 @@ def test_eth_get_block_by_number(client):
     assert response['result']['parentBeaconBlockRoot'] is not None
 
 
+@pytest.mark.api
+def test_eth_batch_request(client):
+    block_number = int(client.call("eth_blockNumber")['result'], 16)
+    numbers = [hex(max(block_number - i, 0)) for i in range(5)]
+    responses = client.call_batch([("eth_getBlockByNumber", [number, False]) for number in numbers] + [("eth_chainId",)])
+    assert len(responses) == 6
+    for number, response in zip(numbers, responses):
+        assert response['jsonrpc'] == '2.0'
+        assert response['result']['number'] == number
+    assert int(responses[-1]['result'], 16) >= 0
+
+
 # Add more test cases as needed
 
 @pytest.mark.api
@@ -117,9 +129,9 @@ def test_eth_syncing_wrong_param(client):
 # Debug namespace tests
 @pytest.mark.api
 @pytest.mark.debug
-def test_debug_trace_transaction(client, ensure_transaction):
+def test_debug_trace_transaction(client, chain_artifacts):
     # First, get a transaction hash from a recent block
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
     # tx_hash = "0x4ddc9c98cedc6fd98eabd06f0dbf7ad02609c20acbc6789d1ea8a8800f096cec"
     response = client.call("debug_traceTransaction", [tx_hash])
     print(response)
@@ -177,8 +189,8 @@ def test_debug_trace_block_by_hash(client):
 
 @pytest.mark.api
 @pytest.mark.debug
-def test_debug_trace_block_by_hash_with_options(client, ensure_transaction):
-    block_hash = create_transaction_if_not_exist(client, ensure_transaction)['hash']
+def test_debug_trace_block_by_hash_with_options(client, chain_artifacts):
+    block_hash = chain_artifacts.transfer.block_hash
 
     # Define tracing options
     options = {
@@ -210,8 +222,8 @@ def test_debug_trace_block_by_hash_with_options(client, ensure_transaction):
 
 @pytest.mark.api
 @pytest.mark.debug
-def test_debug_trace_transaction_with_custom_tracer(client, ensure_transaction):
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+def test_debug_trace_transaction_with_custom_tracer(client, chain_artifacts):
+    tx_hash = chain_artifacts.transfer.tx_hash
 
     # Define a custom JavaScript tracer
     custom_tracer = """
@@ -294,3 +306,36 @@ def test_get_balance(client, configuration):
     # Assertions
     assert Web3.to_int(hexstr=balance_wei) >= 0, "Balance should be non-negative"
     assert isinstance(balance_eth, float), "Balance in ETH should be a float"
+
+@pytest.mark.api
+def test_eth_get_logs(client, chain_artifacts):
+    call = chain_artifacts.contract_call
+    response = client.call("eth_getLogs", [{
+        "fromBlock": hex(call.block_number),
+        "toBlock": hex(call.block_number),
+        "address": chain_artifacts.contract_address,
+    }])
+    assert 'result' in response
+    logs = response['result']
+    assert len(logs) == 1
+    assert logs[0]['transactionHash'] == call.tx_hash
+    assert logs[0]['topics'] == [Web3.to_hex(LOG_TOPIC)]
+    assert logs[0]['data'] == CALL_DATA
+
+@pytest.mark.api
+def test_eth_get_code_of_deployed_contract(client, chain_artifacts):
+    response = client.call("eth_getCode", [chain_artifacts.contract_address, "latest"])
+    assert 'result' in response
+    assert len(response['result']) > 2, "Deployed contract has no code"
+
+@pytest.mark.api
+def test_eth_get_blob_transaction(client, chain_artifacts):
+    if chain_artifacts.blob is None:
+        pytest.skip("The chain doesn't take blob transactions")
+    response = client.call("eth_getTransactionByHash", [chain_artifacts.blob.tx_hash])
+    assert 'result' in response
+    tx = response['result']
+    assert tx['type'] == '0x3'
+    assert len(tx['blobVersionedHashes']) == 1
+    assert tx['blockHash'] == chain_artifacts.blob.block_hash
+    assert 'blobGasUsed' in chain_artifacts.blob.receipt
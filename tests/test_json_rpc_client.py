@@ -0,0 +1,1296 @@
+import asyncio
+import gzip
+import json
+import multiprocessing
+import socketserver
+import sqlite3
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+import rlp
+from loguru import logger
+from web3 import Web3
+from websockets.sync.server import serve as ws_serve
+
+from utils.account_pool import AccountPool
+from utils.adaptive_concurrency import AimdController
+from utils.async_json_rpc_client import AsyncJsonRpcClient
+from utils.cassette import CassetteTransport
+from utils.chain_artifacts import CALL_DATA, LOG_TOPIC, ChainArtifacts, log_emitter_bytecode
+from utils.endpoint_pool import Endpoint
+from utils.json_rpc_client import JsonRpcClient, build_payload
+from utils.nonce_manager import TransactionSender
+from utils.priority_lanes import PriorityLanes, parse_lanes
+from utils.rate_limiter import RateLimiter, parse_method_rate_limits
+from utils.receipt_waiter import ReceiptWaiter
+from utils.rpc_cache import HeadScopedCache, ResponseCache
+from utils.rpc_logging import RpcLogger
+from utils.rpc_metrics import LatencyHistogram, RpcMetrics
+from utils.rpc_policy import CircuitBreaker, CircuitOpenError, MethodPolicy, RequestPolicy, parse_method_policies
+from utils.rpc_types import Block, Log
+from utils.transports import IpcTransport, JsonMessageSplitter
+from utils.worker_coordination import SharedNonceManager, run_once
+
+
+class RpcError(Exception):
+    """Raised by a StubNode handler to answer with a JSON-RPC error"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class StubNode:
+    """Minimal stand-in JSON-RPC node for testing the client without a real network"""
+
+    def __init__(self, handlers=None, reverse_batches=True, compress_responses=False):
+        # method -> callable(params) returning the result
+        self.handlers = handlers or {}
+        self.reverse_batches = reverse_batches
+        self.compress_responses = compress_responses
+        self.requests = []
+        self.request_encodings = []
+        # (status, headers) answered to the next requests instead of a JSON-RPC response
+        self.http_errors = []
+        self.connections = set()
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, don't let Nagle delay the body by an ACK round trip
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                node.connections.add(self.client_address)
+                data = self.rfile.read(int(self.headers["Content-Length"]))
+                node.request_encodings.append(self.headers.get("Content-Encoding"))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    data = gzip.decompress(data)
+                body = json.loads(data)
+                node.requests.append(body)
+                if node.http_errors:
+                    status, headers = node.http_errors.pop(0)
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if isinstance(body, list):
+                    response = [node.respond(request) for request in body]
+                    if node.reverse_batches:
+                        response.reverse()
+                else:
+                    response = node.respond(body)
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                if node.compress_responses and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    data = gzip.compress(data)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, request):
+        handler = self.handlers.get(request["method"])
+        if handler is None:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32601, "message": "Method not found"}}
+        try:
+            return {"jsonrpc": "2.0", "id": request["id"], "result": handler(request["params"])}
+        except RpcError as e:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": e.code, "message": e.message}}
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_node():
+    node = StubNode(handlers={
+        "eth_blockNumber": lambda params: "0x10",
+        "eth_getBlockByNumber": lambda params: {"number": params[0]},
+    })
+    yield node
+    node.stop()
+
+
+@pytest.mark.client
+def test_client_reuses_connections(stub_node):
+    with JsonRpcClient(stub_node.url) as client:
+        for _ in range(5):
+            assert client.call("eth_blockNumber")["result"] == "0x10"
+    assert len(stub_node.connections) == 1
+
+
+@pytest.mark.client
+def test_client_close_per_request_mode(stub_node):
+    with JsonRpcClient(stub_node.url, keep_alive=False) as client:
+        for _ in range(3):
+            client.call("eth_blockNumber")
+    assert len(stub_node.connections) == 3
+
+
+@pytest.mark.client
+def test_call_batch_maps_out_of_order_responses(stub_node):
+    with JsonRpcClient(stub_node.url) as client:
+        calls = [("eth_getBlockByNumber", [hex(number), False]) for number in range(7)]
+        calls.append(("eth_unknownMethod",))
+        responses = client.call_batch(calls, batch_size=3)
+
+    assert len(stub_node.requests) == 3
+    assert [len(batch) for batch in stub_node.requests] == [3, 3, 2]
+    assert [r["result"]["number"] for r in responses[:7]] == [hex(number) for number in range(7)]
+    assert responses[7]["error"]["code"] == -32601
+    ids = [request["id"] for batch in stub_node.requests for request in batch]
+    assert len(ids) == len(set(ids))
+
+
+@pytest.mark.client
+def test_call_batch_rejected_batch(stub_node):
+    with JsonRpcClient(stub_node.url) as client:
+        client._send = lambda payload: {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Batch size limit exceeded"}}
+        responses = client.call_batch([("eth_blockNumber",), ("eth_blockNumber",)])
+    assert [r["error"]["code"] for r in responses] == [-32600, -32600]
+
+
+@pytest.mark.client
+def test_async_client_bounds_concurrency(stub_node):
+    in_flight = {"current": 0, "max": 0}
+    lock = threading.Lock()
+
+    def slow_block_number(params):
+        with lock:
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        time.sleep(0.05)
+        with lock:
+            in_flight["current"] -= 1
+        return "0x10"
+
+    stub_node.handlers["eth_blockNumber"] = slow_block_number
+
+    async def run():
+        async with AsyncJsonRpcClient(stub_node.url, max_concurrency=4) as client:
+            responses = await client.call_many([("eth_blockNumber",)] * 20)
+            batch = await client.call_batch([("eth_getBlockByNumber", [hex(n), False]) for n in range(5)], batch_size=2)
+            return responses, batch
+
+    responses, batch = asyncio.run(run())
+    assert [r["result"] for r in responses] == ["0x10"] * 20
+    assert [r["result"]["number"] for r in batch] == [hex(n) for n in range(5)]
+    assert 1 < in_flight["max"] <= 4
+
+
+@pytest.mark.client
+def test_async_client_error_envelope():
+    async def run():
+        async with AsyncJsonRpcClient("http://127.0.0.1:9", timeout=2) as client:
+            return await client.call("eth_blockNumber", call_id=7)
+
+    response = asyncio.run(run())
+    assert response["id"] == 7
+    assert response["error"]["code"] == -32000
+
+
+class StubWebSocketNode:
+    """Stand-in WebSocket node: answers like StubNode and pushes notifications for eth_subscribe"""
+
+    def __init__(self, handlers=None, notifications=3):
+        self.http = StubNode(handlers)
+        self.notifications = notifications
+        node = self
+
+        def handler(websocket):
+            for message in websocket:
+                body = json.loads(message)
+                if isinstance(body, dict) and body["method"] == "eth_subscribe":
+                    websocket.send(json.dumps({"jsonrpc": "2.0", "id": body["id"], "result": "0xsub"}))
+                    for number in range(node.notifications):
+                        websocket.send(json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                                                   "params": {"subscription": "0xsub", "result": {"number": hex(number)}}}))
+                    continue
+                if isinstance(body, list):
+                    response = list(reversed([node.http.respond(request) for request in body]))
+                else:
+                    response = node.http.respond(body)
+                websocket.send(json.dumps(response))
+
+        self.server = ws_serve(handler, "127.0.0.1", 0)
+        self.url = f"ws://127.0.0.1:{self.server.socket.getsockname()[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.http.stop()
+
+
+@pytest.mark.client
+def test_websocket_multiplexing_and_subscription():
+    node = StubWebSocketNode({
+        "eth_blockNumber": lambda params: "0x10",
+        "eth_getBlockByNumber": lambda params: {"number": params[0]},
+        "eth_unsubscribe": lambda params: True,
+    })
+    try:
+        with JsonRpcClient(node.url, timeout=5) as client:
+            # Same call_id from several threads at once must still reach the right caller
+            results = []
+            threads = [threading.Thread(target=lambda n=n: results.append(
+                (n, client.call("eth_getBlockByNumber", [hex(n), False])["result"]["number"]))) for n in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sorted(results) == [(n, hex(n)) for n in range(10)]
+
+            batch = client.call_batch([("eth_getBlockByNumber", [hex(n), False]) for n in range(4)])
+            assert [r["result"]["number"] for r in batch] == [hex(n) for n in range(4)]
+
+            with client.subscribe("newHeads") as heads:
+                assert [heads.get(timeout=5)["number"] for _ in range(3)] == ["0x0", "0x1", "0x2"]
+    finally:
+        node.stop()
+
+
+@pytest.mark.client
+def test_ipc_transport(tmp_path):
+    http_node = StubNode({"eth_getBlockByNumber": lambda params: {"number": params[0], "extraData": "}{\"]["}})
+    path = str(tmp_path / "node.ipc")
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            splitter = JsonMessageSplitter()
+            while True:
+                data = self.request.recv(4096)
+                if not data:
+                    return
+                for message in splitter.feed(data):
+                    body = json.loads(message)
+                    if isinstance(body, list):
+                        response = list(reversed([http_node.respond(request) for request in body]))
+                    else:
+                        response = http_node.respond(body)
+                    # Send in small pieces to exercise message framing
+                    encoded = json.dumps(response, indent=1).encode()
+                    for start in range(0, len(encoded), 7):
+                        self.request.sendall(encoded[start:start + 7])
+
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with JsonRpcClient(f"ipc://{path}", timeout=5) as client:
+            response = client.call("eth_getBlockByNumber", ["0x1", False], call_id=5)
+            assert response["id"] == 5
+            assert response["result"] == {"number": "0x1", "extraData": "}{\"]["}
+            batch = client.call_batch([("eth_getBlockByNumber", [hex(n), False]) for n in range(3)])
+            assert [r["result"]["number"] for r in batch] == ["0x0", "0x1", "0x2"]
+        assert isinstance(JsonRpcClient(path).transport, IpcTransport)
+    finally:
+        server.shutdown()
+        server.server_close()
+        http_node.stop()
+
+
+@pytest.mark.client
+def test_response_cache(stub_node, tmp_path):
+    block_hash = "0x" + "ab" * 32
+
+    def get_block_by_number(params):
+        number = {"latest": "0x20", "finalized": "0x10"}.get(params[0], params[0])
+        return {"number": number, "hash": "0x" + "00" * 32 if number == "0x0" else block_hash}
+
+    stub_node.handlers["eth_getBlockByNumber"] = get_block_by_number
+    stub_node.handlers["eth_getBlockByHash"] = lambda params: {"hash": params[0], "number": "0x15"}
+    path = str(tmp_path / "cache.sqlite")
+
+    def methods_sent():
+        requests = [r for body in stub_node.requests for r in (body if isinstance(body, list) else [body])]
+        return [request["method"] + ":" + str(request["params"][0]) for request in requests]
+
+    with JsonRpcClient(stub_node.url, cache=ResponseCache(path=path)) as client:
+        for _ in range(3):
+            assert client.call("eth_getBlockByHash", [block_hash, False], call_id=3)["id"] == 3
+            client.call("eth_getBlockByNumber", ["0x5", False])
+            client.call("eth_getBlockByNumber", ["0x18", False])
+            client.call("eth_getBlockByNumber", ["latest", False])
+        # Mutating a returned result must not change the cached copy
+        client.call("eth_getBlockByHash", [block_hash, False])["result"]["number"] = "0x0"
+        assert client.call("eth_getBlockByHash", [block_hash, False])["result"]["number"] == "0x15"
+        batch = client.call_batch([("eth_getBlockByNumber", ["0x5", False]), ("eth_getBlockByNumber", ["0x6", False])])
+        assert [r["result"]["number"] for r in batch] == ["0x5", "0x6"]
+        assert client.cache.stats()["hits"] == 7
+
+    sent = methods_sent()
+    assert sent.count(f"eth_getBlockByHash:{block_hash}") == 1
+    assert sent.count("eth_getBlockByNumber:0x5") == 1
+    assert sent.count("eth_getBlockByNumber:0x18") == 3
+    assert sent.count("eth_getBlockByNumber:latest") == 3
+
+    # A new client with the same file starts warm
+    stub_node.requests.clear()
+    with JsonRpcClient(stub_node.url, cache=ResponseCache(path=path)) as client:
+        client.call("eth_getBlockByHash", [block_hash, False])
+        assert client.cache.stats()["disk_hits"] == 1
+    assert f"eth_getBlockByHash:{block_hash}" not in methods_sent()
+
+
+@pytest.mark.client
+def test_response_cache_evicts_by_size():
+    cache = ResponseCache(max_bytes=100)
+    for index in range(5):
+        cache.put(f"key{index}", "x" * 40)
+    assert cache.get("key0") is None
+    assert cache.get("key4") == "x" * 40
+    assert cache.stats()["bytes"] <= 100
+    assert cache.stats()["evictions"] == 3
+
+
+@pytest.mark.client
+def test_response_cache_file_locked_by_another_process(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path=path, busy_timeout=0.1)
+    cache.put("key0", "cached")
+    other = sqlite3.connect(path)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        # neither a write nor a lookup on disk raises "database is locked"
+        cache.put("key1", "not on disk")
+        cache._entries.clear()
+        assert cache.get("key0") is None
+        assert cache.stats()["db_errors"] == 2
+    finally:
+        other.rollback()
+        other.close()
+    assert cache.get("key0") == "cached"
+    assert cache.get("key1") is None
+    cache.close()
+
+
+@pytest.mark.client
+def test_head_cache_invalidates_on_new_head(stub_node):
+    head = {"number": 1, "hash": "0xaa"}
+    stub_node.handlers.update({
+        "eth_chainId": lambda params: "0x539",
+        "eth_gasPrice": lambda params: hex(head["number"]),
+        "eth_getBalance": lambda params: hex(head["number"] * 10),
+        "eth_getBlockByNumber": lambda params: {"number": hex(head["number"]), "hash": head["hash"], "parentHash": "0x00"},
+        "eth_getTransactionReceipt": lambda params: {"blockNumber": hex(head["number"]), "status": "0x1"},
+    })
+
+    def count(method):
+        return sum(1 for request in stub_node.requests if request["method"] == method)
+
+    address = "0xFF1751EC3d19E2899FA48823C452620A91D6D017"
+    with JsonRpcClient(stub_node.url, head_cache=HeadScopedCache(ttl=60)) as client:
+        for _ in range(3):
+            assert client.call("eth_chainId")["result"] == "0x539"
+            assert client.call("eth_gasPrice")["result"] == "0x1"
+            assert client.call("eth_getBalance", [address, "latest"])["result"] == "0xa"
+            client.call("eth_getBalance", [address, "pending"])
+        assert (count("eth_chainId"), count("eth_gasPrice"), count("eth_getBalance")) == (1, 1, 4)
+
+        # A receipt from a newer block proves the head moved on
+        head["number"] = 2
+        client.call("eth_getTransactionReceipt", ["0x01"])
+        assert client.call("eth_gasPrice")["result"] == "0x2"
+
+        # Reorg to a block with the same number but another hash, noticed by the probe after the ttl
+        client.call("eth_getBlockByNumber", ["latest", False])
+        assert client.call("eth_getBalance", [address, "latest"])["result"] == "0x14"
+        client.head_cache.ttl = 0
+        head["hash"] = "0xbb"
+        stub_node.handlers["eth_getBalance"] = lambda params: "0x99"
+        assert client.call("eth_getBalance", [address, "latest"])["result"] == "0x99"
+        assert client.call("eth_chainId")["result"] == "0x539"
+        assert count("eth_chainId") == 1
+        assert client.head_cache.stats()["invalidations"] == 2
+
+
+@pytest.mark.client
+def test_identical_concurrent_calls_are_coalesced(stub_node):
+    def slow_block_number(params):
+        time.sleep(0.2)
+        return "0x10"
+
+    stub_node.handlers["eth_blockNumber"] = slow_block_number
+    with JsonRpcClient(stub_node.url) as client:
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(client.call("eth_blockNumber", call_id=i)))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(stub_node.requests) == 1
+    assert sorted(response["id"] for response in results) == list(range(20))
+    assert all(response["result"] == "0x10" for response in results)
+
+
+@pytest.mark.client
+@pytest.mark.parametrize("codec", ["json", "orjson"])
+def test_call_stream_yields_items_of_large_result(stub_node, codec):
+    pytest.importorskip(codec)
+    struct_logs = [{"pc": pc, "op": "PUSH1", "stack": ["0x" + "ab" * 32] * 3, "memo": "\"]},{\\"}
+                   for pc in range(5000)]
+    stub_node.handlers["debug_traceTransaction"] = lambda params: {"gas": 21000, "structLogs": struct_logs,
+                                                                   "returnValue": ""}
+    with JsonRpcClient(stub_node.url, codec=codec) as client:
+        assert list(client.call_stream("debug_traceTransaction", ["0x01", {}], path=("structLogs",))) == struct_logs
+        assert client.call("eth_blockNumber")["result"] == "0x10"
+        with pytest.raises(ValueError):
+            list(client.call_stream("debug_unknownMethod"))
+
+
+@pytest.mark.client
+def test_auto_codec_keeps_integers_wider_than_64_bits(stub_node):
+    wide = 2 ** 70
+    stub_node.handlers["debug_echo"] = lambda params: {"value": params[0], "hash": "0x" + "1" * 64}
+    with JsonRpcClient(stub_node.url, codec="auto") as client:
+        response = client.call("debug_echo", [wide])
+        assert response["result"] == {"value": wide, "hash": "0x" + "1" * 64}
+        assert isinstance(response["result"]["value"], int)
+        # a request the codec can't encode gets the error envelope instead of raising
+        response = client.call("debug_echo", [{1, 2}])
+        assert response["error"]["code"] == -32000
+
+
+@pytest.mark.client
+def test_slow_log_mode_captures_only_slow_and_failed_calls(stub_node):
+    def slow_block_number(params):
+        time.sleep(0.1)
+        return "0x10"
+
+    records = []
+    sink = logger.add(lambda message: records.append(message.record), level="DEBUG")
+    try:
+        with JsonRpcClient(stub_node.url, log_mode="slow", slow_threshold_ms=50, coalesce=False) as client:
+            client.call("eth_getBlockByNumber", ["0x1", False])
+            stub_node.handlers["eth_blockNumber"] = slow_block_number
+            client.call("eth_blockNumber")
+            client.call("eth_unknownMethod")
+    finally:
+        logger.remove(sink)
+
+    captured = [(r["extra"]["rpc_method"], r["level"].name, r["extra"]["rpc_ok"]) for r in records
+                if "rpc_method" in r["extra"]]
+    assert captured == [("eth_getBlockByNumber", "DEBUG", True), ("eth_blockNumber", "WARNING", True),
+                        ("eth_unknownMethod", "WARNING", False)]
+    assert '"method":"eth_unknownMethod"' in records[-1]["message"]
+
+
+@pytest.mark.client
+def test_all_log_mode_truncates_bodies():
+    rpc_log = RpcLogger(max_chars=10)
+    assert rpc_log.format({"result": "0x" + "00" * 100}, truncate=True) == '{"result":... (215 chars)'
+    assert len(rpc_log.format({"result": "0x" + "00" * 100})) == 215
+
+
+@pytest.mark.client
+def test_endpoint_pool_fails_over_and_ejects_dead_endpoint(stub_node):
+    dead_node = StubNode()
+    dead_node.stop()
+    with JsonRpcClient([dead_node.url, stub_node.url], eject_after=2) as client:
+        responses = [client.call("eth_blockNumber") for _ in range(10)]
+        endpoints = {endpoint["url"]: endpoint for endpoint in client.transport.stats()["endpoints"]}
+
+    assert all(response["result"] == "0x10" for response in responses)
+    assert endpoints[dead_node.url]["ejections"] == 1
+    assert endpoints[dead_node.url]["requests"] == 2
+    assert endpoints[stub_node.url]["requests"] == 10
+
+
+@pytest.mark.client
+def test_endpoint_pool_hedges_slow_read_only_calls(stub_node, monkeypatch):
+    monkeypatch.setattr(Endpoint, "min_samples", 5)
+    fast_node = StubNode(handlers={"eth_blockNumber": lambda params: "0x10"})
+    backup_node = StubNode(handlers={"eth_blockNumber": lambda params: time.sleep(0.02) or "0x10"})
+    try:
+        with JsonRpcClient(f"{fast_node.url},{backup_node.url}", hedge=True, coalesce=False) as client:
+            for _ in range(10):
+                client.call("eth_blockNumber")
+            before = client.transport.stats()
+            fast_node.handlers["eth_blockNumber"] = lambda params: time.sleep(1) or "0x11"
+            started = time.monotonic()
+            response = client.call("eth_blockNumber")
+            elapsed = time.monotonic() - started
+            stats = client.transport.stats()
+    finally:
+        fast_node.stop()
+        backup_node.stop()
+
+    assert response["result"] == "0x10"
+    assert elapsed < 0.5
+    assert stats["hedges"] - before["hedges"] == 1
+    assert stats["hedge_wins"] - before["hedge_wins"] == 1
+
+
+@pytest.mark.client
+def test_policy_retries_idempotent_calls_only(stub_node):
+    attempts = []
+
+    def limited(params):
+        attempts.append(params)
+        if len(attempts) < 3:
+            raise RpcError(-32005, "Limit exceeded")
+        return "0x10"
+
+    def busy(params):
+        raise RpcError(-32005, "Busy")
+
+    stub_node.handlers["eth_getLogs"] = limited
+    stub_node.handlers["eth_sendRawTransaction"] = busy
+    policy = RequestPolicy(MethodPolicy(retries=2, backoff_ms=1),
+                           parse_method_policies("eth_getLogs: retries=3", MethodPolicy(backoff_ms=1)))
+    with JsonRpcClient(stub_node.url, policy=policy) as client:
+        assert client.call("eth_getLogs", [{}])["result"] == "0x10"
+        assert client.call("eth_sendRawTransaction", ["0x00"])["error"]["code"] == -32005
+
+    assert len(attempts) == 3
+    assert sum(1 for request in stub_node.requests if request["method"] == "eth_sendRawTransaction") == 1
+    assert policy.stats()["retries"] == 2
+
+
+@pytest.mark.client
+def test_circuit_breaker_fails_fast_on_dead_node():
+    dead_node = StubNode()
+    dead_node.stop()
+    policy = RequestPolicy(MethodPolicy(retries=0), breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+    with JsonRpcClient(dead_node.url, policy=policy) as client:
+        sent = []
+        send = client.transport.send
+        client.transport.send = lambda payload, timeout=None: sent.append(payload) or send(payload, timeout)
+        responses = [client.call("eth_blockNumber") for _ in range(20)]
+
+    assert all(response["error"]["code"] == -32000 for response in responses)
+    assert len(sent) == 3
+    assert "Circuit open" in responses[-1]["error"]["message"]
+    assert policy.breaker.rejected == 17
+
+
+@pytest.mark.client
+def test_throttled_calls_are_not_retried_or_counted_by_the_breaker(stub_node):
+    stub_node.http_errors = [(429, {"Retry-After": "0.2"})] * 6
+    policy = RequestPolicy(MethodPolicy(retries=2, backoff_ms=1), breaker=CircuitBreaker(failure_threshold=3))
+    limiter = RateLimiter(rate=1000)
+    with JsonRpcClient(stub_node.url, policy=policy, rate_limiter=limiter) as client:
+        started = time.perf_counter()
+        responses = [client.call("eth_blockNumber") for _ in range(6)]
+        assert "429" in responses[0]["error"]["message"]
+        # every call after a 429 waited out its Retry-After instead of failing fast
+        assert time.perf_counter() - started >= 1.0
+        assert client.call("eth_blockNumber")["result"] == "0x10"
+
+    assert len(stub_node.requests) == 7
+    assert policy.stats()["retries"] == 0
+    assert policy.breaker.state == "closed" and policy.breaker.opened == 0
+
+
+@pytest.mark.client
+def test_circuit_breaker_closes_after_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.06)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        # only one trial call at a time
+        breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.client
+def test_latency_histogram_quantiles_within_bucket_precision():
+    histogram = LatencyHistogram()
+    for micros in range(1, 100001):
+        histogram.record(micros)
+    for q in (0.5, 0.9, 0.99):
+        assert abs(histogram.quantile(q) - q * 100000) / (q * 100000) < 0.04
+    assert histogram.quantile(1.0) == 100000
+    assert len(histogram._buckets) < 500
+
+
+@pytest.mark.client
+def test_client_records_metrics_per_method(stub_node, tmp_path):
+    metrics = RpcMetrics()
+    with JsonRpcClient(stub_node.url, metrics=metrics) as client:
+        for _ in range(3):
+            client.call("eth_blockNumber")
+        client.call("debug_unknownMethod")
+        client.call_batch([("eth_getBlockByNumber", [hex(number), False]) for number in range(4)])
+
+    snapshot = metrics.snapshot()
+    assert snapshot["methods"]["eth_blockNumber"]["count"] == 3
+    assert snapshot["methods"]["eth_blockNumber"]["bytes_received"] > 0
+    assert snapshot["methods"]["debug_unknownMethod"]["errors"] == 1
+    assert snapshot["methods"]["eth_getBlockByNumber"]["count"] == 4
+    assert snapshot["namespaces"]["eth"]["count"] == 7
+    assert snapshot["namespaces"]["eth"]["p99_ms"] is not None
+
+    metrics.write(tmp_path / "rpc_metrics")
+    assert json.loads((tmp_path / "rpc_metrics.json").read_text())["namespaces"]["debug"]["errors"] == 1
+    assert 'jsonrpc_client_request_duration_seconds_count{method="eth_blockNumber"} 3' in \
+        (tmp_path / "rpc_metrics.prom").read_text()
+    metrics.reset()
+    assert metrics.snapshot()["methods"] == {}
+
+
+@pytest.mark.client
+def test_metrics_of_several_processes_merge_into_one_profile():
+    workers = [RpcMetrics(), RpcMetrics()]
+    combined = RpcMetrics()
+    for index, metrics in enumerate(workers):
+        for millis in range(1, 50):
+            for target in (metrics, combined):
+                target.record("eth_call", millis * (index + 1) / 1000, 100, 200, error=millis == 7)
+    merged = RpcMetrics()
+    for metrics in workers:
+        # state() is made of plain lists and numbers, as sent from an xdist worker to the controller
+        merged.merge_state(json.loads(json.dumps(metrics.state())))
+    assert merged.snapshot() == combined.snapshot()
+
+
+@pytest.mark.client
+def test_typed_results(stub_node):
+    transaction = {"hash": "0x" + "aa" * 32, "blockHash": "0x" + "bb" * 32, "blockNumber": "0x10",
+                   "from": "0x" + "11" * 20, "to": "0x" + "22" * 20, "value": "0xde0b6b3a7640000", "nonce": "0x3",
+                   "input": "0x6080", "type": "0x2", "custom": "kept"}
+    stub_node.handlers["eth_getBlockByHash"] = lambda params: {
+        "number": "0x10", "hash": "0x" + "bb" * 32, "parentHash": "0x" + "cc" * 32, "gasUsed": "0x5208",
+        "transactions": [transaction] if params[1] else [transaction["hash"]], "uncles": []}
+    stub_node.handlers["eth_getLogs"] = lambda params: [
+        {"address": "0x" + "22" * 20, "topics": ["0x" + "33" * 32], "data": "0x", "logIndex": "0x0"}]
+
+    with JsonRpcClient(stub_node.url, typed=True) as client:
+        block = client.call("eth_getBlockByHash", ["0x" + "bb" * 32, True])["result"]
+        hashes_only = client.call_batch([("eth_getBlockByHash", ["0x" + "bb" * 32, False])])[0]["result"]
+        logs = client.call("eth_getLogs", [{}])["result"]
+        raw = client.call("eth_getBlockByHash", ["0x" + "bb" * 32, True], typed=False)["result"]
+        assert client.web3.eth.get_block("0x" + "bb" * 32)["number"] == 16
+
+    assert isinstance(block, Block)
+    assert block.number == 16 and block.gasUsed == 21000
+    assert block.hash == bytes.fromhex("bb" * 32)
+    tx = block.transactions[0]
+    assert tx.value == 10 ** 18 and tx.from_ == bytes.fromhex("11" * 20) and tx.maxFeePerGas is None
+    # shared with the block instead of a copy per transaction
+    assert tx.blockHash is block.hash
+    assert tx.extra == {"custom": "kept"}
+    assert hashes_only.transaction_hashes == (bytes.fromhex("aa" * 32),)
+    assert logs[0].topics == (bytes.fromhex("33" * 32),)
+    assert block.to_dict() == raw
+
+
+@pytest.mark.client
+def test_typed_results_decode_the_same_hex_by_field_kind():
+    quantity_first = {"logIndex": "0x01", "data": "0x01"}
+    bytes_first = {"data": "0x01", "logIndex": "0x01"}
+    # one memo for the whole result, as when decoding the logs of a block
+    memo = {}
+    for log in (Log.from_rpc(quantity_first, memo), Log.from_rpc(bytes_first, memo), Log.from_rpc(bytes_first)):
+        assert log.logIndex == 1
+        assert log.data == b"\x01"
+        assert log.to_dict() == {"data": "0x01", "logIndex": "0x1"}
+
+
+@pytest.mark.client
+def test_internal_helpers_get_plain_results_from_a_typed_client(stub_node):
+    tx_hash = "0x" + "aa" * 32
+    receipt = {"transactionHash": tx_hash, "blockHash": "0x" + "bb" * 32, "blockNumber": "0x10", "status": "0x1"}
+    stub_node.handlers.update({
+        "eth_getBlockByHash": lambda params: {"number": "0x10", "hash": "0x" + "bb" * 32, "transactions": [tx_hash]},
+        "eth_getTransactionByHash": lambda params: {"hash": params[0], "blockNumber": "0x10"},
+        "eth_getTransactionReceipt": lambda params: receipt,
+        "eth_getBlockReceipts": lambda params: [receipt],
+    })
+
+    with JsonRpcClient(stub_node.url, typed=True) as client:
+        with ReceiptWaiter(client, timeout=5, min_interval=0.05) as waiter:
+            assert waiter.wait(tx_hash)["blockHash"] == "0x" + "bb" * 32
+        block = client.lazy_block("0x" + "bb" * 32)
+        assert block["transactions"][0]["hash"] == tx_hash
+        assert [item["hash"] for item in block["transactions"]] == [tx_hash]
+        assert block.receipts[0]["status"] == "0x1"
+
+
+@pytest.mark.client
+def test_lazy_block_hydrates_transactions_on_access(stub_node):
+    tx_hashes = ["0x" + f"{index:064x}" for index in range(1, 6)]
+    stub_node.handlers["eth_getBlockByNumber"] = lambda params: {
+        "number": "0x10", "hash": "0x" + "bb" * 32,
+        "transactions": [{"hash": tx_hash} for tx_hash in tx_hashes] if params[1] else tx_hashes}
+    stub_node.handlers["eth_getTransactionByHash"] = lambda params: {"hash": params[0], "value": "0x1"}
+    stub_node.handlers["eth_getTransactionReceipt"] = lambda params: {"transactionHash": params[0], "status": "0x1"}
+
+    with JsonRpcClient(stub_node.url, max_batch_size=10) as client:
+        block = client.lazy_block("latest")
+        assert block.number == 16 and block["hash"] == "0x" + "bb" * 32
+        assert len(block["transactions"]) == 5
+        assert block["transactions"][-1]["hash"] == tx_hashes[-1]
+        assert [tx["hash"] for tx in block["transactions"]] == tx_hashes
+        # eth_getBlockReceipts is not supported by the stub, receipts fall back to one batch
+        assert [receipt["transactionHash"] for receipt in block.receipts] == tx_hashes
+
+    assert stub_node.requests[0]["params"] == ["latest", False]
+    methods = [[request["method"] for request in body] if isinstance(body, list) else body["method"]
+               for body in stub_node.requests]
+    assert methods == ["eth_getBlockByNumber", "eth_getTransactionByHash", ["eth_getTransactionByHash"] * 4,
+                       "eth_getBlockReceipts", ["eth_getTransactionReceipt"] * 5]
+
+
+@pytest.mark.client
+def test_large_requests_and_responses_are_compressed():
+    node = StubNode(handlers={
+        "eth_sendRawTransaction": lambda params: "0x" + "ab" * 32,
+        "eth_getBlockByNumber": lambda params: {"number": params[0], "extraData": "0x" + "00" * 20000},
+    }, compress_responses=True)
+    metrics = RpcMetrics()
+    try:
+        with JsonRpcClient(node.url, request_compression="gzip", compress_min_bytes=1024, metrics=metrics) as client:
+            assert client.call("eth_sendRawTransaction", ["0x" + "02" * 2000])["result"] == "0x" + "ab" * 32
+            assert client.call("eth_blockNumber")["error"]["code"] == -32601
+            block = client.call("eth_getBlockByNumber", ["0x10", False])["result"]
+            assert len(block["extraData"]) == 40002
+    finally:
+        node.stop()
+
+    # only the large raw transaction is worth compressing
+    assert node.request_encodings == ["gzip", None, None]
+    assert node.requests[0]["params"] == ["0x" + "02" * 2000]
+    # bytes received are counted as on the wire, before decompression
+    assert metrics.snapshot()["methods"]["eth_getBlockByNumber"]["bytes_received"] < 1000
+
+
+@pytest.mark.client
+def test_http2_transport(stub_node):
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    # The stub only speaks HTTP/1.1, the transport falls back to it like with a node without HTTP/2
+    with JsonRpcClient(stub_node.url, http2=True) as client:
+        results = client.call_batch([("eth_blockNumber", []), ("eth_getBlockByNumber", ["0x1", False])])
+        assert [response["result"] for response in results] == ["0x10", {"number": "0x1"}]
+        assert client.call("eth_blockNumber")["result"] == "0x10"
+
+        stub_node.http_errors = [(429, {"Retry-After": "7"})]
+        with pytest.raises(requests.exceptions.HTTPError) as error:
+            client.transport.send(build_payload("eth_blockNumber"))
+        assert error.value.response.status_code == 429
+        assert error.value.response.headers["Retry-After"] == "7"
+
+
+@pytest.mark.client
+def test_http2_prior_knowledge_multiplexes_cleartext_calls():
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    import h2.config
+    import h2.connection
+    import h2.events
+
+    http_node = StubNode({"eth_getBlockByNumber": lambda params: {"number": params[0]}})
+    connections = []
+
+    class Handler(socketserver.BaseRequestHandler):
+        # cleartext HTTP/2 (h2c) server answering every stream like the stub node
+        def handle(self):
+            connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+            connection.initiate_connection()
+            self.request.sendall(connection.data_to_send())
+            connections.append(self)
+            bodies = {}
+            while True:
+                data = self.request.recv(65535)
+                if not data:
+                    return
+                for event in connection.receive_data(data):
+                    if isinstance(event, h2.events.DataReceived):
+                        bodies[event.stream_id] = bodies.get(event.stream_id, b"") + event.data
+                        connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        body = json.dumps(http_node.respond(json.loads(bodies.pop(event.stream_id)))).encode()
+                        connection.send_headers(event.stream_id, [(":status", "200"), ("content-type", "application/json"),
+                                                                  ("content-length", str(len(body)))])
+                        connection.send_data(event.stream_id, body, end_stream=True)
+                self.request.sendall(connection.data_to_send())
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    records = []
+    sink = logger.add(lambda message: records.append(message.record), level="WARNING")
+    try:
+        with JsonRpcClient(url, http2=True, http2_prior_knowledge=True, timeout=5) as client:
+            results = []
+            threads = [threading.Thread(target=lambda n=n: results.append(
+                client.call("eth_getBlockByNumber", [hex(n), False])["result"]["number"])) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sorted(results) == sorted(hex(n) for n in range(8))
+        # all calls were streams of one HTTP/2 connection
+        assert len(connections) == 1
+        assert not records
+        # without prior knowledge http:// stays on HTTP/1.1, which is worth a warning
+        JsonRpcClient(url, http2=True).close()
+        assert "only negotiated on https://" in records[0]["message"]
+    finally:
+        logger.remove(sink)
+        server.shutdown()
+        server.server_close()
+        http_node.stop()
+
+
+@pytest.mark.client
+def test_rate_limiter_enforces_global_and_method_budgets(stub_node):
+    stub_node.handlers["trace_block"] = lambda params: []
+    limiter = RateLimiter(rate=50, burst=10, method_limits=parse_method_rate_limits("trace_*: rate=10, burst=1"))
+
+    with JsonRpcClient(stub_node.url, rate_limiter=limiter) as client:
+        started = time.perf_counter()
+        client.call_batch([("eth_blockNumber", [])] * 10)
+        # the burst goes out at once
+        assert time.perf_counter() - started < 0.1
+        for _ in range(10):
+            client.call("eth_blockNumber")
+        # 10 more requests at 50/s
+        assert time.perf_counter() - started >= 0.18
+        started = time.perf_counter()
+        for _ in range(4):
+            client.call("trace_block", ["0x1"])
+        # trace calls have their own, much smaller budget
+        assert time.perf_counter() - started >= 0.28
+
+    assert limiter.stats()["throttled"] >= 3
+
+
+@pytest.mark.client
+def test_async_client_shares_rate_limiter(stub_node):
+    limiter = RateLimiter(rate=40, burst=1)
+
+    async def run():
+        async with AsyncJsonRpcClient(stub_node.url, rate_limiter=limiter) as client:
+            return await client.call_many([("eth_blockNumber", [])] * 9)
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    assert all(response["result"] == "0x10" for response in responses)
+    assert time.perf_counter() - started >= 0.19
+
+
+@pytest.mark.client
+def test_call_many_adapts_concurrency_to_node_capacity(stub_node):
+    active = []
+    lock = threading.Lock()
+
+    def get_receipt(params):
+        with lock:
+            active.append(1)
+            concurrent = len(active)
+        # the node keeps up with 6 calls at a time, beyond that every call gets much slower
+        time.sleep(0.005 if concurrent <= 6 else 0.05)
+        with lock:
+            active.pop()
+        return {"transactionHash": params[0]}
+
+    stub_node.handlers["eth_getTransactionReceipt"] = get_receipt
+    controller = AimdController(initial=2, max_limit=32)
+    calls = [("eth_getTransactionReceipt", [f"0x{index:064x}"]) for index in range(300)]
+
+    with JsonRpcClient(stub_node.url, pool_maxsize=32, metrics=None) as client:
+        responses = client.call_many(calls, controller=controller)
+
+    assert [response["result"]["transactionHash"] for response in responses] == [params[0] for _, params in calls]
+    assert controller.increases > 0 and controller.decreases > 0
+    assert 2 < controller.peak < 32
+
+
+@pytest.mark.client
+def test_aimd_controller_backs_off_once_per_overload():
+    # latency is not under test here, only success and failure
+    controller = AimdController(initial=8, backoff=0.5, latency_tolerance=float("inf"))
+    started = [controller.acquire() for _ in range(8)]
+    for start in started:
+        controller.release(start, ok=False)
+    # all eight calls were in flight when the node failed, it counts as one overload event
+    assert controller.limit == 4 and controller.decreases == 1
+    for _ in range(4):
+        controller.release(controller.acquire(), ok=True)
+    assert controller.limit == 5
+
+
+@pytest.mark.client
+def test_priority_lanes_keep_cheap_calls_out_of_the_trace_queue(stub_node):
+    def trace(params):
+        time.sleep(0.3)
+        return []
+
+    stub_node.handlers["debug_traceBlockByNumber"] = trace
+    lanes = PriorityLanes(parse_lanes("reads: concurrency=4; tracing: concurrency=1, timeout=60"))
+
+    with JsonRpcClient(stub_node.url, pool_maxsize=4, pool_block=True, lanes=lanes) as client:
+        traces = [threading.Thread(target=client.call, args=("debug_traceBlockByNumber", [hex(number), {}]))
+                  for number in range(4)]
+        for thread in traces:
+            thread.start()
+        time.sleep(0.05)
+        started = time.perf_counter()
+        assert client.call("eth_blockNumber")["result"] == "0x10"
+        # the traces queue in their own lane instead of taking every pooled connection
+        assert time.perf_counter() - started < 0.2
+        for thread in traces:
+            thread.join()
+
+    assert lanes.stats()["tracing"]["calls"] == 4 and lanes.stats()["tracing"]["max_wait_ms"] >= 500
+    assert lanes.lane_for([{"method": "eth_call"}, {"method": "trace_block"}]).name == "tracing"
+    assert lanes.lane_for({"method": "eth_sendRawTransaction"}) is None
+    # the default lanes keep the client timeout (rpc_timeout) for every class
+    assert all(lane.timeout is None for lane in PriorityLanes.from_config({}).lanes.values())
+
+
+@pytest.mark.client
+def test_streamed_calls_take_rate_limiter_tokens_and_lane_slots(stub_node):
+    stub_node.handlers["debug_traceTransaction"] = lambda params: {"structLogs": [{"pc": 1}, {"pc": 2}]}
+    limiter = RateLimiter(rate=1000, method_limits=parse_method_rate_limits("debug_*: rate=10, burst=1"))
+    lanes = PriorityLanes(parse_lanes("tracing: concurrency=1"))
+
+    with JsonRpcClient(stub_node.url, rate_limiter=limiter, lanes=lanes) as client:
+        started = time.perf_counter()
+        for number in range(3):
+            items = list(client.call_stream("debug_traceTransaction", [hex(number), {}], path=("structLogs",)))
+            assert items == [{"pc": 1}, {"pc": 2}]
+        # two of the three streams waited for the debug_* budget
+        assert time.perf_counter() - started >= 0.18
+
+    assert lanes.stats()["tracing"]["calls"] == 3
+
+
+@pytest.mark.client
+def test_cassette_replays_recorded_run_without_node(stub_node, tmp_path):
+    receipts = iter([None, {"status": "0x1"}])
+    stub_node.handlers["eth_getTransactionReceipt"] = lambda params: next(receipts)
+    stub_node.handlers["eth_sendRawTransaction"] = lambda params: "0x" + "ab" * 32
+    path = tmp_path / "run.jsonl.gz"
+
+    def run(client, raw_tx):
+        return [
+            client.call("eth_sendRawTransaction", [raw_tx]),
+            client.call("eth_getTransactionReceipt", ["0x01"]),
+            client.call("eth_getTransactionReceipt", ["0x01"]),
+            client.call_batch([("eth_blockNumber", []), ("eth_getBlockByNumber", ["0x1", False])]),
+        ]
+
+    recording = JsonRpcClient(stub_node.url, coalesce=False)
+    recording.transport = CassetteTransport(str(path), "record", recording.transport)
+    with recording:
+        recorded = run(recording, "0x02aa")
+    stub_node.stop()
+
+    cassette = CassetteTransport(str(path), "replay")
+    with JsonRpcClient("http://127.0.0.1:1", coalesce=False, transport=cassette) as client:
+        # another random key signs another raw transaction, it gets the recorded answer anyway
+        replayed = run(client, "0x02bb")
+        assert "not found in cassette" in client.call("eth_chainId")["error"]["message"]
+
+    strip = lambda response: {key: value for key, value in response.items() if key != "id"}
+    assert [strip(response) for response in replayed[:3]] == [strip(response) for response in recorded[:3]]
+    assert replayed[1]["result"] is None and replayed[2]["result"] == {"status": "0x1"}
+    assert [response["result"] for response in replayed[3]] == ["0x10", {"number": "0x1"}]
+    assert cassette.stats() == {"replayed": 4, "fallbacks": 1, "unused": 0}
+
+
+@pytest.mark.client
+def test_cassette_of_each_xdist_worker_is_replayed_together(stub_node, tmp_path, monkeypatch):
+    stub_node.handlers["eth_getBlockByNumber"] = lambda params: {"number": params[0]}
+    path = tmp_path / "run.jsonl.gz"
+    for worker, block in (("gw0", "0x1"), ("gw1", "0x2")):
+        monkeypatch.setenv("PYTEST_XDIST_WORKER", worker)
+        recording = JsonRpcClient(stub_node.url, coalesce=False)
+        recording.transport = CassetteTransport(str(path), "record", recording.transport)
+        with recording:
+            recording.call("eth_getBlockByNumber", [block, False])
+    assert sorted(item.name for item in tmp_path.iterdir()) == ["run.gw0.jsonl.gz", "run.gw1.jsonl.gz"]
+    stub_node.stop()
+
+    # xdist may give the tests to other workers in the replayed run
+    monkeypatch.setenv("PYTEST_XDIST_WORKER", "gw1")
+    cassette = CassetteTransport(str(path), "replay")
+    with JsonRpcClient("http://127.0.0.1:1", coalesce=False, transport=cassette) as client:
+        assert client.call("eth_getBlockByNumber", ["0x1", False])["result"] == {"number": "0x1"}
+        assert client.call("eth_getBlockByNumber", ["0x2", False])["result"] == {"number": "0x2"}
+    assert cassette.stats() == {"replayed": 2, "fallbacks": 0, "unused": 0}
+
+
+@pytest.mark.client
+def test_receipt_waiter_checks_all_pending_transactions_per_block(stub_node):
+    started = time.monotonic()
+    head = lambda: int((time.monotonic() - started) / 0.2)
+    # transaction i is mined in block i + 1
+    tx_hashes = ["0x" + f"{index:064x}" for index in range(5)]
+    stub_node.handlers["eth_blockNumber"] = lambda params: hex(head())
+    stub_node.handlers["eth_getTransactionReceipt"] = lambda params: (
+        {"transactionHash": params[0], "blockNumber": hex(head())} if head() > int(params[0], 16) else None)
+
+    with JsonRpcClient(stub_node.url, coalesce=False) as client:
+        with ReceiptWaiter(client, timeout=5, min_interval=0.05, max_interval=0.1) as waiter:
+            first = waiter.submit(tx_hashes[0])
+            receipts = waiter.wait_all(tx_hashes)
+            assert first.result() is receipts[0]
+            with pytest.raises(TimeoutError):
+                waiter.wait("0x" + "ff" * 32, timeout=0.3)
+
+    assert [receipt["transactionHash"] for receipt in receipts] == tx_hashes
+    batches = [body for body in stub_node.requests if isinstance(body, list)]
+    # one batch per block (plus the first check), every batch holds all still pending hashes
+    assert len(batches) <= 10
+    assert max(len(body) for body in batches) == 5
+
+
+@pytest.mark.client
+def test_receipt_waiter_polls_without_pause_and_forgets_timed_out_transactions(stub_node):
+    polls = []
+
+    def block_number(params):
+        polls.append(params)
+        return hex(len(polls))
+
+    # a new block with every poll, the transaction is mined in block 20
+    stub_node.handlers["eth_blockNumber"] = block_number
+    stub_node.handlers["eth_getTransactionReceipt"] = lambda params: (
+        {"transactionHash": params[0]} if params[0] == "0x01" and len(polls) >= 20 else None)
+
+    with JsonRpcClient(stub_node.url, coalesce=False) as client:
+        with ReceiptWaiter(client, timeout=5, min_interval=0, max_interval=0) as waiter:
+            started = time.perf_counter()
+            assert waiter.wait("0x01")["transactionHash"] == "0x01"
+            assert time.perf_counter() - started < 2
+            with pytest.raises(TimeoutError):
+                waiter.wait_all(["0x02", "0x03", "0x04"], timeout=0.2)
+            assert waiter._pending == {}
+
+
+@pytest.mark.client
+def test_receipt_waiter_survives_malformed_responses(stub_node):
+    polls = []
+
+    def block_number(params):
+        polls.append(params)
+        return "garbage" if len(polls) == 1 else hex(len(polls))
+
+    stub_node.handlers["eth_blockNumber"] = block_number
+    stub_node.handlers["eth_getTransactionReceipt"] = lambda params: {"transactionHash": params[0]}
+
+    with JsonRpcClient(stub_node.url, coalesce=False) as client:
+        with ReceiptWaiter(client, timeout=5, min_interval=0.05, max_interval=0.1) as waiter:
+            assert waiter.wait("0x01")["transactionHash"] == "0x01"
+            assert waiter.failures == 1
+
+            # a node that keeps answering garbage fails the wait with the error, not a timeout
+            stub_node.handlers["eth_blockNumber"] = lambda params: "garbage"
+            started = time.perf_counter()
+            with pytest.raises(ValueError, match="garbage"):
+                waiter.wait("0x02")
+            assert time.perf_counter() - started < 2
+            assert waiter._pending == {}
+
+
+@pytest.mark.client
+def test_transaction_sender_allocates_nonces_locally(stub_node):
+    pool = {}
+    node_nonce = [5]
+
+    def send_raw(params):
+        nonce = int.from_bytes(rlp.decode(bytes.fromhex(params[0][2:]))[0], "big")
+        if nonce < node_nonce[0] or nonce in pool:
+            raise RpcError(-32010, "nonce too low")
+        pool[nonce] = params[0]
+        return "0x" + f"{nonce:064x}"
+
+    stub_node.handlers.update({
+        "eth_chainId": lambda params: "0x539",
+        "eth_gasPrice": lambda params: "0x3b9aca00",
+        "eth_getTransactionCount": lambda params: hex(max([node_nonce[0] - 1, *pool]) + 1),
+        "eth_sendRawTransaction": send_raw,
+    })
+    transfer = {"to": "0x742d35Cc6634C0532925a3b844Bc454e4438f44e", "value": 1}
+
+    with JsonRpcClient(stub_node.url) as client:
+        sender = TransactionSender(client, "0x" + "11" * 32)
+        hashes = sender.send_many([transfer] * 3) + [sender.send(transfer)]
+        # another process sent transactions from the same account meanwhile
+        node_nonce[0] = 20
+        hashes.append(sender.send(transfer))
+
+    assert [int(tx_hash, 16) for tx_hash in hashes] == [5, 6, 7, 8, 20]
+    methods = [body["method"] if isinstance(body, dict) else "batch" for body in stub_node.requests]
+    assert methods.count("eth_getTransactionCount") == 2
+    assert methods.count("eth_chainId") == 1 and methods.count("eth_gasPrice") == 1
+    assert methods.count("batch") == 1
+    assert sender.nonces.resyncs == 1
+
+
+@pytest.mark.client
+def test_account_pool_funds_in_one_batch_and_tops_up_low_accounts(stub_node):
+    sent = []
+    balances = {}
+
+    def send_raw(params):
+        fields = rlp.decode(bytes.fromhex(params[0][2:]))
+        sent.append(("0x" + fields[3].hex(), int.from_bytes(fields[4], "big")))
+        return "0x" + f"{len(sent):064x}"
+
+    stub_node.handlers.update({
+        "eth_chainId": lambda params: "0x539",
+        "eth_gasPrice": lambda params: "0x1",
+        "eth_blockNumber": lambda params: "0x10",
+        "eth_getTransactionCount": lambda params: "0x0",
+        "eth_sendRawTransaction": send_raw,
+        "eth_getTransactionReceipt": lambda params: {"transactionHash": params[0], "status": "0x1"},
+        "eth_getBalance": lambda params: hex(balances.get(params[0], 100)),
+    })
+
+    with JsonRpcClient(stub_node.url, coalesce=False) as client:
+        funder = TransactionSender(client, "0x" + "11" * 32)
+        with ReceiptWaiter(client, timeout=5, min_interval=0.05) as waiter:
+            pool = AccountPool(client, funder, waiter, size=3, funding=100, min_balance=10, top_up_interval=3600).fill()
+        assert sorted(sent) == sorted((account.address.lower(), 100) for account in pool.accounts)
+        assert sum(isinstance(body, list) and body[0]["method"] == "eth_sendRawTransaction"
+                   for body in stub_node.requests) == 1
+
+        with pool.account() as account:
+            account.send({"to": pool.accounts[0].address, "value": 1})
+        checked_out = [pool.acquire() for _ in range(3)]
+        with pytest.raises(TimeoutError):
+            pool.acquire(timeout=0.05)
+        # a pool that ran dry fails instead of hanging
+        pool.acquire_timeout = 0.05
+        with pytest.raises(TimeoutError):
+            with pool.account():
+                pass
+        for account in checked_out:
+            pool.release(account)
+
+        balances[pool.accounts[1].address] = 4
+        sent.clear()
+        assert len(pool.top_up()) == 1
+        assert sent == [(pool.accounts[1].address.lower(), 96)]
+        pool.close()
+
+
+@pytest.mark.client
+def test_chain_artifacts_are_prepared_in_two_blocks(stub_node):
+    sent = {}
+    contract = "0x" + "c0" * 20
+
+    def send_raw(params):
+        raw = bytes.fromhex(params[0][2:])
+        tx_hash = "0x" + f"{len(sent) + 1:064x}"
+        if raw[0] == 3:
+            sent[tx_hash] = ("blob", None, b"")
+        else:
+            fields = rlp.decode(raw)
+            sent[tx_hash] = ("tx", "0x" + fields[3].hex(), fields[5])
+        return tx_hash
+
+    def receipt(params):
+        kind, to, data = sent[params[0]]
+        result = {"transactionHash": params[0], "status": "0x1", "blockHash": "0x" + "ab" * 32,
+                  "blockNumber": hex(len(sent)), "contractAddress": None, "logs": []}
+        if kind == "tx" and to == "0x":
+            result["contractAddress"] = contract
+        elif kind == "tx" and data:
+            result["logs"] = [{"address": contract, "topics": [Web3.to_hex(LOG_TOPIC)], "data": "0x" + data.hex()}]
+        return result
+
+    stub_node.handlers.update({
+        "eth_chainId": lambda params: "0x539",
+        "eth_gasPrice": lambda params: "0x1",
+        "eth_blobBaseFee": lambda params: "0x1",
+        "eth_blockNumber": lambda params: hex(len(sent)),
+        "eth_getTransactionCount": lambda params: "0x0",
+        "eth_sendRawTransaction": send_raw,
+        "eth_getTransactionReceipt": receipt,
+    })
+
+    with JsonRpcClient(stub_node.url, coalesce=False) as client:
+        funder = TransactionSender(client, "0x" + "11" * 32)
+        with ReceiptWaiter(client, timeout=5, min_interval=0.05) as waiter:
+            pool = AccountPool(client, funder, waiter, size=2, funding=100, min_balance=10, top_up_interval=3600).fill()
+            sent.clear()
+            artifacts = ChainArtifacts.prepare(client, pool, waiter)
+
+            assert artifacts.contract_address == contract
+            assert sent[artifacts.deployment.tx_hash][2] == bytes.fromhex(log_emitter_bytecode()[2:])
+            assert sent[artifacts.contract_call.tx_hash][1:] == (contract, bytes.fromhex(CALL_DATA[2:]))
+            assert artifacts.log["topics"] == [Web3.to_hex(LOG_TOPIC)]
+            assert sent[artifacts.blob.tx_hash][0] == "blob"
+            assert artifacts.transfer.block_hash == "0x" + "ab" * 32
+            assert sum(isinstance(body, list) and body[0]["method"] == "eth_sendRawTransaction"
+                       for body in stub_node.requests) == 2
+
+            def no_blobs(params):
+                raise RpcError(-32601, "the method eth_blobBaseFee does not exist/is not available")
+
+            stub_node.handlers["eth_blobBaseFee"] = no_blobs
+            assert ChainArtifacts.prepare(client, pool, waiter).blob is None
+            pool.close()
+
+            # a single account can't send the blob, but doesn't wait for a second one either
+            stub_node.handlers["eth_blobBaseFee"] = lambda params: "0x1"
+            single = AccountPool(client, funder, waiter, size=1, funding=100, min_balance=10, top_up_interval=3600,
+                                 acquire_timeout=1).fill()
+            artifacts = ChainArtifacts.prepare(client, single, waiter)
+            assert artifacts.blob is None and artifacts.log["topics"] == [Web3.to_hex(LOG_TOPIC)]
+            single.close()
+
+
+def _allocate_shared_nonces(url, state_dir, results):
+    with JsonRpcClient(url) as client:
+        nonces = SharedNonceManager(client, "0x742d35Cc6634C0532925a3b844Bc454e4438f44e", state_dir)
+        results.put([nonces.allocate(2) for _ in range(10)])
+
+
+@pytest.mark.client
+def test_shared_nonce_manager_hands_out_distinct_nonces_across_processes(stub_node, tmp_path):
+    stub_node.handlers["eth_getTransactionCount"] = lambda params: "0x7"
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=_allocate_shared_nonces, args=(stub_node.url, tmp_path, results))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    allocated = sorted(nonce for _ in workers for nonce in results.get(timeout=30))
+    for worker in workers:
+        worker.join()
+
+    # 40 reservations of two nonces each, without gaps or overlaps, the node was asked only once
+    assert allocated == list(range(7, 87, 2))
+    assert [body["method"] for body in stub_node.requests] == ["eth_getTransactionCount"]
+
+    with JsonRpcClient(stub_node.url) as client:
+        nonces = SharedNonceManager(client, "0x742d35Cc6634C0532925a3b844Bc454e4438f44e", tmp_path)
+        assert nonces.allocate() == 87
+        nonces.resync()
+        assert nonces.allocate() == 7
+
+    produced = []
+    for _ in range(2):
+        assert run_once(tmp_path / "value.json", lambda: produced.append(1) or {"a": 1}) == {"a": 1}
+    assert produced == [1]
@@ -1,13 +1,12 @@
 import pytest
 from web3 import Web3
 from eth_account import Account
-from conftest import create_transaction_if_not_exist
 
 @pytest.mark.api
 @pytest.mark.proof
-def test_proof_get_transaction_by_hash(client, configuration, ensure_transaction):
+def test_proof_get_transaction_by_hash(client, configuration, chain_artifacts):
     """Test proof_getTransactionByHash returns transaction with proof."""
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
     
     # Wait for transaction receipt
     web3_client: Web3 = client.web3  # type: ignore
@@ -53,9 +52,9 @@ def test_proof_get_transaction_by_hash(client, configuration, ensure_transaction
 
 @pytest.mark.api
 @pytest.mark.proof
-def test_proof_get_transaction_receipt(client, configuration, ensure_transaction):
+def test_proof_get_transaction_receipt(client, configuration, chain_artifacts):
     """Test proof_getTransactionReceipt returns receipt with proof."""
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
     
     # Wait for transaction receipt
     web3_client: Web3 = client.web3  # type: ignore
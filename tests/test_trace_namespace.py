@@ -1,7 +1,6 @@
 import pytest
 from web3 import Web3
 import time
-from conftest import create_transaction_if_not_exist
 from eth_account import Account
 import secrets
 
@@ -56,10 +55,10 @@ def test_trace_block(client):
 
 @pytest.mark.api
 @pytest.mark.trace
-def test_trace_transaction(client, ensure_transaction):
+def test_trace_transaction(client, chain_artifacts):
     """Test trace_transaction returns traces for a given transaction."""
     # Create a transaction and get its hash
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
     
     # Call trace_transaction
     response = client.call("trace_transaction", [tx_hash])
@@ -123,7 +122,7 @@ def test_trace_call(client):
 
 @pytest.mark.api
 @pytest.mark.trace
-def test_trace_raw_transaction(client, configuration):
+def test_trace_raw_transaction(client, configuration, transaction_sender):
     """Test trace_rawTransaction returns traces for a raw transaction."""
 
     web3_client: Web3 = client.web3 # type: ignore
@@ -138,27 +137,25 @@ def test_trace_raw_transaction(client, configuration):
     private_key = "0x" + secrets.token_hex(32)
     account = Account.from_key(private_key)
 
-    # Create a funding transaction
+    # Create a funding transaction, gas, gas price and chain id are filled in by the sender
     funding_tx = {
         'to': account.address,
         'value': web3_client.to_wei(0.0001, 'ether'),
-        'gas': 21000,
-        'gasPrice': web3_client.eth.gas_price,
-        'nonce': web3_client.eth.get_transaction_count(funding_account_address),
-        'chainId': web3_client.eth.chain_id,
     }
 
-    # Sign the funding transaction (you'll need the private key of the funding account)
-    funding_account_private_key = configuration["private_key"]  # Replace with actual private key
-    signed_funding_tx = Account.sign_transaction(funding_tx, funding_account_private_key)
-
-    # Send the signed funding transaction
-    funding_tx_hash = web3_client.eth.send_raw_transaction(signed_funding_tx.raw_transaction)
+    # The nonce comes from the shared sender, other tests (and xdist workers) send from this account too
+    nonce = transaction_sender.nonces.allocate()
+    try:
+        # Sign the funding transaction with the funding account
+        raw_tx = transaction_sender.sign(funding_tx, nonce)
+        # Send the signed funding transaction
+        funding_tx_hash = web3_client.eth.send_raw_transaction(raw_tx)
+    except Exception:
+        # the nonce stays unused, every later transaction of the account would wait behind the gap
+        transaction_sender.nonces.resync()
+        raise
     # web3_client.eth.wait_for_transaction_receipt(funding_tx_hash, timeout=int(configuration["transaction_timeout"]))
     
-    # Sign transaction
-    raw_tx = signed_funding_tx.raw_transaction.hex()
-    
     # Call trace_rawTransaction
     trace_types = ["trace", "vmTrace", "stateDiff"]
     response = client.call("trace_rawTransaction", [raw_tx, trace_types])
@@ -178,10 +175,10 @@ def test_trace_raw_transaction(client, configuration):
 
 @pytest.mark.api
 @pytest.mark.trace
-def test_trace_replay_transaction(client, ensure_transaction):
+def test_trace_replay_transaction(client, chain_artifacts):
     """Test trace_replayTransaction returns traces for a transaction."""
     # Create a transaction and get its hash
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
         
     # Call trace_replayTransaction
     trace_types = ["trace", "vmTrace", "stateDiff"]
@@ -202,10 +199,10 @@ def test_trace_replay_transaction(client, ensure_transaction):
 
 @pytest.mark.api
 @pytest.mark.trace
-def test_trace_get(client, ensure_transaction):
+def test_trace_get(client, chain_artifacts):
     """Test trace_get returns trace at given position."""
     # Create a transaction and get its hash
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
     
     # Wait for transaction receipt
     web3_client: Web3 = client.web3  # type: ignore
@@ -256,10 +253,10 @@ def test_trace_get(client, ensure_transaction):
 
 @pytest.mark.api
 @pytest.mark.trace
-def test_trace_filter(client, ensure_transaction):
+def test_trace_filter(client, chain_artifacts):
     """Test trace_filter returns traces matching filter criteria."""
     # Create a transaction and get its hash
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
     
     # Wait for transaction receipt
     web3_client: Web3 = client.web3  # type: ignore
@@ -368,10 +365,10 @@ def test_trace_call_many(client):
 
 @pytest.mark.api
 @pytest.mark.trace
-def test_trace_replay_block_transactions(client, ensure_transaction):
+def test_trace_replay_block_transactions(client, chain_artifacts):
     """Test trace_replayBlockTransactions returns traces for all transactions in a block."""
     # Create a transaction and get its hash
-    tx_hash = create_transaction_if_not_exist(client, ensure_transaction)['transactions'][0]['hash']
+    tx_hash = chain_artifacts.transfer.tx_hash
     
     # Wait for transaction receipt
     web3_client: Web3 = client.web3  # type: ignore
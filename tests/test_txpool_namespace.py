@@ -23,10 +23,10 @@ def get_pool_transaction(client) -> tuple[bool, str]:
     
     return False, ""
 
-def create_transaction_for_pool(client, configuration) -> str:
+def create_transaction_for_pool(client, configuration, transaction_sender) -> str:
     """Create a transaction and return its hash without waiting for receipt."""
 
-    web3_client: Web3 = client.web3 # type: ignore
+    web3_client: Web3 = client.web3
     # Use the first account from the node as the funding account
     funding_account_address = configuration["public_key"]
     funding_balance = web3_client.eth.get_balance(funding_account_address)
@@ -38,37 +38,26 @@ def create_transaction_for_pool(client, configuration) -> str:
     private_key = "0x" + secrets.token_hex(32)
     account = Account.from_key(private_key)
 
-    # Create a funding transaction
-    funding_tx = {
+    # Send a funding transaction through the shared sender: its nonce doesn't collide with the other
+    # transactions of the funding account, still pending ones and those of other xdist workers included
+    funding_tx_hash = transaction_sender.send({
         'to': account.address,
         'value': web3_client.to_wei(0.0001, 'ether'),
-        'gas': 21000,
-        'gasPrice': web3_client.eth.gas_price,
-        'nonce': web3_client.eth.get_transaction_count(funding_account_address, 'latest'),
-        'chainId': web3_client.eth.chain_id,
-    }
-    
-    # Sign the funding transaction (you'll need the private key of the funding account)
-    funding_account_private_key = configuration["private_key"]  # Replace with actual private key
-    signed_funding_tx = Account.sign_transaction(funding_tx, funding_account_private_key)
+    })
 
-    # Send the signed funding transaction
-    funding_tx_hash = web3_client.eth.send_raw_transaction(signed_funding_tx.raw_transaction)
-    # web3_client.eth.wait_for_transaction_receipt(funding_tx_hash, timeout=int(configuration["transaction_timeout"]))
-
-    logger.info(f"Transaction hash: {funding_tx_hash.hex()}") 
-    return "0x" + funding_tx_hash.hex()
+    logger.info(f"Transaction hash: {funding_tx_hash}") 
+    return funding_tx_hash
 
 @pytest.mark.api
 @pytest.mark.txpool
-def test_txpool_status_with_pending(client, configuration):
+def test_txpool_status_with_pending(client, configuration, transaction_sender):
     """Test txpool_status shows pending transaction."""
     # Check if pool already has transactions
     has_tx, tx_hash = get_pool_transaction(client)
     
     # Create new transaction only if pool is empty
     if not has_tx:
-        tx_hash = create_transaction_for_pool(client, configuration)
+        tx_hash = create_transaction_for_pool(client, configuration, transaction_sender)
         time.sleep(1)  # Give txpool a moment to process the transaction
     
     response = client.call("txpool_status", [])
@@ -96,14 +85,14 @@ def test_txpool_status_with_pending(client, configuration):
 
 @pytest.mark.api
 @pytest.mark.txpool
-def test_txpool_content_with_pending(client, configuration):
+def test_txpool_content_with_pending(client, configuration, transaction_sender):
     """Test txpool_content shows pending transaction details."""
     # Check if pool already has transactions
     has_tx, tx_hash = get_pool_transaction(client)
     
     # Create new transaction only if pool is empty
     if not has_tx:
-        tx_hash = create_transaction_for_pool(client, configuration)
+        tx_hash = create_transaction_for_pool(client, configuration, transaction_sender)
         time.sleep(1)  # Give txpool a moment to process the transaction
     
     response = client.call("txpool_content", [])
@@ -148,14 +137,14 @@ def test_txpool_content_with_pending(client, configuration):
 
 @pytest.mark.api
 @pytest.mark.txpool
-def test_txpool_inspect_with_pending(client, configuration):
+def test_txpool_inspect_with_pending(client, configuration, transaction_sender):
     """Test txpool_inspect shows pending transaction summary."""
     # Check if pool already has transactions
     has_tx, tx_hash = get_pool_transaction(client)
     
     # Create new transaction only if pool is empty
     if not has_tx:
-        tx_hash = create_transaction_for_pool(client, configuration)
+        tx_hash = create_transaction_for_pool(client, configuration, transaction_sender)
         time.sleep(1)  # Give txpool a moment to process the transaction
     
     response = client.call("txpool_inspect", [])
@@ -0,0 +1,148 @@
+import queue
+import secrets
+import threading
+from contextlib import contextmanager
+
+from eth_account import Account
+from loguru import logger
+from web3 import Web3
+
+from utils.nonce_manager import NonceManager, TransactionSender
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_FUNDING_ETHER = 0.01
+DEFAULT_MIN_BALANCE_ETHER = 0.002
+DEFAULT_TOP_UP_INTERVAL = 15
+# seconds to wait for a free account before giving up, so a pool that ran dry fails instead of hanging
+DEFAULT_ACQUIRE_TIMEOUT = 120
+
+
+class EphemeralAccount:
+    """Throwaway account of an AccountPool, `sender` signs its transactions with local nonces"""
+
+    def __init__(self, client):
+        self.private_key = "0x" + secrets.token_hex(32)
+        self.address = Account.from_key(self.private_key).address
+        # a fresh account has sent nothing yet
+        self.sender = TransactionSender(client, self.private_key, NonceManager(client, self.address, start=0))
+
+    def send(self, transaction):
+        return self.sender.send(transaction)
+
+    def __repr__(self):
+        return f"EphemeralAccount({self.address})"
+
+
+class AccountPool:
+    """
+    Accounts funded once, in one batch from the main account, and handed out to fixtures and
+    tests that need a sender, instead of funding (and waiting for) a new account every time.
+
+    Accounts are checked out with `with pool.account() as account:` and returned afterwards,
+    transactions still pending are fine, the next user continues with the next local nonce.
+    A background thread checks all balances with one batch every `top_up_interval` seconds and
+    tops the low ones up to `funding` in one batch; accounts stay usable meanwhile.
+
+    :param funder: TransactionSender of the funded main account
+    :param receipt_waiter: ReceiptWaiter used to wait for the initial funding
+    :param acquire_timeout: default seconds acquire() waits for an account to be returned
+    """
+
+    def __init__(self, client, funder, receipt_waiter, size=DEFAULT_POOL_SIZE,
+                 funding=Web3.to_wei(DEFAULT_FUNDING_ETHER, "ether"),
+                 min_balance=Web3.to_wei(DEFAULT_MIN_BALANCE_ETHER, "ether"), top_up_interval=DEFAULT_TOP_UP_INTERVAL,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.client = client
+        self.funder = funder
+        self.receipt_waiter = receipt_waiter
+        self.size = size
+        self.funding = funding
+        self.min_balance = min_balance
+        self.top_up_interval = top_up_interval
+        self.acquire_timeout = acquire_timeout
+        self.accounts = []
+        self.top_ups = 0
+        self._available = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, client, funder, receipt_waiter, configuration):
+        return cls(
+            client, funder, receipt_waiter,
+            size=int(configuration.get("account_pool_size", DEFAULT_POOL_SIZE)),
+            funding=Web3.to_wei(float(configuration.get("account_pool_funding", DEFAULT_FUNDING_ETHER)), "ether"),
+            min_balance=Web3.to_wei(float(configuration.get("account_pool_min_balance", DEFAULT_MIN_BALANCE_ETHER)),
+                                    "ether"),
+            top_up_interval=float(configuration.get("account_pool_top_up_interval", DEFAULT_TOP_UP_INTERVAL)),
+            acquire_timeout=float(configuration.get("account_pool_acquire_timeout", DEFAULT_ACQUIRE_TIMEOUT)),
+        )
+
+    def fill(self):
+        """Create and fund the accounts, returns once all funding transactions are mined"""
+        accounts = [EphemeralAccount(self.client) for _ in range(self.size)]
+        tx_hashes = self.funder.send_many([{"to": account.address, "value": self.funding} for account in accounts])
+        logger.info(f"Funding {len(accounts)} pool accounts from {self.funder.address}")
+        for receipt in self.receipt_waiter.wait_all(tx_hashes):
+            if int(receipt["status"], 16) != 1:
+                raise ValueError(f"Funding transaction of the account pool failed: {receipt}")
+        self.accounts.extend(accounts)
+        for account in accounts:
+            self._available.put(account)
+        self._thread = threading.Thread(target=self._top_up_loop, name="account-pool", daemon=True)
+        self._thread.start()
+        return self
+
+    def acquire(self, timeout=None):
+        """
+        Check out an account, waiting for one to be returned when all are in use
+
+        :param timeout: seconds to wait, defaults to `acquire_timeout`
+        :raises TimeoutError: when none was returned within `timeout` seconds
+        """
+        timeout = timeout or self.acquire_timeout
+        try:
+            return self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"All {self.size} pool accounts are still in use after {timeout} s, "
+                               f"a larger account_pool_size may help")
+
+    def release(self, account):
+        self._available.put(account)
+
+    @contextmanager
+    def account(self, timeout=None):
+        account = self.acquire(timeout)
+        try:
+            yield account
+        finally:
+            self.release(account)
+
+    def balances(self):
+        responses = self.client.call_batch([("eth_getBalance", [account.address, "pending"])
+                                            for account in self.accounts])
+        return {account: int(response["result"], 16)
+                for account, response in zip(self.accounts, responses) if "error" not in response}
+
+    def top_up(self):
+        """Top up every account below `min_balance` back to `funding`, without waiting for inclusion"""
+        low = {account: balance for account, balance in self.balances().items() if balance < self.min_balance}
+        if not low:
+            return []
+        logger.info(f"Topping up {len(low)} pool accounts")
+        tx_hashes = self.funder.send_many([{"to": account.address, "value": self.funding - balance}
+                                           for account, balance in low.items()])
+        self.top_ups += len(tx_hashes)
+        return tx_hashes
+
+    def _top_up_loop(self):
+        while not self._stop.wait(self.top_up_interval):
+            try:
+                self.top_up()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Account pool top-up failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
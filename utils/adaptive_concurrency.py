@@ -0,0 +1,123 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+# JSON-RPC error codes that mean the node is overloaded: transport failure (client envelope) and limit exceeded
+OVERLOAD_ERROR_CODES = {-32000, -32005}
+
+
+class AimdController:
+    """
+    Additive-increase / multiplicative-decrease limit of requests in flight.
+
+    The limit grows by one after `limit` consecutive good calls (about once per round trip of
+    the whole window) and is multiplied by `backoff` when a call fails or the smoothed latency
+    exceeds `latency_tolerance` times the no-load latency (lowest latency of the last
+    `baseline_window` calls). Calls started before a decrease can't trigger another one, so a
+    single overload event shrinks the limit once.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, backoff=0.75, latency_tolerance=2.0,
+                 baseline_window=500):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.peak = initial
+        self._latencies = deque(maxlen=baseline_window)
+        self._baseline = None
+        self._smoothed = None
+        self._good = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot, returns the start time to pass to release()"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, ok=True):
+        now = time.monotonic()
+        latency = now - started
+        with self._condition:
+            self.in_flight -= 1
+            if ok:
+                self._add_latency(latency)
+            if not ok or self._smoothed > self.latency_tolerance * self._baseline:
+                if started > self._last_decrease and self.limit > self.min_limit:
+                    self.limit = max(self.min_limit, math.floor(self.limit * self.backoff))
+                    self.decreases += 1
+                    self._last_decrease = now
+                    self._good = 0
+            else:
+                self._good += 1
+                if self._good >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.increases += 1
+                    self.peak = max(self.peak, self.limit)
+                    self._good = 0
+            self._condition.notify_all()
+
+    def _add_latency(self, latency):
+        self._latencies.append(latency)
+        self._smoothed = latency if self._smoothed is None else 0.8 * self._smoothed + 0.2 * latency
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        elif len(self._latencies) % 50 == 0:
+            # let the baseline follow the node when it gets slower for good
+            self._baseline = min(self._latencies)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "peak": self.peak,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "baseline_ms": round(self._baseline * 1000, 3) if self._baseline is not None else None,
+        }
+
+
+def is_overload_error(response):
+    """Default failure test of adaptive_map: a JSON-RPC response the node failed to serve"""
+    responses = response if isinstance(response, list) else [response]
+    return any(isinstance(item, dict) and item.get("error", {}).get("code") in OVERLOAD_ERROR_CODES
+               for item in responses)
+
+
+def adaptive_map(fn, items, controller=None, is_error=is_overload_error):
+    """
+    Call fn(item) for every item from a thread pool, keeping as many calls in flight as the
+    controller allows. An exception raised by fn counts as a failure and is re-raised once
+    all calls finished, like Executor.map.
+
+    :param controller: AimdController, a fresh one by default
+    :param is_error: callable(result) telling whether a result counts as a failure
+    :return: results in the order of `items`
+    """
+    controller = controller or AimdController()
+
+    def run(item):
+        started = controller.acquire()
+        ok = False
+        try:
+            result = fn(item)
+            ok = not is_error(result)
+            return result
+        finally:
+            controller.release(started, ok)
+
+    with ThreadPoolExecutor(max_workers=controller.max_limit) as executor:
+        results = list(executor.map(run, items))
+    logger.info(f"Adaptive concurrency stats: {controller.stats()}")
+    return results
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import time
+
+import aiohttp
+from loguru import logger
+
+from utils.endpoint_pool import split_urls
+from utils.json_rpc_client import (
+    DEFAULT_MAX_BATCH_SIZE,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_TIMEOUT,
+    build_payload,
+    error_response,
+    match_batch_responses,
+    retry_after,
+)
+from utils.rate_limiter import RateLimiter
+from utils.rpc_codec import CodecError, get_codec
+from utils.rpc_logging import DEFAULT_LOG_MAX_CHARS, DEFAULT_SLOW_THRESHOLD_MS, RpcLogger
+
+DEFAULT_MAX_CONCURRENCY = 50
+
+
+class AsyncJsonRpcClient:
+    """
+    asyncio counterpart of JsonRpcClient.
+
+    Responses (including the synthetic -32000 envelope for transport errors) have the same
+    shape as JsonRpcClient.call, so tests and helpers can switch between the two freely.
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, keep_alive=True, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 pool_size=DEFAULT_POOL_MAXSIZE, pool_size_per_host=0, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 codec="auto", log_mode="all", log_max_chars=DEFAULT_LOG_MAX_CHARS,
+                 slow_threshold_ms=DEFAULT_SLOW_THRESHOLD_MS, rate_limiter=None):
+        """
+        :param url: JSON-RPC endpoint of the node
+        :param timeout: request timeout in seconds
+        :param keep_alive: reuse pooled connections between calls
+        :param max_concurrency: maximum number of requests in flight at the same time
+        :param pool_size: total number of connections in the pool
+        :param pool_size_per_host: connections per host, 0 means no per-host limit
+        :param max_batch_size: maximum number of requests sent in one JSON-RPC batch
+        :param codec: JSON codec, see JsonRpcClient
+        :param log_mode: "all" or "slow", see JsonRpcClient
+        :param log_max_chars: truncate logged bodies in "all" mode, 0 disables truncation
+        :param slow_threshold_ms: latency above which a call is logged in full in "slow" mode
+        :param rate_limiter: optional RateLimiter, see JsonRpcClient. It can be shared with a
+            JsonRpcClient so both stay within one budget
+        """
+        self.url = url
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.max_batch_size = max_batch_size
+        self.codec = get_codec(codec) if isinstance(codec, str) else codec
+        self.rpc_log = RpcLogger(log_mode, log_max_chars, slow_threshold_ms, codec=self.codec)
+        self.rate_limiter = rate_limiter
+        self._batch_ids = itertools.count(1)
+        self._session = None
+        self._semaphore = None
+
+    @classmethod
+    def from_config(cls, configuration):
+        """Create a client from the pytest.ini configuration section"""
+        return cls(
+            # Load balancing is only implemented in JsonRpcClient, use the first endpoint
+            split_urls(configuration["base_url"])[0],
+            timeout=int(configuration.get("rpc_timeout", DEFAULT_TIMEOUT)),
+            keep_alive=bool(int(configuration.get("rpc_keep_alive", 1))),
+            max_concurrency=int(configuration.get("rpc_max_concurrency", DEFAULT_MAX_CONCURRENCY)),
+            pool_size=int(configuration.get("rpc_pool_maxsize", DEFAULT_POOL_MAXSIZE)),
+            max_batch_size=int(configuration.get("rpc_max_batch_size", DEFAULT_MAX_BATCH_SIZE)),
+            codec=configuration.get("rpc_codec", "auto"),
+            log_mode=configuration.get("rpc_log_mode", "all"),
+            log_max_chars=int(configuration.get("rpc_log_max_chars", DEFAULT_LOG_MAX_CHARS)),
+            slow_threshold_ms=float(configuration.get("rpc_slow_threshold_ms", DEFAULT_SLOW_THRESHOLD_MS)),
+            rate_limiter=RateLimiter.from_config(configuration),
+        )
+
+    def _get_session(self):
+        # aiohttp sessions must be created inside the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size_per_host,
+                                             force_close=not self.keep_alive)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def call(self, method, params=None, call_id=1):
+        """Make a JSON-RPC call, waiting for a free slot if `max_concurrency` calls are in flight"""
+        payload = build_payload(method, params, call_id)
+        self.rpc_log.request(self.url, method, payload)
+        started = time.perf_counter()
+        try:
+            result = await self._post(payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CodecError) as e:
+            logger.error(f"Request failed: {e!r}")
+            result = error_response(call_id, f"Request failed: {e!r}")
+        self.rpc_log.response(self.url, method, payload, result, started)
+        return result
+
+    async def call_batch(self, calls, batch_size=None):
+        """
+        Send several JSON-RPC calls as 2.0 batch arrays. Chunks are sent concurrently.
+
+        :param calls: list of (method, params) tuples, params may be omitted or None
+        :param batch_size: maximum requests per batch, defaults to `max_batch_size`
+        :return: list of responses in the same order as `calls`
+        """
+        batch_size = batch_size or self.max_batch_size
+        payloads = [build_payload(call[0], call[1] if len(call) > 1 else None, next(self._batch_ids))
+                    for call in calls]
+        chunks = [payloads[start:start + batch_size] for start in range(0, len(payloads), batch_size)]
+        results = await asyncio.gather(*(self._send_batch_chunk(chunk) for chunk in chunks))
+        return [response for chunk_responses in results for response in chunk_responses]
+
+    async def call_many(self, calls):
+        """Send every (method, params) call as an individual request, concurrently"""
+        return await asyncio.gather(*(self.call(call[0], call[1] if len(call) > 1 else None, call_id)
+                                      for call_id, call in enumerate(calls, start=1)))
+
+    async def _send_batch_chunk(self, chunk):
+        logger.info(f"Sending batch of {len(chunk)} jsonrpc requests to {self.url}")
+        started = time.perf_counter()
+        try:
+            responses = match_batch_responses(chunk, await self._post(chunk))
+        except (aiohttp.ClientError, asyncio.TimeoutError, CodecError) as e:
+            logger.error(f"Batch request failed: {e!r}")
+            responses = [error_response(payload["id"], f"Request failed: {e!r}") for payload in chunk]
+        self.rpc_log.response(self.url, f"batch of {len(chunk)}", chunk, responses, started)
+        return responses
+
+    async def _post(self, payload):
+        session = self._get_session()
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(payload)
+        async with self._semaphore:
+            async with session.post(self.url, data=self.codec.dumps(payload)) as response:
+                if response.status == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.pause(retry_after(response.headers.get("Retry-After")))
+                response.raise_for_status()
+                body = await response.read()
+        try:
+            return self.codec.loads(body)
+        except ValueError as e:
+            raise aiohttp.ContentTypeError(response.request_info, response.history,
+                                           message=f"Invalid JSON response: {e}")
+
+    async def close(self):
+        """Release all pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,195 @@
+"""
+Record the JSON-RPC traffic of a test run and replay it without a node.
+
+A cassette is a gzip-compressed JSON lines file with one exchange per line:
+{"k": request key, "m": methods, "r": response} or {"k": ..., "m": ..., "x": transport error}.
+The key is a hash of the methods and params of the request (ids left out, they differ
+between runs), responses are stored without ids and get the ids of the replayed request.
+
+Replay serves the recorded responses of a key in recording order, so polling loops see the
+same sequence of "not yet" and final answers. Requests that can't match exactly (raw
+transactions signed with fresh random keys) get the next unused response recorded for the
+same methods.
+
+Under pytest-xdist every worker records its own cassette next to the given path
+(rpc_cassette.gw0.jsonl.gz, ...). xdist doesn't hand out the tests to the same workers in every
+run, so replay loads the given cassette together with all worker cassettes next to it.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import deque
+from pathlib import Path
+
+from loguru import logger
+
+from utils.rpc_codec import JsonCodec
+from utils.worker_coordination import worker_id
+
+DEFAULT_CASSETTE_PATH = "reports/rpc_cassette.jsonl.gz"
+
+
+class CassetteMissError(ConnectionError):
+    """The replayed run sent a request that was not recorded"""
+
+
+def worker_cassette_path(path, worker):
+    """Cassette of one xdist worker: reports/rpc_cassette.jsonl.gz -> reports/rpc_cassette.gw0.jsonl.gz"""
+    path = Path(path)
+    name, dot, suffixes = path.name.partition(".")
+    return str(path.with_name(f"{name}.{worker}{dot}{suffixes}"))
+
+
+def recorded_cassettes(path):
+    """The cassette at `path` (if any) followed by the ones recorded next to it by xdist workers"""
+    path = Path(path)
+    name, dot, suffixes = path.name.partition(".")
+    workers = sorted(str(worker_path) for worker_path in path.parent.glob(f"{name}.gw*{dot}{suffixes}"))
+    return ([str(path)] if path.exists() else []) + workers
+
+
+def request_key(payload):
+    requests_list = payload if isinstance(payload, list) else [payload]
+    canonical = json.dumps([[request["method"], request.get("params")] for request in requests_list],
+                           sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:20]
+
+
+def _methods(payload):
+    return ",".join(request["method"] for request in payload) if isinstance(payload, list) else payload["method"]
+
+
+def _strip_ids(payload, response):
+    if not isinstance(response, list):
+        return {key: value for key, value in response.items() if key != "id"}
+    # batch responses come in any order, keep them in request order
+    by_id = {item.get("id"): item for item in response}
+    return [{key: value for key, value in by_id.get(request["id"], {}).items() if key != "id"} for request in payload]
+
+
+def _with_ids(payload, response):
+    if not isinstance(payload, list):
+        return {**response, "id": payload["id"]} if isinstance(response, dict) else response
+    if not isinstance(response, list):
+        return response
+    return [{**item, "id": request["id"]} for request, item in zip(payload, response)]
+
+
+class CassetteTransport:
+    """
+    Transport wrapper recording every exchange of `transport` to `path` ("record" mode) or
+    answering from the cassette at `path` without any network ("replay" mode, `transport` unused).
+    """
+
+    supports_subscriptions = False
+
+    def __init__(self, path, mode, transport=None, codec=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}, expected record or replay")
+        self.path = path
+        self.mode = mode
+        self.transport = transport
+        self.codec = codec or (transport.codec if transport is not None else JsonCodec())
+        self.url = transport.url if transport is not None else f"cassette://{path}"
+        self._lock = threading.Lock()
+        if mode == "record":
+            if worker_id() is not None:
+                # the workers of a parallel run would overwrite each other's cassette
+                path = self.path = worker_cassette_path(path, worker_id())
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._file = gzip.open(path, "wb")
+            self.recorded = 0
+        else:
+            self._load(path)
+
+    def _load(self, path):
+        self._entries = []
+        self._by_key = {}
+        self._by_methods = {}
+        self._last_by_key = {}
+        paths = recorded_cassettes(path)
+        if not paths:
+            raise FileNotFoundError(f"No cassette recorded at {path}")
+        for cassette_path in paths:
+            with gzip.open(cassette_path, "rb") as f:
+                for line in f:
+                    entry = self.codec.loads(line)
+                    index = len(self._entries)
+                    self._entries.append(entry)
+                    self._by_key.setdefault(entry["k"], deque()).append(index)
+                    self._by_methods.setdefault(entry["m"], deque()).append(index)
+        self._used = [False] * len(self._entries)
+        self.replayed = 0
+        self.fallbacks = 0
+        logger.info(f"Loaded {len(self._entries)} recorded exchanges from {', '.join(paths)}")
+
+    def send(self, payload, timeout=None):
+        if self.mode == "record":
+            return self._record(payload, timeout)
+        return self._replay(payload)
+
+    def _record(self, payload, timeout):
+        entry = {"k": request_key(payload), "m": _methods(payload)}
+        try:
+            response = self.transport.send(payload, timeout)
+        except OSError as e:
+            entry["x"] = str(e)
+            self._write(entry)
+            raise
+        entry["r"] = _strip_ids(payload, response)
+        self._write(entry)
+        return response
+
+    def _write(self, entry):
+        line = self.codec.dumps(entry) + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self.recorded += 1
+
+    def _replay(self, payload):
+        key = request_key(payload)
+        with self._lock:
+            index = self._next_unused(self._by_key.get(key))
+            if index is None:
+                index = self._next_unused(self._by_methods.get(_methods(payload)))
+                if index is not None:
+                    self.fallbacks += 1
+                    logger.debug(f"No exact recording of {_methods(payload)} request, using the next recorded one")
+            if index is None:
+                # polled more often than during recording: repeat the last answer
+                index = self._last_by_key.get(key)
+            if index is None:
+                raise CassetteMissError(f"{_methods(payload)} request not found in cassette {self.path}")
+            self._used[index] = True
+            self._last_by_key[key] = index
+            self.replayed += 1
+        entry = self._entries[index]
+        if "x" in entry:
+            raise ConnectionError(entry["x"])
+        return _with_ids(payload, entry["r"])
+
+    def _next_unused(self, indexes):
+        while indexes:
+            index = indexes.popleft()
+            if not self._used[index]:
+                return index
+        return None
+
+    def wire_sizes(self):
+        if self.mode == "record":
+            return self.transport.wire_sizes()
+        return (0, 0)
+
+    def stats(self):
+        if self.mode == "record":
+            return {"recorded": self.recorded}
+        return {"replayed": self.replayed, "fallbacks": self.fallbacks,
+                "unused": self._used.count(False)}
+
+    def close(self):
+        if self.mode == "record":
+            with self._lock:
+                self._file.close()
+            self.transport.close()
+        logger.info(f"Cassette {self.path} ({self.mode}): {self.stats()}")
@@ -0,0 +1,173 @@
+"""
+One canonical set of transactions sent once per test session: a plain transfer, a contract
+deployment, a call of that contract emitting a log and (where the chain supports blobs) a blob
+transaction. Tests read their hashes, receipts and blocks instead of sending and waiting for
+transactions of their own.
+"""
+from contextlib import nullcontext
+
+from eth_abi import encode
+from loguru import logger
+from web3 import Web3
+
+TRANSFER_RECIPIENT = "0x742d35Cc6634C0532925a3b844Bc454e4438f44e"
+BLOB_RECIPIENT = "0x9813a4Db195f413B34840386D605B2d99A69016d"
+# topic of the log emitted by the deployed contract on every call, the log data is the calldata
+LOG_TOPIC = Web3.keccak(text="ChainArtifact(bytes)")
+CALL_DATA = "0x" + b"chain artifacts".hex()
+BLOB_FIELD_ELEMENTS = 4096
+
+
+def log_emitter_bytecode(topic=LOG_TOPIC):
+    """
+    Init code of a contract without Solidity source: every call emits LOG1(topic) with the
+    calldata as data. contracts/HelloWorld.bin has no events, so it can't serve for logs.
+    """
+    runtime = (
+        "3660006000"  # CALLDATASIZE PUSH1 0 PUSH1 0
+        "37"  # CALLDATACOPY(0, 0, size)
+        "7f" + bytes(topic).hex() +  # PUSH32 topic
+        "366000"  # CALLDATASIZE PUSH1 0
+        "a1"  # LOG1(0, size, topic)
+        "00"  # STOP
+    )
+    size = len(runtime) // 2
+    # CODECOPY the runtime behind these 12 bytes to memory and RETURN it
+    init = f"60{size:02x}600c600039" f"60{size:02x}6000f3"
+    return "0x" + init + runtime
+
+
+def blob_data(text="<( o.O )>"):
+    encoded = encode(["string"], [text])
+    return b"\x00" * (32 * BLOB_FIELD_ELEMENTS - len(encoded)) + encoded
+
+
+class ChainArtifact:
+    """A mined transaction with its receipt and (lazily fetched) block"""
+
+    def __init__(self, client, name, tx_hash, receipt):
+        self.client = client
+        self.name = name
+        self.tx_hash = tx_hash
+        self.receipt = receipt
+        self._block = None
+
+    @property
+    def block_hash(self):
+        return self.receipt["blockHash"]
+
+    @property
+    def block_number(self):
+        return int(self.receipt["blockNumber"], 16)
+
+    @property
+    def block(self):
+        """LazyBlock containing the transaction"""
+        if self._block is None:
+            self._block = self.client.lazy_block(self.block_hash)
+        return self._block
+
+    def __repr__(self):
+        return f"ChainArtifact({self.name}, {self.tx_hash}, block={self.block_number})"
+
+
+class ChainArtifacts:
+    """
+    Hashes, receipts and blocks of the session's canonical transactions, see prepare().
+
+    :param blob: None when the chain doesn't take blob transactions
+    """
+
+    def __init__(self, transfer, deployment, contract_call, blob=None):
+        self.transfer = transfer
+        self.deployment = deployment
+        self.contract_call = contract_call
+        self.blob = blob
+
+    @property
+    def contract_address(self):
+        return self.deployment.receipt["contractAddress"]
+
+    @property
+    def log(self):
+        """The log emitted by the contract call"""
+        return self.contract_call.receipt["logs"][0]
+
+    def all(self):
+        return [artifact for artifact in (self.transfer, self.deployment, self.contract_call, self.blob)
+                if artifact is not None]
+
+    def to_dict(self):
+        return {artifact.name: {"tx_hash": artifact.tx_hash, "receipt": artifact.receipt} for artifact in self.all()}
+
+    @classmethod
+    def from_dict(cls, client, data):
+        """Artifacts prepared by another process, from their to_dict()"""
+        artifacts = {name: ChainArtifact(client, name, item["tx_hash"], item["receipt"]) for name, item in data.items()}
+        return cls(artifacts["transfer"], artifacts["deployment"], artifacts["contract_call"], artifacts.get("blob"))
+
+    @classmethod
+    def prepare(cls, client, account_pool, receipt_waiter):
+        """
+        Send the transfer and the deployment in one batch (and the blob transaction from a second
+        account, nodes don't take blob and regular transactions of one sender), then call the
+        deployed contract. Takes two blocks. A pool of one account gives no blob artifact.
+
+        :raises ValueError: when one of the transactions failed
+        """
+        if account_pool.size < 2:
+            logger.warning("The blob transaction needs a second pool account, account_pool_size is 1: no blob artifact")
+        blob_account_context = account_pool.account() if account_pool.size >= 2 else nullcontext()
+        with account_pool.account() as account, blob_account_context as blob_account:
+            transfer_hash, deployment_hash = account.sender.send_many([
+                {"to": Web3.to_checksum_address(TRANSFER_RECIPIENT), "value": Web3.to_wei(0.00001, "ether")},
+                {"data": log_emitter_bytecode(), "gas": 200000},
+            ])
+            blob_hash = cls._send_blob(client, blob_account.sender) if blob_account is not None else None
+            transfer, deployment = receipt_waiter.wait_all([transfer_hash, deployment_hash])
+            if int(deployment["status"], 16) != 1:
+                raise ValueError(f"Deployment of the chain artifacts contract failed: {deployment}")
+            contract = Web3.to_checksum_address(deployment["contractAddress"])
+            call_hash = account.send({"to": contract, "data": CALL_DATA, "gas": 100000})
+            call = receipt_waiter.wait(call_hash)
+            blob = None
+            if blob_hash is not None:
+                try:
+                    blob = receipt_waiter.wait(blob_hash)
+                except TimeoutError as e:
+                    logger.warning(f"Blob transaction not mined, blob artifact unavailable: {e}")
+
+        artifacts = cls(
+            ChainArtifact(client, "transfer", transfer_hash, transfer),
+            ChainArtifact(client, "deployment", deployment_hash, deployment),
+            ChainArtifact(client, "contract_call", call_hash, call),
+            ChainArtifact(client, "blob", blob_hash, blob) if blob is not None else None,
+        )
+        for artifact in artifacts.all():
+            if int(artifact.receipt["status"], 16) != 1:
+                raise ValueError(f"Transaction {artifact.name} of the chain artifacts failed: {artifact.receipt}")
+        if not call["logs"]:
+            raise ValueError(f"Contract call {call_hash} emitted no log: {call}")
+        logger.info(f"Chain artifacts ready: {artifacts.all()}")
+        return artifacts
+
+    @staticmethod
+    def _send_blob(client, sender):
+        """Submit the blob transaction, None when the chain doesn't support blobs"""
+        response = client.call("eth_blobBaseFee")
+        if "error" in response:
+            logger.warning(f"eth_blobBaseFee failed, no blob artifact: {response['error']}")
+            return None
+        gas_price = sender.gas_price()
+        try:
+            return sender.send({
+                "type": 3,
+                "to": Web3.to_checksum_address(BLOB_RECIPIENT),
+                "value": 0,
+                "maxFeePerGas": 2 * gas_price,
+                "maxPriorityFeePerGas": gas_price,
+                "maxFeePerBlobGas": max(2 * int(response["result"], 16), Web3.to_wei(1, "gwei")),
+            }, blobs=[blob_data()])
+        except ValueError as e:
+            logger.warning(f"Blob transaction rejected, no blob artifact: {e}")
+            return None
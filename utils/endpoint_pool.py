@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from loguru import logger
+
+from utils.rpc_methods import is_read_only
+
+DEFAULT_EJECT_AFTER = 3
+DEFAULT_EJECT_SECONDS = 30
+DEFAULT_HEDGE_MIN_DELAY_MS = 20
+
+
+def split_urls(url):
+    """`base_url` may list several endpoints of the same network separated by commas"""
+    urls = [part.strip() for part in url.split(",")] if isinstance(url, str) else list(url)
+    return [part for part in urls if part]
+
+
+class Endpoint:
+    """Health and observed latency of one node behind an EndpointPool"""
+
+    # latency samples kept for the p95 estimate
+    window = 200
+    # samples needed before the p95 is trusted for hedging
+    min_samples = 20
+    ewma_alpha = 0.2
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.url = transport.url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.ewma = None
+        self._samples = deque(maxlen=self.window)
+
+    def record_success(self, elapsed):
+        self.consecutive_failures = 0
+        self.ewma = elapsed if self.ewma is None else self.ewma + self.ewma_alpha * (elapsed - self.ewma)
+        self._samples.append(elapsed)
+
+    def record_failure(self, eject_after, eject_seconds):
+        """Return True when this failure ejects the endpoint"""
+        self.failures += 1
+        self.consecutive_failures += 1
+        # After an ejection the endpoint gets a single trial request, another failure ejects it again
+        if self.consecutive_failures < eject_after:
+            return False
+        self.ejections += 1
+        self.ejected_until = time.monotonic() + eject_seconds
+        return True
+
+    def is_available(self, now):
+        return now >= self.ejected_until
+
+    def score(self):
+        # Endpoints without samples yet score 0 so they get probed first
+        return (self.ewma or 0.0) * (1 + self.in_flight)
+
+    def p95(self):
+        if len(self._samples) < self.min_samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def stats(self):
+        p95 = self.p95()
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class EndpointPool:
+    """
+    Transport spreading calls over several nodes of the same network.
+
+    Each call goes to the available endpoint with the lowest latency EWMA weighted by its calls
+    in flight. Transport failures are counted per endpoint: after `eject_after` consecutive ones
+    the endpoint is skipped for `eject_seconds`. Read-only calls fail over to the next endpoint
+    and, with `hedge`, are also sent to the second best endpoint when the first one has not
+    answered within its observed p95 latency; the first successful response wins.
+    """
+
+    supports_subscriptions = False
+
+    def __init__(self, transports, hedge=False, hedge_min_delay_ms=DEFAULT_HEDGE_MIN_DELAY_MS,
+                 eject_after=DEFAULT_EJECT_AFTER, eject_seconds=DEFAULT_EJECT_SECONDS, max_workers=32):
+        self.endpoints = [Endpoint(transport) for transport in transports]
+        self.url = ",".join(endpoint.url for endpoint in self.endpoints)
+        self.codec = transports[0].codec
+        self.hedge_min_delay = hedge_min_delay_ms / 1000
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="rpc-hedge") if hedge else None
+
+    def send(self, payload, timeout=None):
+        ranked = self._ranked()
+        if not _is_read_only(payload):
+            # Writes are never repeated on another node
+            response, self._local.sizes = self._send_to(ranked[0], payload, timeout)
+            return response
+        if self._executor is not None and len(ranked) > 1:
+            response, self._local.sizes = self._send_hedged(payload, ranked, timeout)
+            return response
+        error = None
+        for endpoint in ranked:
+            try:
+                response, self._local.sizes = self._send_to(endpoint, payload, timeout)
+                return response
+            except OSError as e:
+                error = e
+                logger.warning(f"Request to {endpoint.url} failed: {e}")
+        raise error
+
+    def wire_sizes(self):
+        """(bytes sent, bytes received) of the last send() made by the calling thread"""
+        return getattr(self._local, "sizes", (0, 0))
+
+    def send_stream(self, payload, chunk_size=1 << 16):
+        endpoint = self._ranked()[0]
+        if not hasattr(endpoint.transport, "send_stream"):
+            yield self.codec.dumps(self._send_to(endpoint, payload)[0])
+            return
+        # Only the time to the first chunk is comparable with regular calls
+        with self._lock:
+            endpoint.requests += 1
+        yield from endpoint.transport.send_stream(payload, chunk_size)
+
+    def stats(self):
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+    def close(self):
+        logger.info(f"Endpoint pool stats: {self.stats()}")
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        for endpoint in self.endpoints:
+            endpoint.transport.close()
+
+    def _ranked(self):
+        now = time.monotonic()
+        with self._lock:
+            available = [endpoint for endpoint in self.endpoints if endpoint.is_available(now)]
+            if not available:
+                # Everything is ejected: try the endpoint coming back first rather than failing outright
+                available = [min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)]
+            return sorted(available, key=Endpoint.score)
+
+    def _send_to(self, endpoint, payload, timeout=None):
+        """Return the response and the (sent, received) byte counts of the exchange"""
+        with self._lock:
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+        started = time.perf_counter()
+        try:
+            response = endpoint.transport.send(payload, timeout)
+        except OSError:
+            with self._lock:
+                endpoint.in_flight -= 1
+                ejected = endpoint.record_failure(self.eject_after, self.eject_seconds)
+            if ejected:
+                logger.warning(f"Ejecting {endpoint.url} for {self.eject_seconds} s after "
+                               f"{endpoint.consecutive_failures} consecutive failures")
+            raise
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.record_success(time.perf_counter() - started)
+        return response, endpoint.transport.wire_sizes()
+
+    def _send_hedged(self, payload, ranked, timeout):
+        remaining = iter(ranked)
+        primary = next(remaining)
+        first = self._executor.submit(self._send_to, primary, payload, timeout)
+        pending = {first}
+        p95 = primary.p95()
+        # Until the p95 is known there is no telling what "slow" means, only fail over
+        hedged = p95 is None
+        hedge_delay = max(p95 or 0.0, self.hedge_min_delay)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged else hedge_delay, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                backup = next(remaining, None)
+                if backup is not None:
+                    logger.debug(f"No response from {primary.url} within {hedge_delay * 1000:.0f} ms, "
+                                 f"hedging to {backup.url}")
+                    with self._lock:
+                        self.hedges += 1
+                    pending.add(self._executor.submit(self._send_to, backup, payload, timeout))
+                continue
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+                logger.warning(f"Request failed: {error}")
+            if not pending:
+                endpoint = next(remaining, None)
+                if endpoint is not None:
+                    pending.add(self._executor.submit(self._send_to, endpoint, payload, timeout))
+        raise error
+
+
+def _is_read_only(payload):
+    if isinstance(payload, list):
+        return all(is_read_only(request["method"]) for request in payload)
+    return is_read_only(payload["method"])
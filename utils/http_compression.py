@@ -0,0 +1,44 @@
+import gzip
+
+try:
+    import zstandard
+except ImportError:  # optional, zstd is only negotiated when installed
+    zstandard = None  # type: ignore[assignment, unused-ignore]
+
+# Request bodies smaller than this are sent as is, compressing them costs more than it saves
+DEFAULT_COMPRESS_MIN_BYTES = 16 * 1024
+REQUEST_COMPRESSIONS = ("gzip", "zstd")
+
+
+def accept_encoding():
+    """Accept-Encoding header value with the encodings the HTTP stack can decode"""
+    return "zstd, gzip, deflate" if zstandard is not None else "gzip, deflate"
+
+
+def check_request_compression(encoding):
+    """Validate the configured request body encoding, "" / "none" disables compression"""
+    if encoding in (None, "", "none"):
+        return None
+    if encoding not in REQUEST_COMPRESSIONS:
+        raise ValueError(f"Unknown request compression: {encoding}, expected one of {', '.join(REQUEST_COMPRESSIONS)}")
+    if encoding == "zstd" and zstandard is None:
+        raise ValueError("zstd request compression requested but zstandard is not installed")
+    return encoding
+
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        # Level 5 is close to the best ratio for JSON at a fraction of the cost of level 9
+        return gzip.compress(body, compresslevel=5)
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+def encode_body(body, encoding, min_bytes=DEFAULT_COMPRESS_MIN_BYTES):
+    """
+    Compress a request body of at least `min_bytes` (large raw transactions and batches)
+
+    :return: (body, extra headers)
+    """
+    if encoding is None or len(body) < min_bytes:
+        return body, None
+    return compress(body, encoding), {"Content-Encoding": encoding}
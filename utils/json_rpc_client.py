@@ -1,68 +1,602 @@
+import contextlib
+import copy
+import itertools
+import json
+import time
+from urllib.parse import urlparse
+
 import requests
 from loguru import logger
 from web3 import Web3
+from web3._utils.encoding import FriendlyJsonSerde, Web3JsonEncoder
+from web3.providers.base import JSONBaseProvider
 
-class JsonRpcClient:
-    def __init__(self, url):
-        self.url = url
-        
-        # Configure Web3 provider with proper connection handling for macOS issues
-        request_kwargs = {
-            "timeout": 30,
-            "headers": {
-                "Content-Type": "application/json",
-                "Connection": "close"  # Crucial for macOS connection issues
-            }
-        }
-        
-        # Create the Web3 provider with explicit connection closing
-        self.web3 = Web3(Web3.HTTPProvider(url, request_kwargs=request_kwargs))
-
-    def call(self, method, params=None, call_id=1):
-        """Make a direct JSON-RPC call with proper connection handling"""
-        payload = {
-            "jsonrpc": "2.0",
-            "method": method,
-            "params": params if params is not None else [],
-            "id": call_id
+from utils.adaptive_concurrency import AimdController, adaptive_map
+from utils.endpoint_pool import (
+    DEFAULT_EJECT_AFTER,
+    DEFAULT_EJECT_SECONDS,
+    DEFAULT_HEDGE_MIN_DELAY_MS,
+    EndpointPool,
+    split_urls,
+)
+from utils.http_compression import DEFAULT_COMPRESS_MIN_BYTES, check_request_compression
+from utils.lazy_block import LazyBlock
+from utils.priority_lanes import PriorityLanes
+from utils.rate_limiter import RateLimiter
+from utils.rpc_cache import (
+    DEFAULT_CACHE_MAX_BYTES,
+    DEFAULT_HEAD_CACHE_TTL,
+    HeadScopedCache,
+    ResponseCache,
+    is_cacheable,
+    might_be_cached,
+)
+from utils.rpc_codec import CodecError, JsonStreamParser, get_codec
+from utils.rpc_logging import DEFAULT_LOG_MAX_CHARS, DEFAULT_SLOW_THRESHOLD_MS, RpcLogger
+from utils.rpc_methods import is_read_only
+from utils.rpc_metrics import RpcMetrics
+from utils.rpc_policy import RequestPolicy
+from utils.rpc_types import decode_result
+from utils.single_flight import SingleFlight
+from utils.transports import Http2Transport, HttpTransport, IpcTransport, Subscription, WebSocketTransport
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 20
+# Nethermind accepts up to 1024 requests per batch by default (JsonRpc.MaxBatchSize)
+DEFAULT_MAX_BATCH_SIZE = 100
+# how often the finalized block number is refreshed for the response cache
+FINALIZED_REFRESH_INTERVAL = 12
+
+
+def build_payload(method, params=None, call_id=1):
+    return {
+        "jsonrpc": "2.0",
+        "method": method,
+        "params": params if params is not None else [],
+        "id": call_id
+    }
+
+
+def error_response(call_id, message, code=-32000):
+    """Build a JSON-RPC error envelope, used to report transport failures like node errors"""
+    return {
+        "jsonrpc": "2.0",
+        "id": call_id,
+        "error": {
+            "code": code,
+            "message": message
         }
-        logger.info(f"Sending {method} jsonrpc request to {self.url} with payload:\n {payload}")
-        
-        # Create a fresh session for each request
-        session = None
-        try:
-            session = requests.Session()
-            session.headers.update({
-                "Content-Type": "application/json",
-                "Connection": "close"  # Critical for macOS
-            })
-            
-            # Make the request with an explicit timeout
-            response = session.post(
-                self.url, 
-                json=payload, 
-                timeout=30
+    }
+
+
+def retry_after(value, default=1.0):
+    """Seconds of a Retry-After header, `default` when missing or given as an HTTP date"""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def match_batch_responses(chunk, result):
+    """Map a batch response back to the request payloads in `chunk`, in request order"""
+    if not isinstance(result, list):
+        # Nodes answer with a single error object when the whole batch is rejected (e.g. too large)
+        logger.error(f"Batch request rejected: {result}")
+        error = result.get("error", {"code": -32000, "message": f"Unexpected batch response: {result}"})
+        return [{"jsonrpc": "2.0", "id": payload["id"], "error": error} for payload in chunk]
+
+    # Responses may come back in any order, match them to requests by id
+    by_id = {response.get("id"): response for response in result if isinstance(response, dict)}
+    logger.info(f"Batch response: {len(by_id)} of {len(chunk)} responses received")
+    return [by_id.get(payload["id"]) or error_response(payload["id"], "No response for request in batch")
+            for payload in chunk]
+
+
+class ClientProvider(JSONBaseProvider):
+    """Web3 provider that sends every request through a JsonRpcClient, so web3 shares its transport"""
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def make_request(self, method, params):
+        return self.client.call(method, self._encode_params(params), call_id=next(self.request_counter), typed=False)
+
+    def make_batch_request(self, requests):
+        return self.client.call_batch([(method, self._encode_params(params)) for method, params in requests],
+                                      typed=False)
+
+    @staticmethod
+    def _encode_params(params):
+        # web3 may pass HexBytes, AttributeDicts etc., normalize them to plain JSON values
+        return json.loads(FriendlyJsonSerde().json_encode(params or [], Web3JsonEncoder))
+
+
+class JsonRpcClient:
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, keep_alive=True,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 pool_block=False, max_batch_size=DEFAULT_MAX_BATCH_SIZE, cache=None, head_cache=None,
+                 coalesce=True, codec="auto", log_mode="all", log_max_chars=DEFAULT_LOG_MAX_CHARS,
+                 slow_threshold_ms=DEFAULT_SLOW_THRESHOLD_MS, hedge=False,
+                 hedge_min_delay_ms=DEFAULT_HEDGE_MIN_DELAY_MS, eject_after=DEFAULT_EJECT_AFTER,
+                 eject_seconds=DEFAULT_EJECT_SECONDS, policy=None, connect_timeout=None,
+                 metrics=None, typed=False, http2=False, http2_prior_knowledge=False, request_compression=None,
+                 compress_min_bytes=DEFAULT_COMPRESS_MIN_BYTES, rate_limiter=None, lanes=None,
+                 transport=None):
+        """
+        :param url: JSON-RPC endpoint of the node: http(s)://, ws(s):// or the path of the
+            node's IPC socket (plain path or ipc:///path/to/node.ipc). Several endpoints of the
+            same network can be given as a list or a comma-separated string, calls are then
+            balanced between them by an EndpointPool
+        :param timeout: request timeout in seconds
+        :param keep_alive: reuse pooled HTTP connections between calls. Set to False to send
+            `Connection: close` with every request (workaround for macOS connection issues)
+        :param pool_connections: number of per-host HTTP connection pools to keep
+        :param pool_maxsize: maximum number of HTTP connections kept per host
+        :param pool_block: block when all connections to a host are busy instead of
+            opening a throwaway connection above `pool_maxsize`
+        :param max_batch_size: maximum number of requests sent in one JSON-RPC batch
+        :param cache: optional ResponseCache for results that can't change any more
+            (lookups by block hash, finalized block number or finalized transaction)
+        :param head_cache: optional HeadScopedCache for "latest" state, gas price, chain id, ...
+            On WebSocket/IPC endpoints it follows newHeads, otherwise it re-checks the head after its ttl
+        :param coalesce: send identical read-only calls made at the same time (e.g. by many Locust
+            users or parallel fixtures) only once and share the response
+        :param codec: JSON codec for requests and responses: "auto" (orjson or msgspec when
+            installed, else the standard library), "orjson", "msgspec" or "json"
+        :param log_mode: "all" logs every request and response, "slow" logs full bodies only for
+            calls slower than `slow_threshold_ms` or returning an error (see RpcLogger)
+        :param log_max_chars: truncate logged bodies in "all" mode, 0 disables truncation
+        :param slow_threshold_ms: latency above which a call is logged in full in "slow" mode
+        :param hedge: with several endpoints, also send a read-only call to the second best endpoint
+            when the first one is slower than its p95 latency (but at least `hedge_min_delay_ms`)
+        :param eject_after: consecutive transport failures after which an endpoint is skipped
+        :param eject_seconds: how long an ejected endpoint is skipped
+        :param policy: optional RequestPolicy with per-method timeouts, retries of idempotent calls
+            and a circuit breaker that fails calls fast while the node is down
+        :param connect_timeout: HTTP connect timeout in seconds, defaults to `timeout`
+        :param metrics: optional RpcMetrics recording latency, bytes and errors per method
+        :param typed: return blocks, transactions, receipts and logs as compact Block/Transaction/
+            Receipt/Log objects (utils/rpc_types.py) instead of dicts of hex strings
+        :param http2: send HTTP calls over HTTP/2 (requires httpx[http2]), concurrent calls then share
+            one multiplexed connection per endpoint instead of a pool of connections
+        :param http2_prior_knowledge: speak HTTP/2 to http:// endpoints without negotiating it (h2c),
+            without it HTTP/2 is only used on https:// endpoints
+        :param request_compression: "gzip" or "zstd" to compress request bodies of at least
+            `compress_min_bytes` (raw transactions, large batches); the node must accept Content-Encoding.
+            Compressed responses (gzip, and zstd when zstandard is installed) are always accepted
+        :param rate_limiter: optional RateLimiter with the global and per-method request budgets;
+            a 429 answer holds back all requests for its Retry-After
+        :param lanes: optional PriorityLanes limiting the concurrency (and setting the timeout) of
+            state reads, tracing and submissions separately, so cheap calls don't queue behind traces
+        :param transport: use this transport (e.g. a CassetteTransport replaying a recorded run)
+            instead of connecting to `url`
+        """
+        urls = split_urls(url)
+        self.url = ",".join(urls)
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.policy = policy
+        self.rate_limiter = rate_limiter
+        self.lanes = lanes
+        self.metrics = metrics
+        self.typed = typed
+        self.http2 = http2
+        self.http2_prior_knowledge = http2_prior_knowledge
+        self.request_compression = check_request_compression(request_compression)
+        self.compress_min_bytes = compress_min_bytes
+        self.max_batch_size = max_batch_size
+        self.codec = get_codec(codec) if isinstance(codec, str) else codec
+        self.rpc_log = RpcLogger(log_mode, log_max_chars, slow_threshold_ms, codec=self.codec)
+        self._batch_ids = itertools.count(1)
+        self.cache = cache
+        self.head_cache = head_cache
+        self._heads = None
+        self._in_flight = SingleFlight() if coalesce else None
+        self._cache_namespace = None
+        self._finalized_number = None
+        self._finalized_checked_at = 0.0
+        transports = [transport] if transport is not None else [
+            self._create_transport(endpoint_url, pool_connections, pool_maxsize, pool_block) for endpoint_url in urls]
+        if len(transports) == 1:
+            self.transport = transports[0]
+        else:
+            self.transport = EndpointPool(transports, hedge=hedge, hedge_min_delay_ms=hedge_min_delay_ms,
+                                          eject_after=eject_after, eject_seconds=eject_seconds)
+
+        # Web3 goes through this client, so both paths share the same connection(s)
+        self.web3 = Web3(ClientProvider(self))
+
+    @classmethod
+    def from_config(cls, configuration, transport=None):
+        """
+        Create a client from the pytest.ini configuration section
+
+        :param transport: optional transport replacing the connection to `base_url`
+        """
+        cache = None
+        if bool(int(configuration.get("rpc_cache", 0))):
+            cache = ResponseCache(
+                max_bytes=int(configuration.get("rpc_cache_max_mb", DEFAULT_CACHE_MAX_BYTES >> 20)) << 20,
+                path=configuration.get("rpc_cache_path") or None,
             )
-            response.raise_for_status()
-            result = response.json()
-            logger.info("Response: {}", result)
+        head_cache = None
+        if bool(int(configuration.get("rpc_head_cache", 0))):
+            head_cache = HeadScopedCache(ttl=float(configuration.get("rpc_head_cache_ttl", DEFAULT_HEAD_CACHE_TTL)))
+        return cls(
+            configuration["base_url"],
+            timeout=int(configuration.get("rpc_timeout", DEFAULT_TIMEOUT)),
+            keep_alive=bool(int(configuration.get("rpc_keep_alive", 1))),
+            pool_connections=int(configuration.get("rpc_pool_connections", DEFAULT_POOL_CONNECTIONS)),
+            pool_maxsize=int(configuration.get("rpc_pool_maxsize", DEFAULT_POOL_MAXSIZE)),
+            pool_block=bool(int(configuration.get("rpc_pool_block", 0))),
+            max_batch_size=int(configuration.get("rpc_max_batch_size", DEFAULT_MAX_BATCH_SIZE)),
+            cache=cache,
+            head_cache=head_cache,
+            coalesce=bool(int(configuration.get("rpc_coalesce", 1))),
+            codec=configuration.get("rpc_codec", "auto"),
+            log_mode=configuration.get("rpc_log_mode", "all"),
+            log_max_chars=int(configuration.get("rpc_log_max_chars", DEFAULT_LOG_MAX_CHARS)),
+            slow_threshold_ms=float(configuration.get("rpc_slow_threshold_ms", DEFAULT_SLOW_THRESHOLD_MS)),
+            hedge=bool(int(configuration.get("rpc_hedge", 0))),
+            hedge_min_delay_ms=float(configuration.get("rpc_hedge_min_delay_ms", DEFAULT_HEDGE_MIN_DELAY_MS)),
+            eject_after=int(configuration.get("rpc_eject_after", DEFAULT_EJECT_AFTER)),
+            eject_seconds=float(configuration.get("rpc_eject_seconds", DEFAULT_EJECT_SECONDS)),
+            policy=RequestPolicy.from_config(configuration),
+            connect_timeout=float(configuration.get("rpc_connect_timeout", 0)) or None,
+            metrics=RpcMetrics() if bool(int(configuration.get("rpc_metrics", 1))) else None,
+            typed=bool(int(configuration.get("rpc_typed_results", 0))),
+            http2=bool(int(configuration.get("rpc_http2", 0))),
+            http2_prior_knowledge=bool(int(configuration.get("rpc_http2_prior_knowledge", 0))),
+            request_compression=configuration.get("rpc_request_compression", "none"),
+            compress_min_bytes=int(configuration.get("rpc_compress_min_bytes", DEFAULT_COMPRESS_MIN_BYTES)),
+            rate_limiter=RateLimiter.from_config(configuration),
+            lanes=PriorityLanes.from_config(configuration),
+            transport=transport,
+        )
+
+    def _create_transport(self, url, pool_connections, pool_maxsize, pool_block):
+        parsed = urlparse(url)
+        if parsed.scheme in ("ws", "wss"):
+            return WebSocketTransport(url, self.timeout, codec=self.codec)
+        if parsed.scheme == "ipc":
+            return IpcTransport(parsed.path, self.timeout, codec=self.codec)
+        if parsed.scheme == "":
+            return IpcTransport(url, self.timeout, codec=self.codec)
+        if self.http2:
+            return Http2Transport(url, self.timeout, codec=self.codec, connect_timeout=self.connect_timeout,
+                                  compression=self.request_compression, compress_min_bytes=self.compress_min_bytes,
+                                  max_connections=pool_maxsize, prior_knowledge=self.http2_prior_knowledge)
+        return HttpTransport(url, self.timeout, keep_alive=self.keep_alive, pool_connections=pool_connections,
+                             pool_maxsize=pool_maxsize, pool_block=pool_block, codec=self.codec,
+                             connect_timeout=self.connect_timeout, compression=self.request_compression,
+                             compress_min_bytes=self.compress_min_bytes)
+
+    def call(self, method, params=None, call_id=1, typed=None):
+        """
+        Make a direct JSON-RPC call over the client transport
+
+        :param typed: override the client `typed` mode for this call
+        """
+        return self._typed_response(method, self._call(method, params, call_id), typed)
+
+    def _call(self, method, params, call_id):
+        cached = self._cached_result(method, params)
+        if cached is not None:
+            logger.debug(f"Cache hit for {method} {params}")
+            return {"jsonrpc": "2.0", "id": call_id, "result": cached}
+        cache_key = self._cache_key(method, params)
+
+        payload = build_payload(method, params, call_id)
+        self.rpc_log.request(self.url, method, payload)
+        started = time.perf_counter()
+
+        try:
+            if self._in_flight is not None and is_read_only(method):
+                result, leader = self._in_flight.do(ResponseCache.make_key("", method, params),
+                                                    lambda: self._send(payload))
+                if not leader:
+                    # Each waiter gets its own copy with its own id
+                    logger.debug(f"Coalesced {method} with an identical call in flight")
+                    return {**copy.deepcopy(result), "id": call_id}
+            else:
+                result = self._send(payload)
+            self.rpc_log.response(self.url, method, payload, result, started)
+            self._cache_result(cache_key, method, params, result)
             return result
-            
-        except requests.RequestException as e:
+
+        except (OSError, CodecError) as e:
             logger.error(f"Request failed: {e}")
             # Return a proper JSON-RPC error response
-            return {
-                "jsonrpc": "2.0",
-                "id": call_id,
-                "error": {
-                    "code": -32000,
-                    "message": f"Request failed: {str(e)}"
-                }
-            }
+            response = error_response(call_id, f"Request failed: {str(e)}")
+            self.rpc_log.response(self.url, method, payload, response, started)
+            return response
+
+    def call_batch(self, calls, batch_size=None, typed=None):
+        """
+        Send several JSON-RPC calls as 2.0 batch arrays.
+
+        :param calls: list of (method, params) tuples, params may be omitted or None
+        :param batch_size: maximum requests per batch, defaults to `max_batch_size`
+        :param typed: override the client `typed` mode for these calls
+        :return: list of responses in the same order as `calls`
+        """
+        batch_size = batch_size or self.max_batch_size
+        responses = [None] * len(calls)
+        payloads = []
+        cache_keys = {}
+        for index, call in enumerate(calls):
+            method, params = call[0], call[1] if len(call) > 1 else None
+            payload = build_payload(method, params, next(self._batch_ids))
+            cached = self._cached_result(method, params)
+            if cached is not None:
+                responses[index] = {"jsonrpc": "2.0", "id": payload["id"], "result": cached}
+                continue
+            cache_keys[payload["id"]] = self._cache_key(method, params)
+            payloads.append((index, payload))
+
+        for start in range(0, len(payloads), batch_size):
+            chunk = payloads[start:start + batch_size]
+            for (index, payload), response in zip(chunk, self._send_batch_chunk([p for _, p in chunk])):
+                responses[index] = response
+                self._cache_result(cache_keys[payload["id"]], payload["method"], payload["params"], response)
+        return [self._typed_response(call[0], response, typed) for call, response in zip(calls, responses)]
+
+    def call_many(self, calls, batch_size=1, controller=None, typed=None):
+        """
+        Send many calls (block ranges, thousands of receipts, ...) concurrently, with the number of
+        requests in flight adapted to the node: it grows while latency stays flat and shrinks when
+        latency degrades or calls fail (see AimdController).
+
+        :param calls: list of (method, params) tuples, params may be omitted or None
+        :param batch_size: calls per request, above 1 the calls are sent as batches of this size
+        :param controller: AimdController, shared between jobs to start from the limit already found.
+            By default starts low and grows up to `pool_maxsize`
+        :param typed: override the client `typed` mode for these calls
+        :return: list of responses in the same order as `calls`
+        """
+        controller = controller or AimdController(max_limit=self.pool_maxsize)
+        chunks = [calls[start:start + batch_size] for start in range(0, len(calls), batch_size)]
+
+        def send(chunk):
+            if batch_size > 1:
+                return self.call_batch(chunk, typed=typed)
+            method, params = chunk[0][0], chunk[0][1] if len(chunk[0]) > 1 else None
+            return [self.call(method, params, typed=typed)]
+
+        return [response for responses in adaptive_map(send, chunks, controller) for response in responses]
+
+    def lazy_block(self, block_id="latest"):
+        """
+        Fetch a block header with transaction hashes only, full transactions and receipts are
+        fetched in batches when accessed. See LazyBlock.
+
+        :param block_id: block hash, number (int or hex) or tag
+        :return: LazyBlock, or None if the node doesn't have the block
+        """
+        return LazyBlock.fetch(self, block_id)
+
+    def call_stream(self, method, params=None, path=()):
+        """
+        Make a call with a very large result (debug_traceTransaction struct logs, eth_getLogs over
+        many blocks, ...) and yield its items while the response is still being received, instead
+        of decoding the whole document at once. Responses are not cached. Streams take rate limiter
+        tokens and a lane slot like regular calls, but are not retried.
+
+        :param path: keys inside "result" leading to the array (or object) to stream, e.g.
+            ("structLogs",) for debug_traceTransaction; empty to stream the result itself
+        :return: generator of array elements, or (key, value) pairs when the target is an object
+        :raises ValueError: on a JSON-RPC error response or when nothing is found at `path`
+        :raises OSError: when the request fails
+        """
+        payload = build_payload(method, params)
+        self.rpc_log.request(self.url, method, payload)
+        send_stream = getattr(self.transport, "send_stream", None)
+        if send_stream is None:
+            # Stream transports receive whole messages, only the decode of the items can be spread out
+            yield from self._items_at(self._send(payload), method, path)
+            return
+
+        parser = JsonStreamParser(("result",) + tuple(path), self.codec)
+        count = 0
+        lane = self.lanes.lane_for(payload) if self.lanes is not None else None
+        # The lane slot is held until the whole result has been received, like for a regular call
+        with lane if lane is not None else contextlib.nullcontext():
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(payload)
+            try:
+                for chunk in send_stream(payload):
+                    for item in parser.feed(chunk):
+                        count += 1
+                        yield item
+            except requests.exceptions.HTTPError as e:
+                self._pause_on_throttle(e)
+                raise
+        rest = parser.close()
+        if "error" in rest:
+            raise ValueError(f"{method} failed: {rest['error']}")
+        if not parser.found:
+            raise ValueError(f"{method} result has no container at {list(path)}")
+        logger.info(f"Streamed {count} items of {method} result")
+
+    @staticmethod
+    def _items_at(response, method, path):
+        if "error" in response:
+            raise ValueError(f"{method} failed: {response['error']}")
+        target = response.get("result")
+        for key in path:
+            target = target.get(key) if isinstance(target, dict) else None
+        if isinstance(target, list):
+            yield from target
+        elif isinstance(target, dict):
+            yield from target.items()
+        else:
+            raise ValueError(f"{method} result has no container at {list(path)}")
+
+    def subscribe(self, kind, *params, callback=None):
+        """
+        Start an eth_subscribe subscription, e.g. subscribe("newHeads") or subscribe("logs", {"address": ...}).
+        Needs a WebSocket or IPC endpoint.
+
+        :param kind: newHeads, logs, newPendingTransactions, ...
+        :param callback: called with every notification; without it, iterate the returned subscription
+        :return: Subscription
+        """
+        if not self.transport.supports_subscriptions:
+            raise ValueError(f"Subscriptions are not supported over {self.url}, use a WebSocket or IPC endpoint")
+        response = self.call("eth_subscribe", [kind, *params])
+        if "error" in response:
+            raise ValueError(f"eth_subscribe({kind}) failed: {response['error']}")
+        subscription = Subscription(self, response["result"], kind, callback=callback)
+        self.transport.register_subscription(subscription)
+        return subscription
+
+    def _typed_response(self, method, response, typed):
+        if not (self.typed if typed is None else typed) or response.get("result") is None:
+            return response
+        return {**response, "result": decode_result(method, response["result"])}
+
+    def _send_batch_chunk(self, chunk):
+        methods = sorted({payload["method"] for payload in chunk})
+        logger.info(f"Sending batch of {len(chunk)} jsonrpc requests ({', '.join(methods)}) to {self.url}")
+        started = time.perf_counter()
+        try:
+            responses = match_batch_responses(chunk, self._send(chunk))
+        except (OSError, CodecError) as e:
+            logger.error(f"Batch request failed: {e}")
+            responses = [error_response(payload["id"], f"Request failed: {str(e)}") for payload in chunk]
+        self.rpc_log.response(self.url, f"batch of {len(chunk)}", chunk, responses, started)
+        return responses
+
+    def _send(self, payload):
+        lane = self.lanes.lane_for(payload) if self.lanes is not None else None
+        if lane is None:
+            return self._send_measured(payload)
+        # Waiting for a lane slot is queueing, not node latency: it is left out of the metrics
+        with lane:
+            return self._send_measured(payload, lane.timeout)
+
+    def _send_measured(self, payload, timeout=None):
+        if self.metrics is None:
+            return self._send_with_policy(payload, timeout)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self._send_with_policy(payload, timeout)
+            return response
         finally:
-            # Always close the session in a finally block
-            if session:
-                try:
-                    session.close()
-                except:
-                    pass  # Ignore errors when closing
+            self.metrics.record_exchange(payload, response, time.perf_counter() - started,
+                                         self.transport.wire_sizes() if response is not None else (0, 0))
+
+    def _send_with_policy(self, payload, timeout=None):
+        """:param timeout: request timeout used when the method policy doesn't set one"""
+        def send(payload, policy_timeout=None):
+            if self.rate_limiter is None:
+                return self.transport.send(payload, policy_timeout or timeout)
+            return self._send_rate_limited(payload, policy_timeout or timeout)
+
+        if self.policy is None:
+            return send(payload)
+        return self.policy.execute(payload, send)
+
+    def _send_rate_limited(self, payload, timeout=None):
+        # Every attempt (retries included) waits for its tokens
+        self.rate_limiter.acquire(payload)
+        try:
+            return self.transport.send(payload, timeout)
+        except requests.exceptions.HTTPError as e:
+            self._pause_on_throttle(e)
+            raise
+
+    def _pause_on_throttle(self, error):
+        """Hold back all requests for the Retry-After of a 429 answer"""
+        if self.rate_limiter is not None and error.response is not None and error.response.status_code == 429:
+            self.rate_limiter.pause(retry_after(error.response.headers.get("Retry-After")))
+
+    def _request(self, method, params):
+        """Uncached call for internal bookkeeping, returns the result or None"""
+        try:
+            return self._send(build_payload(method, params)).get("result")
+        except OSError as e:
+            logger.warning(f"{method} failed: {e}")
+            return None
+
+    def _cached_result(self, method, params):
+        if self.head_cache is not None and self.head_cache.is_head_scoped(method, params):
+            return self.head_cache.get(method, params, self._probe_head)
+        cache_key = self._cache_key(method, params)
+        return self.cache.get(cache_key) if cache_key is not None else None
+
+    def _probe_head(self):
+        if self.transport.supports_subscriptions and self._heads is None:
+            self._follow_heads()
+        return self._request("eth_getBlockByNumber", ["latest", False])
+
+    def _follow_heads(self):
+        """Feed the head cache from a newHeads subscription instead of probing"""
+        def on_head(head):
+            self.head_cache.observe_head(head.get("number"), head.get("hash"), exact=True)
+
+        try:
+            self._heads = self.subscribe("newHeads", callback=on_head)
+            self.head_cache.following = True
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not subscribe to newHeads, the head cache falls back to probing: {e}")
+            self._heads = False
+
+    def _cache_key(self, method, params):
+        if self.cache is None or not might_be_cached(method, params):
+            return None
+        if self._cache_namespace is None:
+            # Keys include the genesis hash, so a persistent cache never mixes networks
+            genesis = self._request("eth_getBlockByNumber", ["0x0", False])
+            if genesis is None:
+                return None
+            self._cache_namespace = genesis["hash"]
+        return self.cache.make_key(self._cache_namespace, method, params)
+
+    def _cache_result(self, cache_key, method, params, response):
+        if "result" not in response:
+            return
+        if self.head_cache is not None:
+            if self.head_cache.is_head_scoped(method, params):
+                self.head_cache.put(method, params, response["result"])
+            else:
+                self.head_cache.observe_result(method, params, response["result"])
+        if cache_key is not None and is_cacheable(method, params, response["result"], self._finalized_block_number):
+            self.cache.put(cache_key, response["result"])
+
+    def _finalized_block_number(self):
+        now = time.monotonic()
+        if now - self._finalized_checked_at > FINALIZED_REFRESH_INTERVAL:
+            self._finalized_checked_at = now
+            block = self._request("eth_getBlockByNumber", ["finalized", False])
+            if block is not None:
+                self._finalized_number = int(block["number"], 16)
+        return self._finalized_number
+
+    def close(self):
+        """Release all pooled connections"""
+        try:
+            self.transport.close()
+        except Exception:
+            pass  # Ignore errors when closing
+        if self.cache is not None:
+            self.cache.close()
+        if self.head_cache is not None:
+            logger.info(f"Head cache stats: {self.head_cache.stats()}")
+        if self.policy is not None:
+            logger.info(f"Request policy stats: {self.policy.stats()}")
+        if self.rate_limiter is not None:
+            logger.info(f"Rate limiter stats: {self.rate_limiter.stats()}")
+        if self.lanes is not None:
+            logger.info(f"Lane stats: {self.lanes.stats()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,119 @@
+from collections.abc import Mapping, Sequence
+
+
+class LazyTransactions(Sequence):
+    """
+    Transactions of a LazyBlock. Indexing fetches only that transaction,
+    iterating fetches all the missing ones in batches.
+    """
+
+    def __init__(self, block):
+        self._block = block
+        self._items = {}
+
+    def __len__(self):
+        return len(self._block.transaction_hashes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        hashes = self._block.transaction_hashes
+        index = range(len(hashes))[index]  # negative indexes and IndexError like a list
+        if index not in self._items:
+            self._items[index] = self._block.fetch_one("eth_getTransactionByHash", [hashes[index]])
+        return self._items[index]
+
+    def __iter__(self):
+        self.hydrate()
+        return (self._items[index] for index in range(len(self)))
+
+    def hydrate(self):
+        hashes = self._block.transaction_hashes
+        missing = [index for index in range(len(hashes)) if index not in self._items]
+        results = self._block.fetch_many([("eth_getTransactionByHash", [hashes[index]]) for index in missing])
+        self._items.update(zip(missing, results))
+
+
+class LazyBlock(Mapping):
+    """
+    Block fetched with transaction hashes only; full transactions and receipts are fetched
+    (in batches) only when they are accessed.
+
+    Works as a read-only mapping of the header fields, where block["transactions"] gives the
+    lazily fetched full transactions, so code written for eth_getBlockByNumber(..., True)
+    results keeps working: len(block["transactions"]) and block["transactions"][-1]["hash"]
+    don't download the other transactions.
+    """
+
+    def __init__(self, client, header):
+        self.client = client
+        self.header = header
+        self.transactions = LazyTransactions(self)
+        self._receipts = None
+
+    @classmethod
+    def fetch(cls, client, block_id="latest"):
+        """
+        :param block_id: block hash, number (int or hex) or tag
+        :return: LazyBlock, or None if the node doesn't have the block
+        """
+        if isinstance(block_id, int):
+            block_id = hex(block_id)
+        method = "eth_getBlockByHash" if len(block_id) == 66 else "eth_getBlockByNumber"
+        response = client.call(method, [block_id, False], typed=False)
+        if "error" in response:
+            raise ValueError(f"{method}({block_id}) failed: {response['error']}")
+        return cls(client, response["result"]) if response["result"] is not None else None
+
+    @property
+    def number(self):
+        return int(self.header["number"], 16)
+
+    @property
+    def hash(self):
+        return self.header["hash"]
+
+    @property
+    def transaction_hashes(self):
+        return self.header.get("transactions", [])
+
+    @property
+    def receipts(self):
+        """Receipts of all transactions, with one eth_getBlockReceipts call when the node supports it"""
+        if self._receipts is None:
+            response = self.client.call("eth_getBlockReceipts", [self.hash], typed=False)
+            if "error" not in response and response.get("result") is not None:
+                self._receipts = response["result"]
+            else:
+                self._receipts = self.fetch_many([("eth_getTransactionReceipt", [tx_hash])
+                                                  for tx_hash in self.transaction_hashes])
+        return self._receipts
+
+    def fetch_one(self, method, params):
+        response = self.client.call(method, params, typed=False)
+        if "error" in response:
+            raise ValueError(f"{method}({params}) failed: {response['error']}")
+        return response["result"]
+
+    def fetch_many(self, calls):
+        results = []
+        for (method, params), response in zip(calls, self.client.call_batch(calls, typed=False)):
+            if "error" in response:
+                raise ValueError(f"{method}({params}) failed: {response['error']}")
+            results.append(response["result"])
+        return results
+
+    def __getitem__(self, key):
+        if key == "transactions":
+            return self.transactions
+        return self.header[key]
+
+    def __iter__(self):
+        return iter(self.header)
+
+    def __len__(self):
+        return len(self.header)
+
+    def __repr__(self):
+        return f"LazyBlock(number={self.header.get('number')}, hash={self.header.get('hash')}, " \
+               f"transactions={len(self.transaction_hashes)})"
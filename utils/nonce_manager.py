@@ -0,0 +1,165 @@
+import threading
+import time
+
+from eth_account import Account
+from loguru import logger
+from web3 import Web3
+
+# Node answers meaning the local nonce of the account is out of sync with the node (or the node
+# couldn't check it yet), worth a retry with the node's pending count
+NONCE_ERRORS = ("nonce too low", "nonce too high", "already known", "alreadyknown", "known transaction",
+                "replacementnotallowed", "oldnonce", "pruned history unavailable")
+UNDERPRICED_ERRORS = ("underpriced", "feetoolow", "fee too low")
+DEFAULT_GAS_PRICE_TTL = 12
+
+
+def is_nonce_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in NONCE_ERRORS)
+
+
+class NonceManager:
+    """
+    Hands out the nonces of one account locally, so consecutive transactions don't need an
+    eth_getTransactionCount each. The node is asked again only after resync(), e.g. when it
+    rejected a transaction because of its nonce.
+
+    :param start: first nonce when it is known (0 for a fresh account), otherwise the pending
+        transaction count is fetched on first use
+    """
+
+    def __init__(self, client, address, start=None):
+        self.client = client
+        self.address = address
+        self.resyncs = 0
+        self._next = start
+        self._lock = threading.Lock()
+
+    def allocate(self, count=1):
+        """Reserve `count` consecutive nonces, returns the first one"""
+        with self._lock:
+            if self._next is None:
+                self._next = self._pending_count()
+            nonce = self._next
+            self._next += count
+            return nonce
+
+    def resync(self):
+        """Forget the local nonce, the next allocate() starts from the node's pending count"""
+        with self._lock:
+            self._next = None
+            self.resyncs += 1
+
+    def _pending_count(self):
+        # "pending" counts the transactions already in the pool, and is never served from the head cache
+        response = self.client.call("eth_getTransactionCount", [self.address, "pending"])
+        if "error" in response:
+            raise ValueError(f"eth_getTransactionCount({self.address}) failed: {response['error']}")
+        return int(response["result"], 16)
+
+
+class TransactionSender:
+    """
+    Signs and submits transactions of one account without a round trip per transaction for the
+    nonce, gas price and chain id: nonces come from a NonceManager, the chain id is fetched once
+    and the gas price at most every `gas_price_ttl` seconds.
+
+    send() submits one transaction, send_many() signs a whole list and submits it as one batch,
+    neither waits for receipts (use a ReceiptWaiter for that).
+    """
+
+    def __init__(self, client, private_key, nonce_manager=None, gas_price_ttl=DEFAULT_GAS_PRICE_TTL, max_attempts=3):
+        self.client = client
+        self.account = Account.from_key(private_key)
+        self.address = self.account.address
+        self.nonces = nonce_manager or NonceManager(client, self.address)
+        self.gas_price_ttl = gas_price_ttl
+        self.max_attempts = max_attempts
+        self._chain_id = None
+        self._gas_price = None
+        self._gas_price_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def chain_id(self):
+        if self._chain_id is None:
+            self._chain_id = int(self._result("eth_chainId"), 16)
+        return self._chain_id
+
+    def gas_price(self, refresh=False):
+        with self._lock:
+            if refresh or self._gas_price is None or time.monotonic() - self._gas_price_at > self.gas_price_ttl:
+                self._gas_price = int(self._result("eth_gasPrice"), 16)
+                self._gas_price_at = time.monotonic()
+            return self._gas_price
+
+    def build(self, transaction, nonce):
+        """Fill in the nonce, chain id, gas price and (for plain transfers) gas of `transaction`"""
+        transaction = dict(transaction)
+        transaction["nonce"] = nonce
+        transaction.setdefault("chainId", self.chain_id)
+        transaction.setdefault("gas", 21000)
+        if "maxFeePerGas" not in transaction:
+            transaction.setdefault("gasPrice", self.gas_price())
+        return transaction
+
+    def sign(self, transaction, nonce, blobs=None):
+        signed = self.account.sign_transaction(self.build(transaction, nonce), blobs=blobs)
+        return Web3.to_hex(signed.raw_transaction)
+
+    def send(self, transaction, blobs=None):
+        """
+        Sign and submit `transaction` (a dict without nonce), resyncing the nonce or refreshing
+        the gas price when the node rejects it for that reason.
+
+        :param blobs: blob data of a type 3 transaction, sent along as its sidecar
+        :return: transaction hash
+        :raises ValueError: when the node keeps rejecting the transaction
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            nonce = self.nonces.allocate()
+            response = self.client.call("eth_sendRawTransaction", [self.sign(transaction, nonce, blobs)])
+            if "error" not in response:
+                return response["result"]
+            if not self._recover(response["error"]) or attempt == self.max_attempts:
+                raise ValueError(f"Transaction from {self.address} failed: {response['error']}")
+            logger.warning(f"Transaction from {self.address} with nonce {nonce} rejected ({response['error']}), "
+                           f"retry {attempt}/{self.max_attempts - 1}")
+
+    def send_many(self, transactions):
+        """
+        Sign `transactions` with consecutive nonces and submit them as one JSON-RPC batch.
+        Rejected ones are sent again one by one with fresh nonces.
+
+        :return: transaction hashes in the same order
+        """
+        if not transactions:
+            return []
+        first = self.nonces.allocate(len(transactions))
+        raw = [self.sign(transaction, first + index) for index, transaction in enumerate(transactions)]
+        responses = self.client.call_batch([("eth_sendRawTransaction", [tx]) for tx in raw])
+        hashes = []
+        failed = [response["error"] for response in responses if "error" in response]
+        if failed:
+            # a gap in the nonces would hold back every later transaction, start again from the node
+            logger.warning(f"{len(failed)} of {len(transactions)} batched transactions rejected: {failed[0]}")
+            self.nonces.resync()
+        for transaction, response in zip(transactions, responses):
+            hashes.append(response["result"] if "error" not in response else self.send(transaction))
+        return hashes
+
+    def _recover(self, error):
+        """Fix the cause of a rejection, False when retrying won't help"""
+        message = str(error).lower()
+        # the rejected transaction left its nonce unused, start again from the node's pending count
+        self.nonces.resync()
+        if any(marker in message for marker in UNDERPRICED_ERRORS):
+            self.gas_price(refresh=True)
+            return True
+        return is_nonce_error(message)
+
+    def _result(self, method, params=None):
+        response = self.client.call(method, params)
+        if "error" in response:
+            raise ValueError(f"{method} failed: {response['error']}")
+        return response["result"]
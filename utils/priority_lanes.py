@@ -0,0 +1,106 @@
+import fnmatch
+import threading
+import time
+
+from utils.rpc_methods import is_read_only
+
+# Method classes, a batch mixing classes goes to the lane of the first class listed here it contains
+LANE_CLASSES = ("tracing", "submissions", "reads")
+# Methods taking seconds on a large block, other state changing methods are submissions
+TRACING_PATTERNS = ("debug_trace*", "trace_*")
+# No timeouts: the lanes only limit concurrency and keep the client timeout (rpc_timeout)
+DEFAULT_LANES = "reads: concurrency=16; tracing: concurrency=2; submissions: concurrency=4"
+
+
+def method_class(method):
+    if any(fnmatch.fnmatchcase(method, pattern) for pattern in TRACING_PATTERNS):
+        return "tracing"
+    return "reads" if is_read_only(method) else "submissions"
+
+
+class Lane:
+    """
+    Calls of one method class: at most `concurrency` of them in flight, the others wait for a
+    free slot without holding a connection.
+
+    :param timeout: request timeout of the calls in the lane unless their method policy sets one,
+        None keeps the client timeout
+    """
+
+    def __init__(self, name, concurrency, timeout=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.calls = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self._semaphore.acquire()
+        wait = time.perf_counter() - started
+        with self._lock:
+            self.calls += 1
+            self.waited += wait
+            self.max_wait = max(self.max_wait, wait)
+        return self
+
+    def __exit__(self, *exc):
+        self._semaphore.release()
+
+    def stats(self):
+        return {"calls": self.calls, "waited_seconds": round(self.waited, 3), "max_wait_ms": round(self.max_wait * 1000, 1)}
+
+
+def parse_lanes(text):
+    """Parse "class: concurrency=N, timeout=S; class: ..." into {class: Lane}, classes of LANE_CLASSES"""
+    lanes = {}
+    for entry in text.replace("\n", ";").split(";"):
+        if not entry.strip():
+            continue
+        name, _, settings = entry.partition(":")
+        name = name.strip()
+        if name not in LANE_CLASSES:
+            raise ValueError(f"Unknown lane {name!r}, expected one of {', '.join(LANE_CLASSES)}")
+        values = {}
+        for setting in settings.split(","):
+            if not setting.strip():
+                continue
+            key, _, value = setting.partition("=")
+            key = key.strip()
+            if key not in ("concurrency", "timeout"):
+                raise ValueError(f"Unknown lane setting {key!r} in {entry.strip()!r}")
+            values[key] = int(value) if key == "concurrency" else float(value)
+        lanes[name] = Lane(name, values.get("concurrency", 1), values.get("timeout"))
+    return lanes
+
+
+class PriorityLanes:
+    """
+    Separate scheduling of state reads, tracing and submissions, so a few multi-second trace calls
+    can't take every connection while cheap calls queue behind them. Classes without a lane are
+    not limited.
+    """
+
+    def __init__(self, lanes):
+        self.lanes = lanes
+
+    @classmethod
+    def from_config(cls, configuration):
+        """PriorityLanes for the pytest.ini configuration section, or None when rpc_lanes is empty"""
+        lanes = parse_lanes(configuration.get("rpc_lanes", DEFAULT_LANES))
+        return cls(lanes) if lanes else None
+
+    def lane_for(self, payload):
+        """Lane of a request or batch, None if its class has no lane"""
+        methods = [request["method"] for request in payload] if isinstance(payload, list) else [payload["method"]]
+        classes = {method_class(method) for method in methods}
+        for name in LANE_CLASSES:
+            if name in classes:
+                return self.lanes.get(name)
+        return None
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
@@ -0,0 +1,138 @@
+import asyncio
+import fnmatch
+import threading
+import time
+
+from loguru import logger
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average with bursts of up to `burst` requests.
+
+    Callers reserve tokens and get back how long to wait before sending, so waiting can be
+    done with time.sleep or asyncio.sleep. The balance may go negative: later callers then
+    queue behind the reservations already made, in order.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.burst)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """Take `tokens` and return the seconds to wait before using them"""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return max(-self._tokens / self.rate, 0.0)
+
+    def pause(self, seconds):
+        """Hold back all callers for at least `seconds` (e.g. after a 429 with Retry-After)"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def parse_method_rate_limits(text):
+    """
+    Parse "pattern: rate=N, burst=M; pattern: ..." (fnmatch patterns) into an ordered list of
+    (pattern, TokenBucket); a method uses the bucket of the first matching pattern.
+    """
+    limits = []
+    for entry in text.replace("\n", ";").split(";"):
+        if not entry.strip():
+            continue
+        pattern, _, settings = entry.partition(":")
+        values = {}
+        for setting in settings.split(","):
+            if not setting.strip():
+                continue
+            key, _, value = setting.partition("=")
+            key = key.strip()
+            if key not in ("rate", "burst"):
+                raise ValueError(f"Unknown rate limit setting {key!r} in {entry.strip()!r}")
+            values[key] = float(value)
+        if "rate" not in values:
+            raise ValueError(f"Rate limit without rate in {entry.strip()!r}")
+        limits.append((pattern.strip(), TokenBucket(values["rate"], values.get("burst"))))
+    return limits
+
+
+class RateLimiter:
+    """
+    Client-side rate limiting of JSON-RPC requests: a global budget of `rate` requests per second
+    plus separate budgets for expensive methods. Every request of a batch counts, a request
+    matching a method budget also counts against the global one.
+
+    :param rate: global requests per second, 0 for no global limit
+    :param burst: requests that can be sent at once after an idle period, defaults to `rate`
+    :param method_limits: list of (fnmatch pattern, TokenBucket), see parse_method_rate_limits
+    """
+
+    def __init__(self, rate=0, burst=None, method_limits=()):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.method_limits = list(method_limits)
+        self.throttled = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, configuration):
+        """RateLimiter for the pytest.ini configuration section, or None when no limit is configured"""
+        rate = float(configuration.get("rpc_rate_limit", 0))
+        method_limits = parse_method_rate_limits(configuration.get("rpc_method_rate_limits", ""))
+        if not rate and not method_limits:
+            return None
+        return cls(rate, float(configuration.get("rpc_rate_burst", 0)) or None, method_limits)
+
+    def bucket_for(self, method):
+        for pattern, bucket in self.method_limits:
+            if fnmatch.fnmatchcase(method, pattern):
+                return bucket
+        return None
+
+    def reserve(self, payload):
+        """Reserve tokens for a request or batch, returns the seconds to wait before sending it"""
+        requests_list = payload if isinstance(payload, list) else [payload]
+        counts = {}
+        for request in requests_list:
+            bucket = self.bucket_for(request["method"])
+            if bucket is not None:
+                counts[bucket] = counts.get(bucket, 0) + 1
+        if self.bucket is not None:
+            counts[self.bucket] = len(requests_list)
+        wait = max((bucket.reserve(count) for bucket, count in counts.items()), default=0.0)
+        if wait:
+            with self._lock:
+                self.throttled += 1
+                self.waited += wait
+        return wait
+
+    def acquire(self, payload):
+        """Block until `payload` may be sent"""
+        wait = self.reserve(payload)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, payload):
+        wait = self.reserve(payload)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """The node asked to slow down: hold back every request for `seconds`"""
+        logger.warning(f"Node is rate limiting requests, pausing for {seconds:.1f} s")
+        for bucket in [self.bucket] + [bucket for _, bucket in self.method_limits]:
+            if bucket is not None:
+                bucket.pause(seconds)
+
+    def stats(self):
+        return {"throttled": self.throttled, "waited_seconds": round(self.waited, 3)}
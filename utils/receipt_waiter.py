@@ -0,0 +1,209 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from loguru import logger
+
+DEFAULT_MIN_INTERVAL = 0.5
+DEFAULT_MAX_INTERVAL = 5.0
+# consecutive failed checks after which the pending waits fail with the error instead of timing out
+DEFAULT_MAX_FAILURES = 3
+
+
+class ReceiptWaiter:
+    """
+    Waits for the receipts of any number of transactions with one background thread.
+
+    All pending hashes are checked with a single eth_getTransactionReceipt batch when a new block
+    arrives (and once right after a hash is added, in case it is already mined), and the future of
+    every transaction is resolved as soon as its receipt is there.
+
+    New blocks come from a newHeads subscription on WebSocket/IPC endpoints. Over HTTP the head is
+    polled with eth_blockNumber: the first poll after a block is timed from the observed block
+    time, then the interval grows from `min_interval` up to `max_interval` until the next block.
+    Both set to 0 poll without pausing, for replayed runs where the blocks are already there.
+
+    An unexpected error while checking (e.g. a malformed response) is logged and the check is
+    repeated; after `max_failures` failed checks in a row the pending waits fail with that error.
+    """
+
+    def __init__(self, client, timeout=360, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 max_failures=DEFAULT_MAX_FAILURES):
+        """
+        :param timeout: default seconds wait() waits for a receipt
+        """
+        self.client = client
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_failures = max_failures
+        self.checks = 0
+        self.failures = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._subscription = None
+        self._head = None
+        self._head_seen_at = None
+        self._block_time = None
+
+    def submit(self, tx_hash):
+        """Start waiting for `tx_hash`, returns a Future resolved with its receipt"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ReceiptWaiter is closed")
+            future = self._pending.get(tx_hash)
+            if future is None:
+                future = self._pending[tx_hash] = Future()
+            if self._thread is None:
+                self._start()
+        self._wakeup.set()
+        return future
+
+    def wait(self, tx_hash, timeout=None):
+        """
+        :return: receipt of `tx_hash`
+        :raises TimeoutError: when no receipt appeared within `timeout` seconds
+        """
+        return self.wait_all([tx_hash], timeout)[0]
+
+    def wait_all(self, tx_hashes, timeout=None):
+        """
+        Receipts of all `tx_hashes`, in the same order
+
+        :raises TimeoutError: when not all receipts appeared within `timeout` seconds
+        :raises Exception: the error of the receipt checks when they kept failing
+        """
+        timeout = timeout or self.timeout
+        futures = [self.submit(tx_hash) for tx_hash in tx_hashes]
+        deadline = time.monotonic() + timeout
+        receipts = []
+        for tx_hash, future in zip(tx_hashes, futures):
+            try:
+                receipts.append(future.result(max(deadline - time.monotonic(), 0)))
+            except FutureTimeoutError:
+                # nobody waits for the rest any more, stop checking them with every block
+                with self._lock:
+                    for pending_hash, pending_future in zip(tx_hashes, futures):
+                        if self._pending.get(pending_hash) is pending_future:
+                            del self._pending[pending_hash]
+                raise TimeoutError(f"Transaction {tx_hash} was not mined within {timeout} s")
+        return receipts
+
+    def _start(self):
+        if self.client.transport.supports_subscriptions:
+            try:
+                self._subscription = self.client.subscribe("newHeads", callback=self._on_head)
+            except ValueError as e:
+                logger.warning(f"newHeads subscription failed, polling the head instead: {e}")
+        self._thread = threading.Thread(target=self._run, name="receipt-waiter", daemon=True)
+        self._thread.start()
+
+    def _on_head(self, head):
+        self._head = int(head["number"], 16)
+        self._wakeup.set()
+
+    def _run(self):
+        checked_head = None
+        interval = self.min_interval
+        failed = 0
+        while not self._closed:
+            # with nothing to wait for, the head isn't polled until the next submit(); a failed
+            # check is repeated after min_interval
+            idle = (self._subscription is not None or not self._pending) and not failed
+            woken = self._wakeup.wait(None if idle else interval)
+            self._wakeup.clear()
+            if self._closed:
+                break
+            try:
+                if self._subscription is None:
+                    new_block = self._poll_head()
+                    interval = self._next_interval(interval, new_block)
+                if woken or failed or self._head != checked_head:
+                    head = self._head
+                    self._check()
+                    checked_head = head
+                failed = 0
+            except Exception as e:
+                failed += 1
+                self.failures += 1
+                logger.exception(f"Receipt check failed ({failed} in a row): {e}")
+                if failed >= self.max_failures:
+                    self._fail_pending(e)
+                    failed = 0
+                interval = self.min_interval
+
+    def _fail_pending(self, error):
+        """Let the waits fail with `error` right away instead of timing out"""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(error)
+
+    def _poll_head(self):
+        """Refresh the head over HTTP, True when a new block arrived"""
+        response = self.client.call("eth_blockNumber")
+        if "error" in response:
+            logger.warning(f"eth_blockNumber failed while waiting for receipts: {response['error']}")
+            return False
+        head = int(response["result"], 16)
+        if head == self._head:
+            return False
+        now = time.monotonic()
+        if self._head is not None and self._head_seen_at is not None:
+            block_time = (now - self._head_seen_at) / max(head - self._head, 1)
+            self._block_time = block_time if self._block_time is None else 0.7 * self._block_time + 0.3 * block_time
+        self._head = head
+        self._head_seen_at = now
+        return True
+
+    def _next_interval(self, interval, new_block):
+        if new_block and self._block_time:
+            # nothing to see before the next block is due
+            return min(max(self._block_time * 0.9, self.min_interval), self.max_interval)
+        if new_block:
+            return self.min_interval
+        return min(interval * 1.5, self.max_interval)
+
+    def _check(self):
+        with self._lock:
+            pending = list(self._pending.items())
+        if not pending:
+            return
+        self.checks += 1
+        # receipts are handed out as plain dicts, also when the client returns typed results
+        responses = self.client.call_batch([("eth_getTransactionReceipt", [tx_hash]) for tx_hash, _ in pending],
+                                           typed=False)
+        found = 0
+        for (tx_hash, future), response in zip(pending, responses):
+            if "error" in response:
+                logger.warning(f"Receipt check of {tx_hash} failed: {response['error']}")
+            elif response.get("result") is not None:
+                with self._lock:
+                    if self._pending.get(tx_hash) is future:
+                        del self._pending[tx_hash]
+                future.set_result(response["result"])
+                found += 1
+        logger.debug(f"Receipt check at block {self._head}: {found} of {len(pending)} pending transactions mined")
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        self._wakeup.set()
+        for future in pending:
+            future.cancel()
+        if self._subscription is not None:
+            self._subscription.unsubscribe()
+        if self._thread is not None:
+            self._thread.join(timeout=self.max_interval + 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
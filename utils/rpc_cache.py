@@ -0,0 +1,371 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# seconds a write waits for another process (e.g. an xdist worker) holding the SQLite file lock
+DEFAULT_CACHE_BUSY_TIMEOUT = 5.0
+
+# Methods whose result never changes once the block they refer to exists.
+# Value: index of the block hash / number parameter.
+BLOCK_KEYED_METHODS = {
+    "eth_getBlockByHash": 0,
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockTransactionCountByHash": 0,
+    "eth_getBlockTransactionCountByNumber": 0,
+    "eth_getUncleCountByBlockHash": 0,
+    "eth_getUncleCountByBlockNumber": 0,
+    "eth_getTransactionByBlockHashAndIndex": 0,
+    "eth_getTransactionByBlockNumberAndIndex": 0,
+    "eth_getUncleByBlockHashAndIndex": 0,
+    "eth_getUncleByBlockNumberAndIndex": 0,
+    "eth_getBlockReceipts": 0,
+    "eth_getBalance": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getCode": 1,
+    "eth_getStorageAt": 2,
+    "eth_call": 1,
+    "eth_getProof": 2,
+    "trace_block": 0,
+    "trace_replayBlockTransactions": 0,
+    "debug_traceBlockByHash": 0,
+    "debug_traceBlockByNumber": 0,
+    "debug_getRawBlock": 0,
+    "debug_getRawHeader": 0,
+    "debug_getRawReceipts": 0,
+}
+
+# Methods keyed by transaction hash. A mined transaction can still move to another block in a
+# reorg, so these are cached only once the block they were included in is finalized.
+TRANSACTION_KEYED_METHODS = {
+    "eth_getTransactionByHash",
+    "eth_getTransactionReceipt",
+    "trace_transaction",
+}
+
+
+def _block_param_is_immutable(block_param, finalized_number):
+    """Block hashes are immutable, block numbers only once finalized, tags (latest, pending, ...) never"""
+    if isinstance(block_param, dict):
+        # EIP-1898 block parameter
+        if "blockHash" in block_param:
+            return True
+        block_param = block_param.get("blockNumber")
+    if not isinstance(block_param, str) or not block_param.startswith("0x"):
+        return False
+    if len(block_param) == 66:
+        return True
+    finalized = finalized_number()
+    return finalized is not None and int(block_param, 16) <= finalized
+
+
+def _transaction_block_number(method, result):
+    if method == "trace_transaction":
+        return result[0].get("blockNumber") if result else None
+    block_number = result.get("blockNumber")
+    return int(block_number, 16) if isinstance(block_number, str) else None
+
+
+def is_cacheable(method, params, result, finalized_number):
+    """
+    Decide whether `result` of `method(params)` can be cached forever.
+
+    :param finalized_number: callable returning the latest finalized block number (or None),
+        only invoked when the decision depends on it
+    """
+    if result is None:
+        # Unknown block / not mined yet, ask the node again next time
+        return False
+    if method in BLOCK_KEYED_METHODS:
+        index = BLOCK_KEYED_METHODS[method]
+        if params is None or len(params) <= index:
+            # Omitted block parameter defaults to "latest"
+            return False
+        return _block_param_is_immutable(params[index], finalized_number)
+    if method in TRANSACTION_KEYED_METHODS:
+        block_number = _transaction_block_number(method, result)
+        finalized = finalized_number() if block_number is not None else None
+        return finalized is not None and block_number <= finalized
+    return False
+
+
+def might_be_cached(method, params):
+    """Cheap pre-check before a cache lookup: skips calls that can never be cached (e.g. "latest" tag)"""
+    if method in TRANSACTION_KEYED_METHODS:
+        return True
+    index = BLOCK_KEYED_METHODS.get(method)
+    if index is None or params is None or len(params) <= index:
+        return False
+    block_param = params[index]
+    return isinstance(block_param, dict) or (isinstance(block_param, str) and block_param.startswith("0x"))
+
+
+class ResponseCache:
+    """
+    LRU cache for immutable JSON-RPC results, bounded by the size of the encoded results.
+
+    With `path`, entries are also written to an SQLite file and survive between pytest sessions.
+    Keys should include the chain identity (e.g. genesis hash) when the file is shared between networks.
+    The file can be shared by parallel processes: a lookup or write that still finds the file locked
+    after `busy_timeout` seconds counts as a miss instead of failing the call.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES, path=None, busy_timeout=DEFAULT_CACHE_BUSY_TIMEOUT):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db_errors = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(namespace, method, params):
+        # default=str: params the codec can't encode fail in the transport, not here
+        return f"{namespace}:{method}:{json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)}"
+
+    def get(self, key):
+        """Return a fresh copy of the cached result, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            elif self._db is not None:
+                row = self._db_read(key)
+                if row is not None:
+                    value = row[0]
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._store(key, value)
+            if value is None:
+                self.misses += 1
+                return None
+        # Decode on every hit so callers can't mutate the cached copy
+        return json.loads(value)
+
+    def put(self, key, result):
+        value = json.dumps(result, separators=(',', ':')).encode()
+        with self._lock:
+            self._store(key, value)
+            if self._db is not None:
+                self._db_write(key, value)
+
+    def _db_read(self, key):
+        try:
+            return self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError as e:
+            # "database is locked" by another process for longer than the busy timeout
+            self.db_errors += 1
+            logger.warning(f"Response cache lookup in {self.path} failed, treated as a miss: {e}")
+            return None
+
+    def _db_write(self, key, value):
+        try:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)", (key, value))
+            self._db.commit()
+        except sqlite3.OperationalError as e:
+            # the entry stays in memory, only its copy on disk is lost
+            self.db_errors += 1
+            self._db.rollback()
+            logger.warning(f"Response cache write to {self.path} failed: {e}")
+
+    def _store(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "db_errors": self.db_errors,
+            "entries": len(self._entries),
+            "bytes": self.size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self):
+        logger.info(f"Response cache stats: {self.stats()}")
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# Results that can't change during a test session
+SESSION_CONSTANT_METHODS = {"eth_chainId", "net_version"}
+
+# Methods whose result only changes when the chain head changes.
+# Value: index of the block parameter (None if the method has none); only "latest" is cached.
+HEAD_SCOPED_METHODS = {
+    "eth_blockNumber": None,
+    "eth_gasPrice": None,
+    "eth_maxPriorityFeePerGas": None,
+    "eth_blobBaseFee": None,
+    "eth_getBlockByNumber": 0,
+    "eth_getBalance": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getCode": 1,
+    "eth_getStorageAt": 2,
+    "eth_call": 1,
+}
+
+DEFAULT_HEAD_CACHE_TTL = 1.0
+
+
+def _quantity(value):
+    if isinstance(value, int):
+        return value
+    return int(value, 16) if isinstance(value, str) and value.startswith("0x") else None
+
+
+class HeadScopedCache:
+    """
+    Cache for calls that depend on the chain head (balances, nonces, gas price at "latest", ...).
+
+    Entries are dropped as soon as a new head or a reorg is seen. Heads are learned from responses
+    passing through the client (block numbers in blocks, receipts, eth_blockNumber), from a newHeads
+    subscription when the transport supports one, or by probing the latest block once the last
+    check is older than `ttl` seconds. Session constants like eth_chainId are never dropped.
+    """
+
+    def __init__(self, ttl=DEFAULT_HEAD_CACHE_TTL, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.head_number = None
+        self.head_hash = None
+        self.following = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._checked_at = 0.0
+        self._entries = {}
+        self._constants = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_head_scoped(method, params):
+        if method in SESSION_CONSTANT_METHODS:
+            return True
+        if method not in HEAD_SCOPED_METHODS:
+            return False
+        index = HEAD_SCOPED_METHODS[method]
+        # An omitted block parameter means "latest"
+        return index is None or params is None or len(params) <= index or params[index] == "latest"
+
+    def get(self, method, params, probe):
+        """
+        Return a copy of the cached result or None.
+
+        :param probe: callable returning the latest block (number and hash), used when the
+            known head was checked more than `ttl` seconds ago
+        """
+        key = ResponseCache.make_key("", method, params)
+        if method in SESSION_CONSTANT_METHODS:
+            value = self._constants.get(key)
+        else:
+            value = self._entries.get(key)
+            # Only pay for a head check when there is something to serve
+            if value is not None and not self.following and time.monotonic() - self._checked_at > self.ttl:
+                block = probe()
+                self._checked_at = time.monotonic()
+                if block is not None:
+                    self.observe_head(block.get("number"), block.get("hash"), exact=True)
+                value = self._entries.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, method, params, result):
+        self.observe_result(method, params, result)
+        if result is None:
+            return
+        key = ResponseCache.make_key("", method, params)
+        value = json.dumps(result, separators=(',', ':'))
+        with self._lock:
+            if method in SESSION_CONSTANT_METHODS:
+                self._constants[key] = value
+            elif len(self._entries) < self.max_entries:
+                self._entries[key] = value
+
+    def observe_result(self, method, params, result):
+        """Learn about new heads from any response passing through the client"""
+        if isinstance(result, dict):
+            if "number" in result and "parentHash" in result:
+                # A block: only "latest" tells us the head hash, others just prove the chain grew
+                latest = method == "eth_getBlockByNumber" and params and params[0] == "latest"
+                self.observe_head(result["number"], result.get("hash") if latest else None, exact=latest)
+            elif "blockNumber" in result:
+                self.observe_head(result["blockNumber"])
+        elif method == "eth_blockNumber":
+            self.observe_head(result, exact=True)
+
+    def observe_head(self, number, block_hash=None, exact=False):
+        """
+        :param exact: `number` is the current head (not just some existing block), so a lower
+            number than the known head means the chain was reorganized to a shorter one
+        """
+        number = _quantity(number)
+        if number is None:
+            return
+        with self._lock:
+            if self.head_number is None:
+                # First head seen, entries cached so far belong to it
+                self.head_number = number
+                self.head_hash = block_hash
+                return
+            changed = (
+                number > self.head_number
+                or (exact and number < self.head_number)
+                or (number == self.head_number and block_hash is not None
+                    and self.head_hash is not None and block_hash != self.head_hash)
+            )
+            if not changed:
+                if number == self.head_number and block_hash is not None:
+                    self.head_hash = block_hash
+                return
+            self.invalidations += 1
+            self.head_number = number
+            self.head_hash = block_hash
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries) + len(self._constants),
+            "head": self.head_number,
+        }
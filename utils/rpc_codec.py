@@ -0,0 +1,229 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # optional fast codec
+    orjson = None  # type: ignore[assignment, unused-ignore]
+
+try:
+    import msgspec
+except ImportError:  # optional fast codec
+    msgspec = None  # type: ignore[assignment, unused-ignore]
+
+# A JSON number of 19 or more digits may not fit into 64 bits. Digits inside hex strings
+# ("0x...") follow a word character and don't match, decimal strings only cost a slower decode.
+_WIDE_INTEGER = re.compile(rb'(?<![\w.])\d{19,}')
+
+
+class CodecError(ValueError):
+    """A request can't be encoded to JSON"""
+
+
+class JsonCodec:
+    """Standard library codec, always available"""
+
+    name = "json"
+
+    @staticmethod
+    def dumps(obj):
+        try:
+            return json.dumps(obj, separators=(',', ':')).encode()
+        except (TypeError, ValueError) as e:
+            raise CodecError(f"Can't encode to JSON: {e}") from e
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class _FastCodec:
+    """
+    Base of the optional codecs, which only handle 64-bit integers: they would decode wider
+    ones as floats and refuse to encode them. Such documents go through the json module.
+    """
+
+    _encode_errors: tuple = (TypeError, OverflowError)
+
+    def dumps(self, obj):
+        try:
+            return self._dumps(obj)
+        except self._encode_errors:
+            return JsonCodec.dumps(obj)
+
+    def loads(self, data):
+        if _WIDE_INTEGER.search(data if isinstance(data, (bytes, bytearray)) else data.encode()):
+            return JsonCodec.loads(data)
+        return self._loads(data)
+
+
+class OrjsonCodec(_FastCodec):
+    name = "orjson"
+
+    @staticmethod
+    def _dumps(obj):
+        return orjson.dumps(obj)
+
+    @staticmethod
+    def _loads(data):
+        return orjson.loads(data)
+
+
+class MsgspecCodec(_FastCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._encode_errors = (TypeError, OverflowError, msgspec.EncodeError)
+
+    def _dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def _loads(self, data):
+        return self._decoder.decode(data)
+
+
+def get_codec(name="auto"):
+    """
+    :param name: "orjson", "msgspec", "json" or "auto" (fastest installed one)
+    """
+    if name == "auto":
+        name = "orjson" if orjson is not None else "msgspec" if msgspec is not None else "json"
+    if name == "orjson":
+        if orjson is None:
+            raise ValueError("orjson codec requested but orjson is not installed")
+        return OrjsonCodec()
+    if name == "msgspec":
+        if msgspec is None:
+            raise ValueError("msgspec codec requested but msgspec is not installed")
+        return MsgspecCodec()
+    if name == "json":
+        return JsonCodec()
+    raise ValueError(f"Unknown JSON codec: {name}")
+
+
+class JsonStreamParser:
+    """
+    Incrementally decode the elements of one large array (or object) inside a JSON document.
+
+    Feed the document in chunks; every complete element of the container found at `path`
+    (a tuple of object keys from the root) is decoded and returned as soon as it is complete,
+    arrays give elements, objects give (key, value) pairs. Only the current element and the
+    rest of the document (the "skeleton", with the container left empty) are kept in memory,
+    so peak memory is bounded by the largest element instead of the whole response.
+    """
+
+    _structural = re.compile(rb'[{}\[\]",\\]')
+
+    def __init__(self, path, codec=None):
+        self.path = tuple(path)
+        self.codec = codec or JsonCodec()
+        self.found = False
+        self._buffer = bytearray()
+        self._scanned = 0
+        self._stack = []  # frames: [kind, on_path, key, expect_key]
+        self._in_string = False
+        self._string_start = 0
+        self._skip_until = 0
+        self._target_depth = None
+        self._content_start = None
+        self._entry_start = None
+        self._done = False
+
+    def feed(self, data):
+        """Add the next chunk, return the list of elements completed by it"""
+        self._buffer.extend(data)
+        items = []
+        delete = None
+        for match in self._structural.finditer(self._buffer, self._scanned):
+            index = match.start()
+            if index < self._skip_until:
+                continue
+            char = self._buffer[index]
+            if self._in_string:
+                if char == 0x5c:  # backslash escapes the next character
+                    self._skip_until = index + 2
+                elif char == 0x22:
+                    self._in_string = False
+                    self._string_closed(index)
+                continue
+            if char == 0x22:
+                self._in_string = True
+                self._string_start = index
+            elif char in (0x7b, 0x5b):  # { [
+                self._open(char, index)
+            elif char in (0x7d, 0x5d):  # } ]
+                if self._in_target():
+                    self._finish_entry(index, items)
+                    delete = (self._content_start, index)
+                    self._target_depth = None
+                    self._done = True
+                self._stack.pop()
+            elif char == 0x2c:  # ,
+                if self._in_target():
+                    self._finish_entry(index, items)
+                    self._entry_start = index + 1
+                elif self._stack and self._stack[-1][1]:
+                    self._stack[-1][3] = True
+        self._scanned = len(self._buffer)
+
+        if delete is None and self._target_depth is not None:
+            # Drop the elements already returned, keep the one in progress
+            delete = (self._content_start, self._entry_start)
+        if delete is not None and delete[1] > delete[0]:
+            self._delete(*delete)
+        return items
+
+    def close(self):
+        """Return the rest of the document with the streamed container emptied"""
+        return self.codec.loads(bytes(self._buffer))
+
+    def _in_target(self):
+        return self._target_depth is not None and len(self._stack) == self._target_depth
+
+    def _open(self, char, index):
+        depth = len(self._stack) + 1
+        if not self._stack:
+            on_path = True
+        else:
+            parent = self._stack[-1]
+            on_path = (parent[1] and not self._in_target() and parent[0] == 0x7b
+                       and depth - 2 < len(self.path) and parent[2] == self.path[depth - 2])
+        self._stack.append([char, on_path, None, char == 0x7b])
+        if on_path and not self._done and depth - 1 == len(self.path):
+            self.found = True
+            self._target_depth = depth
+            self._content_start = index + 1
+            self._entry_start = index + 1
+
+    def _string_closed(self, index):
+        # Keys only matter for objects on the way to the streamed container
+        frame = self._stack[-1] if self._stack else None
+        if frame is None or frame[0] != 0x7b or not frame[1] or not frame[3] or self._in_target():
+            return
+        frame[2] = json.loads(bytes(self._buffer[self._string_start:index + 1]))
+        frame[3] = False
+
+    def _finish_entry(self, index, items):
+        raw = bytes(self._buffer[self._entry_start:index]).strip()
+        if self._stack[-1][0] == 0x7b:
+            if not raw:
+                return
+            # "key": value, the key is a plain JSON string so the first unescaped quote ends it
+            key_end = re.match(rb'"(?:[^"\\]|\\.)*"', raw).end()
+            value = raw[key_end:].lstrip()[1:]
+            items.append((json.loads(raw[:key_end]), self.codec.loads(value)))
+        elif raw:
+            items.append(self.codec.loads(raw))
+
+    def _delete(self, start, end):
+        del self._buffer[start:end]
+        removed = end - start
+        self._scanned -= removed
+        if self._entry_start is not None and self._entry_start >= end:
+            self._entry_start -= removed
+        if self._string_start >= end:
+            self._string_start -= removed
+        # Escapes inside the deleted range are already consumed
+        self._skip_until = self._skip_until - removed if self._skip_until >= end else 0
@@ -0,0 +1,72 @@
+import time
+
+from loguru import logger
+
+from utils.rpc_codec import JsonCodec
+
+DEFAULT_LOG_MAX_CHARS = 2000
+DEFAULT_SLOW_THRESHOLD_MS = 1000
+LOG_MODES = ("all", "slow")
+
+
+class RpcLogger:
+    """
+    Logging of JSON-RPC traffic for the clients.
+
+    Messages are built lazily, so nothing is serialized when no sink accepts the level.
+    Records are bound with `rpc_method`, `rpc_ms` and `rpc_ok` for structured sinks.
+
+    Modes:
+        all: every request and response, bodies truncated to `max_chars` (0 = no limit)
+        slow: one DEBUG summary line per call; the full request and response bodies are
+            logged only for calls slower than `slow_threshold_ms` or returning an error
+    """
+
+    def __init__(self, mode="all", max_chars=DEFAULT_LOG_MAX_CHARS, slow_threshold_ms=DEFAULT_SLOW_THRESHOLD_MS,
+                 codec=None):
+        if mode not in LOG_MODES:
+            raise ValueError(f"Unknown RPC log mode: {mode}, expected one of {', '.join(LOG_MODES)}")
+        self.mode = mode
+        self.max_chars = max_chars
+        self.slow_threshold_ms = slow_threshold_ms
+        self.codec = codec or JsonCodec()
+
+    def request(self, url, method, payload):
+        if self.mode != "all":
+            return
+        logger.bind(rpc_method=method).opt(lazy=True).info(
+            "Sending {} jsonrpc request to {} with payload:\n {}",
+            lambda: method, lambda: url, lambda: self.format(payload, truncate=True))
+
+    def response(self, url, method, payload, response, started):
+        """
+        :param started: time.perf_counter() value taken before the request was sent
+        """
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        failed = _has_error(response)
+        log = logger.bind(rpc_method=method, rpc_ms=round(elapsed_ms, 1), rpc_ok=not failed)
+        if self.mode == "all":
+            log.opt(lazy=True).info("Response ({} ms): {}",
+                                    lambda: f"{elapsed_ms:.1f}", lambda: self.format(response, truncate=True))
+        elif failed or elapsed_ms >= self.slow_threshold_ms:
+            log.opt(lazy=True).warning(
+                "{} {} call to {} took {} ms\n request: {}\n response: {}",
+                lambda: "Failed" if failed else "Slow", lambda: method, lambda: url,
+                lambda: f"{elapsed_ms:.1f}", lambda: self.format(payload), lambda: self.format(response))
+        else:
+            log.opt(lazy=True).debug("{} took {} ms", lambda: method, lambda: f"{elapsed_ms:.1f}")
+
+    def format(self, body, truncate=False):
+        try:
+            text = self.codec.dumps(body).decode()
+        except (TypeError, ValueError):
+            text = repr(body)
+        if truncate and self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... ({len(text)} chars)"
+        return text
+
+
+def _has_error(response):
+    if isinstance(response, list):
+        return any(_has_error(item) for item in response)
+    return not isinstance(response, dict) or "error" in response
@@ -0,0 +1,23 @@
+"""Classification of JSON-RPC methods shared by the client features (coalescing, retries, ...)"""
+
+# Methods that change node state or consume server-side state (filters, subscriptions)
+STATE_CHANGING_METHODS = {
+    "eth_sendRawTransaction",
+    "eth_sendTransaction",
+    "eth_sign",
+    "eth_signTransaction",
+    "eth_newFilter",
+    "eth_newBlockFilter",
+    "eth_newPendingTransactionFilter",
+    "eth_getFilterChanges",
+    "eth_uninstallFilter",
+    "eth_subscribe",
+    "eth_unsubscribe",
+}
+
+STATE_CHANGING_PREFIXES = ("personal_", "admin_", "miner_", "engine_")
+
+
+def is_read_only(method):
+    """True if sending the call twice has the same effect as sending it once"""
+    return method not in STATE_CHANGING_METHODS and not method.startswith(STATE_CHANGING_PREFIXES)
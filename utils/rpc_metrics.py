@@ -0,0 +1,216 @@
+import json
+import threading
+from pathlib import Path
+
+# Sub-buckets per power of two: values are kept with a relative error below 1 / 2**PRECISION_BITS (~3%)
+PRECISION_BITS = 5
+SUB_BUCKETS = 1 << PRECISION_BITS
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of latencies in microseconds.
+
+    Every power of two is split into SUB_BUCKETS linear buckets, so recording is a couple of
+    integer operations and memory grows with the range of values seen, not with their number.
+    Quantiles are reported as the upper bound of their bucket.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self._buckets = {}
+
+    def record(self, micros):
+        micros = max(int(micros), 0)
+        index = self._index(micros)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += micros
+        self.max = max(self.max, micros)
+        self.min = micros if self.min is None else min(self.min, micros)
+
+    def merge(self, other):
+        for index, count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = max(q * self.count, 1)
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    @staticmethod
+    def _index(value):
+        if value < SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - PRECISION_BITS - 1
+        return SUB_BUCKETS * (shift + 1) + (value >> shift) - SUB_BUCKETS
+
+    @staticmethod
+    def _upper_bound(index):
+        if index < SUB_BUCKETS:
+            return index
+        shift, offset = divmod(index - SUB_BUCKETS, SUB_BUCKETS)
+        return ((SUB_BUCKETS + offset + 1) << shift) - 1
+
+
+class MethodStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.errors += other.errors
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+
+    def summary(self):
+        latency = self.latency
+        summary = {
+            "count": latency.count,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "min_ms": _ms(latency.min),
+            "mean_ms": _ms(latency.total / latency.count) if latency.count else None,
+            "max_ms": _ms(latency.max) if latency.count else None,
+        }
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}_ms"] = _ms(latency.quantile(q))
+        return summary
+
+
+class RpcMetrics:
+    """
+    Per-method latency histograms, error counts and bytes on the wire of the calls a client sends.
+
+    A batch counts once for every request in it, with the latency of the whole batch and its
+    bytes split evenly between the requests.
+    """
+
+    def __init__(self):
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, seconds, bytes_sent=0, bytes_received=0, error=False):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.latency.record(seconds * 1e6)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            if error:
+                stats.errors += 1
+
+    def record_exchange(self, payload, response, seconds, wire_sizes=(0, 0)):
+        """Record one request or batch and its response (None when the transport failed)"""
+        requests_list = payload if isinstance(payload, list) else [payload]
+        if isinstance(response, list):
+            failed = {item.get("id") for item in response if "error" in item}
+        elif isinstance(response, dict):
+            failed = {item.get("id") for item in requests_list} if "error" in response else set()
+        else:
+            failed = {item.get("id") for item in requests_list}
+        share = len(requests_list)
+        for request in requests_list:
+            self.record(request["method"], seconds, wire_sizes[0] // share, wire_sizes[1] // share,
+                        error=request.get("id") in failed)
+
+    def snapshot(self):
+        """Summary per method and per namespace (eth, debug, trace, ...)"""
+        with self._lock:
+            methods = {method: stats for method, stats in self._methods.items()}
+            namespaces = {}
+            for method, stats in methods.items():
+                namespace = method.split("_", 1)[0]
+                namespaces.setdefault(namespace, MethodStats()).merge(stats)
+            return {
+                "methods": {method: stats.summary() for method, stats in sorted(methods.items())},
+                "namespaces": {namespace: stats.summary() for namespace, stats in sorted(namespaces.items())},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+
+    def state(self):
+        """Raw histograms and counters of plain lists and numbers, to merge in another process with merge_state()"""
+        with self._lock:
+            return {method: {"buckets": sorted(stats.latency._buckets.items()), "count": stats.latency.count,
+                             "total": stats.latency.total, "min": stats.latency.min, "max": stats.latency.max,
+                             "errors": stats.errors, "bytes_sent": stats.bytes_sent,
+                             "bytes_received": stats.bytes_received}
+                    for method, stats in self._methods.items()}
+
+    def merge_state(self, state):
+        """Add the metrics of another client, from its state()"""
+        for method, item in state.items():
+            other = MethodStats()
+            other.latency._buckets = {index: count for index, count in item["buckets"]}
+            other.latency.count = item["count"]
+            other.latency.total = item["total"]
+            other.latency.min = item["min"]
+            other.latency.max = item["max"]
+            other.errors = item["errors"]
+            other.bytes_sent = item["bytes_sent"]
+            other.bytes_received = item["bytes_received"]
+            with self._lock:
+                self._methods.setdefault(method, MethodStats()).merge(other)
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="jsonrpc_client"):
+        """Prometheus text exposition format: latency summaries and counters labelled by method"""
+        snapshot = self.snapshot()["methods"]
+        lines = [
+            f"# HELP {prefix}_request_duration_seconds Latency of JSON-RPC calls",
+            f"# TYPE {prefix}_request_duration_seconds summary",
+        ]
+        with self._lock:
+            latencies = {method: stats.latency for method, stats in self._methods.items()}
+        for method, latency in sorted(latencies.items()):
+            for q in QUANTILES:
+                lines.append(f'{prefix}_request_duration_seconds{{method="{method}",quantile="{q}"}} '
+                             f'{latency.quantile(q) / 1e6}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{method="{method}"}} {latency.total / 1e6}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{method="{method}"}} {latency.count}')
+        for name, key, description in (
+            ("errors_total", "errors", "JSON-RPC calls answered with an error or failed in transport"),
+            ("request_bytes_total", "bytes_sent", "Bytes of JSON-RPC requests sent"),
+            ("response_bytes_total", "bytes_received", "Bytes of JSON-RPC responses received"),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for method, summary in snapshot.items():
+                lines.append(f'{prefix}_{name}{{method="{method}"}} {summary[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write `<path>.json` and `<path>.prom`"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.with_suffix(".json").write_text(self.to_json())
+        path.with_suffix(".prom").write_text(self.to_prometheus())
+
+
+def _ms(micros):
+    return round(micros / 1000, 3) if micros is not None else None
@@ -0,0 +1,257 @@
+import fnmatch
+import random
+import threading
+import time
+
+from loguru import logger
+from requests.exceptions import ReadTimeout
+
+from utils.rpc_methods import is_read_only
+
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF_MS = 100
+DEFAULT_MAX_BACKOFF_MS = 2000
+DEFAULT_RETRY_BUDGET = 0.2
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET_SECONDS = 5
+# Tracing a large block takes much longer than a regular call
+DEFAULT_METHOD_POLICIES = "debug_trace*: timeout=120; trace_*: timeout=120"
+
+# JSON-RPC error codes worth retrying: the node refused the call for now (rate/resource limits)
+RETRYABLE_ERROR_CODES = {-32005}
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending a call while the node is considered down"""
+
+
+class MethodPolicy:
+    """
+    How calls of one method are sent.
+
+    :param timeout: read timeout in seconds, None keeps the client timeout
+    :param retries: retries after a transport error other than a read timeout (or after a retryable
+        error code), only for idempotent methods
+    :param backoff_ms: base delay before the first retry, doubled for every next one, with jitter
+    :param max_backoff_ms: upper bound of the delay between retries
+    """
+
+    def __init__(self, timeout=None, retries=DEFAULT_RETRIES, backoff_ms=DEFAULT_RETRY_BACKOFF_MS,
+                 max_backoff_ms=DEFAULT_MAX_BACKOFF_MS):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number `attempt` (1-based), "equal jitter" backoff"""
+        cap = min(self.max_backoff_ms, self.backoff_ms * 2 ** (attempt - 1)) / 1000
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def updated(self, **changes):
+        return MethodPolicy(**{**vars(self), **changes})
+
+
+def parse_method_policies(text, default):
+    """
+    Parse "pattern: key=value, key=value; pattern: ..." (fnmatch patterns, keys of MethodPolicy)
+    into an ordered list of (pattern, MethodPolicy); the first matching pattern wins.
+    """
+    policies = []
+    for entry in text.replace("\n", ";").split(";"):
+        if not entry.strip():
+            continue
+        pattern, _, settings = entry.partition(":")
+        changes = {}
+        for setting in settings.split(","):
+            if not setting.strip():
+                continue
+            key, _, value = setting.partition("=")
+            key = key.strip()
+            if key not in vars(default):
+                raise ValueError(f"Unknown method policy setting {key!r} in {entry.strip()!r}")
+            changes[key] = int(value) if key == "retries" else float(value)
+        policies.append((pattern.strip(), default.updated(**changes)))
+    return policies
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of the successful calls, so retries can't multiply the load on a
+    struggling node. Every success deposits `ratio` of a token (up to `reserve`), every retry takes one.
+    """
+
+    def __init__(self, ratio=DEFAULT_RETRY_BUDGET, reserve=10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.reserve)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transport failures: calls then fail immediately
+    with CircuitOpenError. After `reset_timeout` seconds a single trial call is let through,
+    its success closes the circuit again, its failure keeps it open for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_BREAKER_FAILURES, reset_timeout=DEFAULT_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.opened = 0
+        self.rejected = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            retry_in = max(self.reset_timeout - (time.monotonic() - self._opened_at), 0)
+        raise CircuitOpenError(f"Circuit open after {self.failure_threshold} consecutive failures, "
+                               f"next attempt in {retry_in:.1f} s")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self._failures >= self.failure_threshold):
+                if self.state == "closed":
+                    logger.error(f"{self._failures} consecutive transport failures, failing calls fast "
+                                 f"for {self.reset_timeout} s")
+                self.state = "open"
+                self.opened += 1
+                self._opened_at = time.monotonic()
+
+
+class RequestPolicy:
+    """
+    Per-method timeouts and retries plus the retry budget and circuit breaker shared by all calls.
+
+    :param method_policies: list of (fnmatch pattern, MethodPolicy), the first match wins,
+        methods matching none use `default`
+    """
+
+    def __init__(self, default=None, method_policies=(), budget=None, breaker=None):
+        self.default = default or MethodPolicy()
+        self.method_policies = list(method_policies)
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = 0
+
+    @classmethod
+    def from_config(cls, configuration):
+        default = MethodPolicy(
+            retries=int(configuration.get("rpc_retries", DEFAULT_RETRIES)),
+            backoff_ms=float(configuration.get("rpc_retry_backoff_ms", DEFAULT_RETRY_BACKOFF_MS)),
+        )
+        return cls(
+            default,
+            parse_method_policies(configuration.get("rpc_method_policies", DEFAULT_METHOD_POLICIES), default),
+            RetryBudget(float(configuration.get("rpc_retry_budget", DEFAULT_RETRY_BUDGET))),
+            CircuitBreaker(int(configuration.get("rpc_breaker_failures", DEFAULT_BREAKER_FAILURES)),
+                           float(configuration.get("rpc_breaker_reset_seconds", DEFAULT_BREAKER_RESET_SECONDS))),
+        )
+
+    def policy_for(self, method):
+        for pattern, policy in self.method_policies:
+            if fnmatch.fnmatchcase(method, pattern):
+                return policy
+        return self.default
+
+    def execute(self, payload, send):
+        """
+        Send `payload` following the policy of its method (a batch uses the policy of its first
+        method with the longest timeout among its methods).
+
+        :param send: callable(payload, timeout) doing the actual request
+        :raises CircuitOpenError: while the circuit is open
+        """
+        methods = [request["method"] for request in payload] if isinstance(payload, list) else [payload["method"]]
+        policies = [self.policy_for(method) for method in methods] or [self.default]
+        policy = policies[0]
+        timeouts = [p.timeout for p in policies if p.timeout is not None]
+        timeout = max(timeouts) if timeouts else None
+        idempotent = all(is_read_only(method) for method in methods)
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = send(payload, timeout)
+            except OSError as e:
+                status = http_status(e)
+                if status is not None:
+                    # The node (or its proxy) answered: it is reachable, that is all the breaker tracks.
+                    # A 429 is not retried here, the rate limiter already holds calls back for its Retry-After
+                    self.breaker.record_success()
+                    if status == 429 or not self._can_retry(policy, attempt, idempotent):
+                        raise
+                else:
+                    self.breaker.record_failure()
+                    # A node too slow to answer in time only gets slower when the call is repeated
+                    if isinstance(e, (ReadTimeout, TimeoutError)) or not self._can_retry(policy, attempt, idempotent):
+                        raise
+                error = e
+            else:
+                self.breaker.record_success()
+                if not _retryable_error(response) or not self._can_retry(policy, attempt, idempotent):
+                    self.budget.deposit()
+                    return response
+                error = response["error"]
+            attempt += 1
+            delay = policy.delay(attempt)
+            logger.warning(f"{methods[0]} failed ({error}), retry {attempt}/{policy.retries} in {delay * 1000:.0f} ms")
+            time.sleep(delay)
+
+    def _can_retry(self, policy, attempt, idempotent):
+        if not idempotent or attempt >= policy.retries or self.breaker.state != "closed":
+            return False
+        if not self.budget.withdraw():
+            logger.warning("Retry budget exhausted, not retrying")
+            return False
+        self.retries += 1
+        return True
+
+    def stats(self):
+        return {
+            "retries": self.retries,
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "breaker_rejected": self.breaker.rejected,
+        }
+
+
+def http_status(error):
+    """HTTP status code of an error raised for an HTTP error answer, None for transport failures"""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _retryable_error(response):
+    return isinstance(response, dict) and response.get("error", {}).get("code") in RETRYABLE_ERROR_CODES
@@ -0,0 +1,265 @@
+"""
+Compact typed views of JSON-RPC blocks, transactions, receipts and logs.
+
+Objects use __slots__ instead of a dict per object. Hashes, addresses and byte strings are
+stored as bytes. Quantities are kept as received and converted to int on first access, the int
+then replaces the hex string, so repeated reads cost nothing. Fields a node sends that are not
+modelled here are kept in `extra`. `to_dict()` gives back the JSON-RPC form.
+
+Values repeated within one decoded result (block hash and number in every transaction, common
+senders, small quantities) share a single object.
+"""
+from typing import ClassVar
+
+QUANTITY = "quantity"
+BYTES = "bytes"
+BYTES_LIST = "bytes_list"
+RAW = "raw"
+
+
+class _Quantity:
+    """Descriptor converting a hex quantity to int on first access and caching it in its slot"""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if isinstance(value, str):
+            value = int(value, 16)
+            setattr(obj, self.slot, value)
+        return value
+
+
+def _to_bytes(value):
+    return bytes.fromhex(value[2:]) if isinstance(value, str) else value
+
+
+def _shared_bytes(value, memo):
+    # keyed with the kind: the same hex string can be a quantity in another field
+    shared = memo.get((BYTES, value))
+    if shared is None:
+        shared = memo[(BYTES, value)] = _to_bytes(value)
+    return shared
+
+
+def _to_hex(value):
+    return "0x" + value.hex()
+
+
+class RpcObject:
+    # JSON key -> (attribute, kind), kind is a converter constant or an RpcObject subclass
+    fields: ClassVar[dict] = {}
+    __slots__ = ("extra",)
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        for key, (attribute, kind) in cls.fields.items():
+            if kind == QUANTITY:
+                setattr(cls, attribute, _Quantity(f"_{attribute}"))
+
+    @classmethod
+    def from_rpc(cls, data, memo=None):
+        """
+        Build from a JSON-RPC result dict, None stays None
+
+        :param memo: dict shared between the objects decoded from one result to deduplicate values
+        """
+        if data is None:
+            return None
+        if memo is None:
+            memo = {}
+        obj = cls.__new__(cls)
+        for key, (attribute, kind) in cls.fields.items():
+            value = data.get(key)
+            if value is None or kind == RAW:
+                pass
+            elif kind == QUANTITY:
+                value = memo.setdefault((QUANTITY, value), value)
+            elif kind == BYTES:
+                value = _shared_bytes(value, memo)
+            elif kind == BYTES_LIST:
+                value = tuple(_shared_bytes(item, memo) for item in value)
+            else:
+                value = tuple(kind.from_rpc(item, memo) for item in value)
+            setattr(obj, f"_{attribute}" if kind == QUANTITY else attribute, value)
+        extra = {key: value for key, value in data.items() if key not in cls.fields}
+        obj.extra = extra or None
+        return obj
+
+    def to_dict(self):
+        """JSON-RPC representation (hex strings), missing and null fields are left out"""
+        data = {}
+        for key, (attribute, kind) in self.fields.items():
+            value = getattr(self, attribute)
+            if value is None:
+                continue
+            if kind == QUANTITY:
+                value = hex(value)
+            elif kind == BYTES:
+                value = _to_hex(value)
+            elif kind == BYTES_LIST:
+                value = [_to_hex(item) for item in value]
+            elif isinstance(kind, type):
+                value = [item.to_dict() if isinstance(item, RpcObject) else _to_hex(item) for item in value]
+            data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        identity = ", ".join(f"{name}={_to_hex(value) if isinstance(value, bytes) else value}"
+                             for name in self._repr_fields for value in [getattr(self, name)])
+        return f"{type(self).__name__}({identity})"
+
+
+def _slots(fields):
+    return tuple(f"_{attribute}" if kind == QUANTITY else attribute for attribute, kind in fields.values())
+
+
+class Log(RpcObject):
+    fields = {
+        "address": ("address", BYTES),
+        "topics": ("topics", BYTES_LIST),
+        "data": ("data", BYTES),
+        "blockNumber": ("blockNumber", QUANTITY),
+        "blockHash": ("blockHash", BYTES),
+        "transactionHash": ("transactionHash", BYTES),
+        "transactionIndex": ("transactionIndex", QUANTITY),
+        "logIndex": ("logIndex", QUANTITY),
+        "removed": ("removed", RAW),
+    }
+    __slots__ = _slots(fields)
+    _repr_fields = ("blockNumber", "logIndex", "address")
+
+
+class Receipt(RpcObject):
+    fields = {
+        "transactionHash": ("transactionHash", BYTES),
+        "transactionIndex": ("transactionIndex", QUANTITY),
+        "blockHash": ("blockHash", BYTES),
+        "blockNumber": ("blockNumber", QUANTITY),
+        "from": ("from_", BYTES),
+        "to": ("to", BYTES),
+        "cumulativeGasUsed": ("cumulativeGasUsed", QUANTITY),
+        "gasUsed": ("gasUsed", QUANTITY),
+        "effectiveGasPrice": ("effectiveGasPrice", QUANTITY),
+        "contractAddress": ("contractAddress", BYTES),
+        "logs": ("logs", Log),
+        "logsBloom": ("logsBloom", BYTES),
+        "status": ("status", QUANTITY),
+        "type": ("type", QUANTITY),
+        "blobGasUsed": ("blobGasUsed", QUANTITY),
+        "blobGasPrice": ("blobGasPrice", QUANTITY),
+    }
+    __slots__ = _slots(fields)
+    _repr_fields = ("transactionHash", "blockNumber", "status")
+
+
+class Transaction(RpcObject):
+    fields = {
+        "hash": ("hash", BYTES),
+        "nonce": ("nonce", QUANTITY),
+        "blockHash": ("blockHash", BYTES),
+        "blockNumber": ("blockNumber", QUANTITY),
+        "transactionIndex": ("transactionIndex", QUANTITY),
+        "from": ("from_", BYTES),
+        "to": ("to", BYTES),
+        "value": ("value", QUANTITY),
+        "gas": ("gas", QUANTITY),
+        "gasPrice": ("gasPrice", QUANTITY),
+        "maxFeePerGas": ("maxFeePerGas", QUANTITY),
+        "maxPriorityFeePerGas": ("maxPriorityFeePerGas", QUANTITY),
+        "maxFeePerBlobGas": ("maxFeePerBlobGas", QUANTITY),
+        "blobVersionedHashes": ("blobVersionedHashes", BYTES_LIST),
+        "input": ("input", BYTES),
+        "type": ("type", QUANTITY),
+        "chainId": ("chainId", QUANTITY),
+        "accessList": ("accessList", RAW),
+        "v": ("v", QUANTITY),
+        "yParity": ("yParity", QUANTITY),
+        "r": ("r", QUANTITY),
+        "s": ("s", QUANTITY),
+    }
+    __slots__ = _slots(fields)
+    _repr_fields = ("hash", "blockNumber")
+
+
+class Block(RpcObject):
+    fields = {
+        "number": ("number", QUANTITY),
+        "hash": ("hash", BYTES),
+        "parentHash": ("parentHash", BYTES),
+        "sha3Uncles": ("sha3Uncles", BYTES),
+        "miner": ("miner", BYTES),
+        "stateRoot": ("stateRoot", BYTES),
+        "transactionsRoot": ("transactionsRoot", BYTES),
+        "receiptsRoot": ("receiptsRoot", BYTES),
+        "logsBloom": ("logsBloom", BYTES),
+        "difficulty": ("difficulty", QUANTITY),
+        "totalDifficulty": ("totalDifficulty", QUANTITY),
+        "extraData": ("extraData", BYTES),
+        "size": ("size", QUANTITY),
+        "gasLimit": ("gasLimit", QUANTITY),
+        "gasUsed": ("gasUsed", QUANTITY),
+        "timestamp": ("timestamp", QUANTITY),
+        "mixHash": ("mixHash", BYTES),
+        "nonce": ("nonce", BYTES),
+        "baseFeePerGas": ("baseFeePerGas", QUANTITY),
+        "withdrawalsRoot": ("withdrawalsRoot", BYTES),
+        "withdrawals": ("withdrawals", RAW),
+        "blobGasUsed": ("blobGasUsed", QUANTITY),
+        "excessBlobGas": ("excessBlobGas", QUANTITY),
+        "parentBeaconBlockRoot": ("parentBeaconBlockRoot", BYTES),
+        "requestsHash": ("requestsHash", BYTES),
+        "transactions": ("transactions", Transaction),
+        "uncles": ("uncles", BYTES_LIST),
+    }
+    __slots__ = _slots(fields)
+    _repr_fields = ("number", "hash")
+
+    @classmethod
+    def from_rpc(cls, data, memo=None):
+        if data is None:
+            return None
+        transactions = data.get("transactions")
+        if transactions and isinstance(transactions[0], str):
+            # Block fetched without full transactions: keep the hashes only
+            block = super().from_rpc({**data, "transactions": None}, memo)
+            block.transactions = tuple(_to_bytes(tx_hash) for tx_hash in transactions)
+            return block
+        return super().from_rpc(data, memo)
+
+    @property
+    def transaction_hashes(self):
+        return tuple(tx if isinstance(tx, bytes) else tx.hash for tx in self.transactions or ())
+
+
+def _list_of(cls):
+    def decode(result):
+        return [cls.from_rpc(item) for item in result] if result is not None else None
+    return decode
+
+
+# Results decoded by JsonRpcClient in typed mode
+TYPED_RESULTS = {
+    "eth_getBlockByNumber": Block.from_rpc,
+    "eth_getBlockByHash": Block.from_rpc,
+    "eth_getUncleByBlockHashAndIndex": Block.from_rpc,
+    "eth_getUncleByBlockNumberAndIndex": Block.from_rpc,
+    "eth_getTransactionByHash": Transaction.from_rpc,
+    "eth_getTransactionByBlockHashAndIndex": Transaction.from_rpc,
+    "eth_getTransactionByBlockNumberAndIndex": Transaction.from_rpc,
+    "eth_getTransactionReceipt": Receipt.from_rpc,
+    "eth_getBlockReceipts": _list_of(Receipt),
+    "eth_getLogs": _list_of(Log),
+    "eth_getFilterLogs": _list_of(Log),
+}
+
+
+def decode_result(method, result):
+    """Typed view of `result` for the methods in TYPED_RESULTS, other results are returned as is"""
+    decode = TYPED_RESULTS.get(method)
+    return decode(result) if decode is not None and result is not None else result
@@ -0,0 +1,521 @@
+import itertools
+import queue
+import re
+import socket
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+from websockets.exceptions import WebSocketException
+from websockets.sync.client import connect as ws_connect
+
+from utils.http_compression import DEFAULT_COMPRESS_MIN_BYTES, accept_encoding, encode_body
+from utils.rpc_codec import JsonCodec
+
+try:
+    import httpx
+except ImportError:  # optional, only needed for HTTP/2
+    httpx = None  # type: ignore[assignment, unused-ignore]
+
+
+class HttpTransport:
+    """JSON-RPC over HTTP with a pooled keep-alive session"""
+
+    supports_subscriptions = False
+
+    def __init__(self, url, timeout, keep_alive=True, pool_connections=10, pool_maxsize=20, pool_block=False,
+                 codec=None, connect_timeout=None, compression=None, compress_min_bytes=DEFAULT_COMPRESS_MIN_BYTES):
+        self.url = url
+        self.timeout = timeout
+        # A dead host is detected after `connect_timeout` instead of the (much longer) read timeout
+        self.connect_timeout = connect_timeout
+        self.keep_alive = keep_alive
+        self.codec = codec or JsonCodec()
+        # Request bodies of at least `compress_min_bytes` are sent with this Content-Encoding
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self._local = threading.local()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "Accept-Encoding": accept_encoding()})
+        if not keep_alive:
+            # Compatibility mode: every request opens and closes its own connection (macOS workaround)
+            self.session.headers.update({"Connection": "close"})
+
+    def send(self, payload, timeout=None):
+        body, headers = encode_body(self.codec.dumps(payload), self.compression, self.compress_min_bytes)
+        response = self.session.post(self.url, data=body, headers=headers, timeout=self._timeout(timeout))
+        response.raise_for_status()
+        content = response.content
+        # raw.tell() counts the bytes read from the socket, before the response is decompressed
+        self._local.sizes = (len(body), response.raw.tell() or len(content))
+        try:
+            return self.codec.loads(content)
+        except ValueError as e:
+            raise requests.exceptions.InvalidJSONError(f"Invalid JSON response: {e}", response=response)
+
+    def send_stream(self, payload, chunk_size=1 << 16):
+        """Send a request and yield the raw response body in chunks as it arrives"""
+        body, headers = encode_body(self.codec.dumps(payload), self.compression, self.compress_min_bytes)
+        with self.session.post(self.url, data=body, headers=headers, timeout=self._timeout(None),
+                               stream=True) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size)
+
+    def wire_sizes(self):
+        """(bytes sent, bytes received) of the last send() made by the calling thread"""
+        return getattr(self._local, "sizes", (0, 0))
+
+    def _timeout(self, timeout):
+        timeout = timeout or self.timeout
+        return (self.connect_timeout, timeout) if self.connect_timeout else timeout
+
+    def close(self):
+        self.session.close()
+
+
+class Http2Transport:
+    """
+    JSON-RPC over HTTP/2 (httpx): concurrent calls from any number of threads are multiplexed as
+    streams of one connection instead of taking a pooled connection each.
+
+    HTTP/2 is negotiated with ALPN during the TLS handshake, so it only happens on https://
+    endpoints; servers that don't negotiate it are spoken to over HTTP/1.1. Plain http:// endpoints
+    stay on HTTP/1.1 unless `prior_knowledge` is set, which sends HTTP/2 right away (h2c) and only
+    works with nodes that accept cleartext HTTP/2.
+    """
+
+    supports_subscriptions = False
+
+    def __init__(self, url, timeout, codec=None, connect_timeout=None, compression=None,
+                 compress_min_bytes=DEFAULT_COMPRESS_MIN_BYTES, max_connections=10, prior_knowledge=False):
+        if httpx is None:
+            raise ValueError("HTTP/2 transport requested but httpx is not installed (pip install 'httpx[http2]')")
+        if url.startswith("http://") and not prior_knowledge:
+            logger.warning(f"HTTP/2 is only negotiated on https:// endpoints, {url} is spoken to over HTTP/1.1. "
+                           f"Enable prior knowledge (h2c) if the node accepts cleartext HTTP/2")
+        self.url = url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.codec = codec or JsonCodec()
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self._local = threading.local()
+        self.client = httpx.Client(
+            http1=not prior_knowledge,
+            http2=True,
+            limits=httpx.Limits(max_connections=max_connections),
+            headers={"Content-Type": "application/json", "Accept-Encoding": accept_encoding()},
+        )
+
+    def send(self, payload, timeout=None):
+        body, headers = encode_body(self.codec.dumps(payload), self.compression, self.compress_min_bytes)
+        try:
+            response = self.client.post(self.url, content=body, headers=headers, timeout=self._timeout(timeout))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise self._os_error(e) from e
+        # num_bytes_downloaded counts the body as received, before it is decompressed
+        self._local.sizes = (len(body), response.num_bytes_downloaded)
+        try:
+            return self.codec.loads(response.content)
+        except ValueError as e:
+            raise requests.exceptions.InvalidJSONError(f"Invalid JSON response: {e}")
+
+    def send_stream(self, payload, chunk_size=1 << 16):
+        """Send a request and yield the raw response body in chunks as it arrives"""
+        body, headers = encode_body(self.codec.dumps(payload), self.compression, self.compress_min_bytes)
+        try:
+            with self.client.stream("POST", self.url, content=body, headers=headers,
+                                    timeout=self._timeout(None)) as response:
+                response.raise_for_status()
+                yield from response.iter_bytes(chunk_size)
+        except httpx.HTTPError as e:
+            raise self._os_error(e) from e
+
+    def _os_error(self, error):
+        """
+        Transport failures are OSErrors for the client, like with the requests based transport.
+        HTTP error answers become requests HTTPErrors whose `response` has the status code and
+        headers, so a 429 pauses the rate limiter for its Retry-After.
+        """
+        if isinstance(error, httpx.HTTPStatusError):
+            return requests.exceptions.HTTPError(f"{self.url}: {error}", response=error.response)
+        if isinstance(error, httpx.ReadTimeout):
+            return TimeoutError(f"{self.url}: {error}")
+        return ConnectionError(f"{self.url}: {error}")
+
+    def wire_sizes(self):
+        """(bytes sent, bytes received) of the last send() made by the calling thread"""
+        return getattr(self._local, "sizes", (0, 0))
+
+    def _timeout(self, timeout):
+        return httpx.Timeout(timeout or self.timeout, connect=self.connect_timeout or timeout or self.timeout)
+
+    def close(self):
+        self.client.close()
+
+
+class Subscription:
+    """
+    Notifications of one eth_subscribe subscription.
+
+    Without a callback, notifications are queued and consumed by iterating the subscription
+    or with get(). With a callback, the callback is invoked from the transport reader thread
+    and must return quickly.
+    """
+
+    _closed = object()
+
+    def __init__(self, client, subscription_id, kind, callback=None, max_queue=10000):
+        self.client = client
+        self.id = subscription_id
+        self.kind = kind
+        self.callback = callback
+        self.active = True
+        self._queue = queue.Queue(max_queue)
+
+    def get(self, timeout=None):
+        """Return the next notification, raise TimeoutError if none arrives within `timeout`"""
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No {self.kind} notification within {timeout} s")
+        if item is self._closed:
+            # Keep the marker for other consumers of the same subscription
+            self._queue.put(item)
+            raise ConnectionError(f"Subscription {self.id} ({self.kind}) is closed")
+        return item
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get()
+            except ConnectionError:
+                return
+
+    def unsubscribe(self):
+        if not self.active:
+            return
+        self.client.call("eth_unsubscribe", [self.id])
+        self.client.transport.unregister_subscription(self.id)
+
+    def _deliver(self, item):
+        if self.callback is not None:
+            try:
+                self.callback(item)
+            except Exception as e:
+                logger.error(f"Subscription {self.id} ({self.kind}) callback failed: {e}")
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Slow consumer: drop the oldest notification rather than blocking the reader thread
+            logger.warning(f"Subscription {self.id} ({self.kind}) queue is full, dropping oldest notification")
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(item)
+
+    def _close(self):
+        self.active = False
+        self._queue.put(self._closed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unsubscribe()
+
+
+class StreamTransport:
+    """
+    Base class for persistent duplex connections (WebSocket, IPC).
+
+    Requests from any number of threads are multiplexed over one connection: ids are rewritten
+    to connection-unique ones, a reader thread routes responses back to their callers and
+    eth_subscription notifications to their Subscription.
+    """
+
+    supports_subscriptions = True
+    # notifications kept for a subscription id that is not registered yet
+    max_unclaimed_notifications = 1000
+
+    def __init__(self, url, timeout, codec=None):
+        self.url = url
+        self.timeout = timeout
+        self.codec = codec or JsonCodec()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._connected = False
+        self._pending = {}
+        self._pending_batches = []
+        self._subscriptions = {}
+        self._unclaimed = {}
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _disconnect(self):
+        raise NotImplementedError
+
+    def _write(self, data):
+        raise NotImplementedError
+
+    def _read(self):
+        """Return the next complete message (str or bytes), raise ConnectionError when the connection is gone"""
+        raise NotImplementedError
+
+    def send(self, payload, timeout=None):
+        timeout = timeout or self.timeout
+        self._ensure_connected()
+        requests_list = payload if isinstance(payload, list) else [payload]
+        original_ids = []
+        futures = []
+        with self._lock:
+            wire_requests = []
+            for request in requests_list:
+                wire_id = next(self._ids)
+                future = Future()
+                self._pending[wire_id] = future
+                original_ids.append(request.get("id"))
+                futures.append((wire_id, future))
+                wire_requests.append({**request, "id": wire_id})
+            if isinstance(payload, list):
+                self._pending_batches.append(futures)
+
+        try:
+            data = self.codec.dumps(wire_requests if isinstance(payload, list) else wire_requests[0])
+            self._write(data)
+            deadline = time.monotonic() + timeout
+            responses = []
+            for (wire_id, future), original_id in zip(futures, original_ids):
+                try:
+                    response = future.result(timeout=max(deadline - time.monotonic(), 0))
+                except FutureTimeoutError:
+                    raise TimeoutError(f"No response from {self.url} within {timeout} s")
+                responses.append({**response, "id": original_id})
+            self._local.sizes = (len(data), sum(getattr(future, "received_bytes", 0) for _, future in futures))
+        finally:
+            with self._lock:
+                for wire_id, _ in futures:
+                    self._pending.pop(wire_id, None)
+                if isinstance(payload, list) and futures in self._pending_batches:
+                    self._pending_batches.remove(futures)
+        return responses if isinstance(payload, list) else responses[0]
+
+    def wire_sizes(self):
+        """(bytes sent, bytes received) of the last send() made by the calling thread"""
+        return getattr(self._local, "sizes", (0, 0))
+
+    def register_subscription(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.id] = subscription
+            early = self._unclaimed.pop(subscription.id, [])
+        for item in early:
+            subscription._deliver(item)
+
+    def unregister_subscription(self, subscription_id):
+        with self._lock:
+            subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is not None:
+            subscription._close()
+
+    def close(self):
+        with self._lock:
+            was_connected = self._connected
+            self._connected = False
+        if was_connected:
+            try:
+                self._disconnect()
+            except Exception:
+                pass  # Ignore errors when closing
+        self._fail_all(ConnectionError(f"Connection to {self.url} closed"))
+
+    def _ensure_connected(self):
+        with self._lock:
+            if self._connected:
+                return
+            try:
+                self._connect()
+            except (OSError, WebSocketException) as e:
+                raise ConnectionError(f"Could not connect to {self.url}: {e}") from e
+            self._connected = True
+        threading.Thread(target=self._read_loop, name=f"rpc-reader-{self.url}", daemon=True).start()
+
+    def _read_loop(self):
+        try:
+            while True:
+                message = self._read()
+                self._dispatch(self.codec.loads(message), len(message))
+        except Exception as e:
+            with self._lock:
+                was_connected = self._connected
+                self._connected = False
+            if was_connected:
+                logger.error(f"Connection to {self.url} lost: {e}")
+            self._fail_all(ConnectionError(f"Connection to {self.url} lost: {e}"))
+
+    def _dispatch(self, message, size=0):
+        if isinstance(message, list):
+            for item in message:
+                self._dispatch(item, size // max(len(message), 1))
+            return
+        if message.get("method") == "eth_subscription":
+            params = message.get("params", {})
+            self._deliver_notification(params.get("subscription"), params.get("result"))
+            return
+        with self._lock:
+            if message.get("id") is None and "error" in message and self._pending_batches:
+                # Whole batch rejected (e.g. too large): the node can't tell us which one, assume the oldest
+                for wire_id, future in self._pending_batches.pop(0):
+                    self._pending.pop(wire_id, None)
+                    future.set_result({"jsonrpc": "2.0", "id": wire_id, "error": message["error"]})
+                return
+            future = self._pending.pop(message.get("id"), None)
+        if future is not None:
+            future.received_bytes = size
+            future.set_result(message)
+        else:
+            logger.warning(f"Dropping response without a waiting request: {message}")
+
+    def _deliver_notification(self, subscription_id, item):
+        with self._lock:
+            subscription = self._subscriptions.get(subscription_id)
+            if subscription is None:
+                unclaimed = self._unclaimed.setdefault(subscription_id, [])
+                if len(unclaimed) < self.max_unclaimed_notifications:
+                    unclaimed.append(item)
+                return
+        subscription._deliver(item)
+
+    def _fail_all(self, error):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._pending_batches.clear()
+            subscriptions = list(self._subscriptions.values())
+            self._subscriptions.clear()
+            self._unclaimed.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+        # Subscriptions don't survive reconnects, close them so iterators stop
+        for subscription in subscriptions:
+            subscription._close()
+
+
+class WebSocketTransport(StreamTransport):
+    """JSON-RPC over a single multiplexed WebSocket connection"""
+
+    def _connect(self):
+        self._ws = ws_connect(self.url, max_size=None, open_timeout=self.timeout)
+
+    def _disconnect(self):
+        self._ws.close()
+
+    def _write(self, data):
+        try:
+            # Nodes expect text frames
+            self._ws.send(data.decode())
+        except WebSocketException as e:
+            raise ConnectionError(f"Could not send to {self.url}: {e}") from e
+
+    def _read(self):
+        try:
+            return self._ws.recv()
+        except WebSocketException as e:
+            raise ConnectionError(str(e)) from e
+
+
+class JsonMessageSplitter:
+    """
+    Split a byte stream of concatenated JSON documents (as sent over IPC) into messages.
+
+    Only structural characters are inspected, so finding the end of a large response stays linear.
+    """
+
+    _structural = re.compile(rb'[{}\[\]"\\]')
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+        self._skip_until = 0
+
+    def feed(self, data):
+        """Add received bytes, return the list of complete messages (as bytes)"""
+        self._buffer.extend(data)
+        messages = []
+        position = 0
+        for match in self._structural.finditer(self._buffer, self._scanned):
+            index = match.start()
+            if index < self._skip_until:
+                continue
+            char = self._buffer[index]
+            if self._in_string:
+                if char == 0x5c:  # backslash escapes the next character
+                    self._skip_until = index + 2
+                elif char == 0x22:
+                    self._in_string = False
+            elif char == 0x22:
+                self._in_string = True
+            elif char in (0x7b, 0x5b):
+                self._depth += 1
+            elif char in (0x7d, 0x5d):
+                self._depth -= 1
+                if self._depth == 0:
+                    messages.append(bytes(self._buffer[position:index + 1]).strip())
+                    position = index + 1
+        del self._buffer[:position]
+        self._skip_until = max(self._skip_until - position, 0)
+        self._scanned = len(self._buffer)
+        return messages
+
+
+class IpcTransport(StreamTransport):
+    """JSON-RPC over the node's Unix domain socket, for harnesses running next to the node"""
+
+    read_size = 1 << 16
+
+    def __init__(self, path, timeout, codec=None):
+        super().__init__(path, timeout, codec)
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._messages = []
+
+    def _connect(self):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(self.timeout)
+        self._socket.connect(self.path)
+        # The reader thread blocks until the node sends something
+        self._socket.settimeout(None)
+        self._splitter = JsonMessageSplitter()
+        self._messages = []
+
+    def _disconnect(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+    def _write(self, data):
+        with self._write_lock:
+            self._socket.sendall(data)
+
+    def _read(self):
+        while not self._messages:
+            data = self._socket.recv(self.read_size)
+            if not data:
+                raise ConnectionError(f"IPC socket {self.path} closed by the node")
+            self._messages.extend(self._splitter.feed(data))
+        return self._messages.pop(0)
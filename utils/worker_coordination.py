@@ -0,0 +1,94 @@
+"""
+Coordination of pytest-xdist workers sending from the same account.
+
+Every worker is a separate process with its own client and TransactionSender, so local nonce
+allocation alone would hand out the same nonces in every worker. The workers share state through
+small files in a directory of the test run instead, guarded by an exclusive fcntl lock:
+
+- `<address>.nonce` holds the next free nonce of an account, SharedNonceManager reserves
+  nonces by reading and advancing it under the lock
+- run_once() stores the JSON result of session setup (e.g. the chain artifacts) that only the
+  first worker needs to do, the others read it back
+"""
+import fcntl
+import json
+import os
+from pathlib import Path
+
+from utils.nonce_manager import NonceManager
+
+
+def worker_id():
+    """Name of the xdist worker of this process ("gw0", ...), None when not running under xdist"""
+    return os.environ.get("PYTEST_XDIST_WORKER")
+
+
+class FileLock:
+    """Exclusive lock on `path` shared by all processes of the machine, blocks until acquired"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class SharedNonceManager(NonceManager):
+    """
+    NonceManager whose next nonce lives in `state_dir`, so every process using the same
+    directory gets its own nonces of `address`. Costs a locked read and write of a small file per
+    allocate() instead of an eth_getTransactionCount; the node is asked only by the first process
+    and after resync().
+    """
+
+    def __init__(self, client, address, state_dir, start=None):
+        super().__init__(client, address, start)
+        self.state_path = Path(state_dir) / f"{address.lower()}.nonce"
+        self.lock_path = Path(state_dir) / f"{address.lower()}.nonce.lock"
+
+    def allocate(self, count=1):
+        with self._lock, FileLock(self.lock_path):
+            nonce = self._read()
+            if nonce is None:
+                nonce = self._next if self._next is not None else self._pending_count()
+                self._next = None
+            self._write(nonce + count)
+            return nonce
+
+    def resync(self):
+        # the other processes start again from the node's pending count as well
+        with self._lock, FileLock(self.lock_path):
+            self._write(None)
+            self.resyncs += 1
+
+    def _read(self):
+        try:
+            return json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return None
+
+    def _write(self, nonce):
+        self.state_path.write_text(json.dumps(nonce))
+
+
+def run_once(path, produce):
+    """
+    Result of `produce()` stored as JSON at `path` by the first process getting there, the
+    others wait for it and read it back instead of calling `produce`.
+    """
+    path = Path(path)
+    with FileLock(f"{path}.lock"):
+        if path.exists():
+            return json.loads(path.read_text())
+        value = produce()
+        path.write_text(json.dumps(value))
+        return value